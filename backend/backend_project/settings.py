@@ -20,7 +20,8 @@ ALLOWED_HOSTS = ['*']  # Allow all hosts for local development
 
 # Application definition
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # django.contrib.admin, serving shop.sites.CustomAdminSite
+    'shop.apps.ShopAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # for frontend-backend connection
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',  # static files, precompressed at collectstatic
+    'shop.middleware.CompressionMiddleware',  # gzip / brotli for large responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -71,6 +74,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # a file rather than shared-cache memory, so tests that write from several
+        # threads see SQLite's normal locking (busy timeout) instead of immediate errors
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -91,6 +97,9 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# ModelBackend plus email login (shop/backends.py), used by /api/token-auth-email/
+AUTHENTICATION_BACKENDS = ['shop.backends.EmailBackend']
+
 
 # Internationalization
 LANGUAGE_CODE = 'en-us'
@@ -107,6 +116,17 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+# collectstatic also writes .gz / .br variants next to each file; WhiteNoise serves
+# the smallest one the client accepts
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedStaticFilesStorage'},
+}
+# the frontend build puts a content hash in asset names (main.f702b12c.js,
+# 977.7a7b0c82.chunk.js); those are cached for a year as immutable
+WHITENOISE_IMMUTABLE_FILE_TEST = r'\.[0-9a-f]{8,}\.'
+# favicon.ico, manifest.json, logo*.png live at the site root in the build
+WHITENOISE_ROOT = BASE_DIR / 'static'
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -121,8 +141,22 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    # orjson-backed (stdlib fallback); Decimals are rendered as exact strings
+    'DEFAULT_RENDERER_CLASSES': [
+        'shop.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shop.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Responses smaller than this are sent uncompressed (shop.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 4
+
 # CORS setup — allow frontend (React) to connect
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -131,4 +165,61 @@ from corsheaders.defaults import default_headers
 # Ensure Authorization header is allowed through CORS so the frontend can send tokens
 CORS_ALLOW_HEADERS = list(default_headers) + [
     'authorization',
+    'idempotency-key',
 ]
+
+# Financial year used by invoice archival (shop/archive.py); 4 = April to March
+FINANCIAL_YEAR_START_MONTH = 4
+
+# Outbox webhook delivery (`python manage.py deliver_outbox`, see shop/outbox.py)
+OUTBOX_WEBHOOK_URLS = []
+OUTBOX_WEBHOOK_SECRET = ''  # when set, batches carry an HMAC-SHA256 X-Outbox-Signature header
+OUTBOX_RETRY_BASE_SECONDS = 2
+OUTBOX_RETRY_MAX_SECONDS = 600
+OUTBOX_RETENTION_DAYS = 7  # delivered events are deleted after this; /api/events/ consumers must keep up
+
+# Live dashboard stream (/api/live/dashboard/, see shop/live.py). Swap the broker
+# for a pub/sub-backed class when running more than one server process.
+LIVE_BROKER = 'shop.live.InProcessBroker'
+LIVE_HEARTBEAT_SECONDS = 15
+
+# Background report jobs (shop/jobs.py): result files, worker processes and how long a
+# result for a range that includes today is reused for identical requests
+REPORTS_DIR = BASE_DIR / 'reports'
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_FRESH_SECONDS = 300
+# /api/reports/pivot/ results are cached per query and data scope for this long
+PIVOT_CACHE_SECONDS = 60
+# /api/dashboard/ (shop/dashboard.py) is cached per data scope for this long;
+# products at or below the threshold are listed as low stock
+DASHBOARD_CACHE_SECONDS = 30
+LOW_STOCK_THRESHOLD = 10
+
+# Column-file analytics snapshots (shop/columnar.py, manage.py analytics_snapshot);
+# invoices younger than the lag are left for the next run
+ANALYTICS_DIR = BASE_DIR / 'analytics'
+ANALYTICS_SNAPSHOT_LAG_SECONDS = 60
+
+# Demand forecasts (shop/forecast.py, manage.py forecast_demand) are fitted on this
+# many days of invoice history
+FORECAST_HISTORY_DAYS = 3 * 365
+
+# Idempotency-Key on POST /api/invoices/ (shop/idempotency.py): how long a key is
+# remembered and how long a retry waits for the in-flight original
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_WAIT_SECONDS = 10
+
+# Invoice tax rounding (shop/money.py): 'line' rounds each line's tax to the
+# minor unit and sums them; 'invoice' rounds the summed tax once
+INVOICE_TAX_ROUNDING = 'line'
+
+# Invoice creations from all request threads are committed in batches by one writer
+# thread (shop/writer.py): the writer waits up to the window for more invoices to share
+# a transaction. Meant for SQLite, where concurrent write transactions serialize anyway.
+INVOICE_WRITE_QUEUE = False
+INVOICE_WRITE_QUEUE_WINDOW_MS = 2
+INVOICE_WRITE_QUEUE_MAX_BATCH = 64
+
+# Admin changelists (shop/admin.py) count matching rows exactly up to this many;
+# an unfiltered list of a bigger table shows the planner's row estimate instead
+ADMIN_EXACT_COUNT_LIMIT = 10000
@@ -0,0 +1,85 @@
+"""Serving the built React app (backend/static/index.html) for non-API routes.
+
+index.html is read once and kept in memory together with its gzip and brotli
+variants; every request only stat()s the file and reloads it when its mtime or
+size changed (a new frontend build). Responses carry an ETag and
+`Cache-Control: no-cache`, so browsers revalidate the page cheaply (304) and
+always pick up the asset names of the latest build. The assets themselves are
+content-hashed by the build and served by WhiteNoise with immutable caching
+(see the WHITENOISE_* settings).
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.cache import patch_vary_headers
+
+from shop.middleware import accepted_encodings, brotli
+
+
+class IndexFile:
+    """An HTML file cached in memory with precompressed variants."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._variants = {}
+
+    def _load(self, stamp):
+        with open(self.path, 'rb') as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        variants = {None: (body, f'"{digest}"')}
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzipped) < len(body):
+            variants['gzip'] = (gzipped, f'"{digest}-gzip"')
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                variants['br'] = (compressed, f'"{digest}-br"')
+        self._variants, self._stamp = variants, stamp
+
+    def variants(self):
+        """{encoding or None: (bytes, etag)}; raises FileNotFoundError."""
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._load(stamp)
+        return self._variants
+
+
+index_file = IndexFile(os.path.join(settings.BASE_DIR, 'static', 'index.html'))
+
+
+def spa_index(request, path=None):
+    """Serve the built SPA index.html (from backend/static/index.html).
+    This allows the React app to be hosted under Django and supports client-side routing.
+    """
+    try:
+        variants = index_file.variants()
+    except FileNotFoundError:
+        return HttpResponseNotFound('<h1>Index not found</h1><p>Build the frontend and place it in backend/static/</p>')
+
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = next((e for e in ('br', 'gzip') if e in variants and e in accepted), None)
+    body, etag = variants[encoding]
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(body if request.method != 'HEAD' else b'', content_type='text/html; charset=utf-8')
+        response.headers['Content-Length'] = str(len(body))
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = etag
+    # always revalidate: the page names the current build's hashed assets
+    response.headers['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -16,22 +16,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.http import HttpResponse, HttpResponseNotFound
-from django.conf import settings
-import os
 from rest_framework.authtoken.views import obtain_auth_token
 
-
-def spa_index(request):
-    """Serve the built SPA index.html (from backend/static/index.html).
-    This allows the React app to be hosted under Django and supports client-side routing.
-    """
-    try:
-        index_path = os.path.join(settings.BASE_DIR, 'static', 'index.html')
-        with open(index_path, 'r', encoding='utf-8') as f:
-            return HttpResponse(f.read())
-    except FileNotFoundError:
-        return HttpResponseNotFound('<h1>Index not found</h1><p>Build the frontend and place it in backend/static/</p>')
+from .spa import spa_index
 
 
 urlpatterns = [
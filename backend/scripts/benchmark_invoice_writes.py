@@ -0,0 +1,108 @@
+# Sustained invoice creations per second through POST /api/invoices/ from
+# CLIENTS concurrent clients, with and without the group-commit writer
+# (settings.INVOICE_WRITE_QUEUE, see shop/writer.py).
+# Run with: python manage.py shell < scripts/benchmark_invoice_writes.py
+# Invoices are really committed (the commit is what is measured); everything the
+# benchmark created is deleted at the end and today's sketch (shop/sketches.py) is
+# rebuilt without it.
+import logging
+import random
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import override_settings
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from shop import sketches
+from shop.models import Customer, Invoice, OutboxEvent, Product, ProductTombstone
+
+CLIENTS = 64
+DURATION = 10  # seconds per mode
+PRODUCTS = 200
+
+User = get_user_model()
+
+
+def seed():
+    user = User.objects.create_user('bench-writes', 'bench-writes@example.com', 'bench-writes', is_staff=True)
+    Product.objects.bulk_create([
+        Product(name=f'Write bench product {i}', sku=f'WBENCH-{i}', price=10, stock=1000)
+        for i in range(PRODUCTS)
+    ])
+    return user, list(Product.objects.filter(sku__startswith='WBENCH-').values_list('id', flat=True))
+
+
+def client_loop(user, product_ids, stop, counts, latencies):
+    client = APIClient()
+    client.force_authenticate(user)
+    created = failed = 0
+    try:
+        while not stop.is_set():
+            body = {
+                'customer_name': 'Write bench',
+                'customer_email': 'write-bench@example.com',
+                'items': [{'product': str(pid), 'quantity': random.randint(1, 5), 'price': '10.00'}
+                          for pid in random.sample(product_ids, 3)],
+            }
+            start = time.perf_counter()
+            try:
+                ok = client.post('/api/invoices/', body, format='json').status_code == 201
+            except Exception:
+                # e.g. OperationalError: database is locked
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if ok:
+                created += 1
+            else:
+                failed += 1
+    finally:
+        connection.close()
+        counts.append((created, failed))
+
+
+def measure(user, product_ids, queue_on):
+    stop = threading.Event()
+    counts, latencies = [], []
+    with override_settings(INVOICE_WRITE_QUEUE=queue_on):
+        threads = [threading.Thread(target=client_loop, args=(user, product_ids, stop, counts, latencies))
+                   for _ in range(CLIENTS)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(DURATION)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+    created = sum(c for c, _ in counts)
+    failed = sum(f for _, f in counts)
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f'queue {"on " if queue_on else "off"}: {created / elapsed:7.1f} invoices/s, {failed} failed, '
+          f'p50 {p50:.0f} ms, p99 {p99:.0f} ms ({CLIENTS} clients, {elapsed:.1f}s)')
+
+
+# failed requests are counted, not logged with a traceback each
+logging.getLogger('django.request').setLevel(logging.CRITICAL)
+user, product_ids = seed()
+try:
+    print(f'{connection.vendor} database {connection.settings_dict["NAME"]}')
+    measure(user, product_ids, queue_on=False)
+    measure(user, product_ids, queue_on=True)
+finally:
+    invoices = Invoice.objects.filter(created_by=user)
+    OutboxEvent.objects.filter(topic='invoice.created',
+                               object_id__in=invoices.annotate(key=Cast('id', CharField())).values('key')).delete()
+    invoices.delete()
+    Customer.objects.filter(email='write-bench@example.com').delete()
+    Product.objects.filter(sku__startswith='WBENCH-').delete()
+    ProductTombstone.objects.filter(sku__startswith='WBENCH-').delete()
+    user.delete()
+    # sketches do not follow deletions
+    sketches.rebuild(timezone.localdate(), timezone.localdate())
@@ -0,0 +1,85 @@
+# Compares DRF's stock JSONRenderer with shop.renderers.FastJSONRenderer on
+# /api/products/ and /api/reports/sales/.
+# Run with: python manage.py shell < scripts/benchmark_json.py
+# Sample data is created inside a transaction that is rolled back at the end.
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.test import APIClient
+
+from shop import views
+from shop.models import Product, Invoice, InvoiceItem
+from shop.renderers import FastJSONRenderer
+
+PRODUCTS = 5000
+INVOICES = 3000
+REQUESTS = 20
+
+User = get_user_model()
+
+
+def seed():
+    user = User.objects.create_superuser('bench-json', 'bench-json@example.com', 'bench-json')
+    Product.objects.bulk_create([
+        Product(name=f'Bench product {i}', sku=f'BENCH-{i}', price=Decimal(random.randint(100, 99999)) / 100,
+                stock=random.randint(0, 500), hs_code='8471')
+        for i in range(PRODUCTS)
+    ])
+    products = list(Product.objects.filter(sku__startswith='BENCH-'))
+    invoices = Invoice.objects.bulk_create([
+        Invoice(invoice_no=f'BENCH-INV-{i}', created_by=user, total=0) for i in range(INVOICES)
+    ])
+    items = []
+    for inv in invoices:
+        for p in random.sample(products, 3):
+            qty = random.randint(1, 5)
+            items.append(InvoiceItem(invoice=inv, product=p, quantity=qty, price=p.price, line_total=p.price * qty))
+    InvoiceItem.objects.bulk_create(items, batch_size=1000)
+    return user
+
+
+def measure(client, path):
+    client.get(path)  # warm up
+    start = time.perf_counter()
+    size = 0
+    for _ in range(REQUESTS):
+        size = len(client.get(path).content)
+    elapsed = time.perf_counter() - start
+    return REQUESTS / elapsed, size
+
+
+def use_renderer(renderer):
+    classes = [renderer, BrowsableAPIRenderer]
+    views.ProductViewSet.renderer_classes = classes
+    views.sales_report.cls.renderer_classes = classes
+
+
+with transaction.atomic():
+    user = seed()
+    client = APIClient()
+    client.force_authenticate(user)
+    original = (views.ProductViewSet.renderer_classes, views.sales_report.cls.renderer_classes)
+    try:
+        for path in ['/api/products/', '/api/reports/sales/']:
+            results = {}
+            for name, renderer in [('JSONRenderer', JSONRenderer), ('FastJSONRenderer', FastJSONRenderer)]:
+                use_renderer(renderer)
+                results[name] = measure(client, path)
+            before, after = results['JSONRenderer'], results['FastJSONRenderer']
+            print(f'{path}: {before[0]:.1f} -> {after[0]:.1f} req/s '
+                  f'({after[0] / before[0]:.2f}x, {before[1]} -> {after[1]} bytes)')
+
+        # rendering alone, on the product list payload
+        data = views.ProductSerializer(Product.objects.all(), many=True).data
+        for name, renderer in [('JSONRenderer', JSONRenderer()), ('FastJSONRenderer', FastJSONRenderer())]:
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                renderer.render(data)
+            print(f'render {len(data)} products with {name}: {(time.perf_counter() - start) / REQUESTS * 1000:.1f} ms')
+    finally:
+        views.ProductViewSet.renderer_classes, views.sales_report.cls.renderer_classes = original
+        transaction.set_rollback(True)
@@ -0,0 +1,67 @@
+# Times shop.pricing.preview and apply on a PRODUCTS-sized catalog, and checks that
+# the prices apply() writes are the ones preview() predicted.
+# Run with: python manage.py shell < scripts/benchmark_repricing.py
+# Products are topped up to PRODUCTS with synthetic ones inside a transaction that
+# is rolled back at the end, together with the repricing itself.
+import datetime
+import random
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection, transaction
+
+from shop import pricing
+from shop.models import PriceList, PriceRule, Product
+
+PRODUCTS = 500000
+HS_CODES = ['8471.30', '8471.50', '0901.11', '6109.10', '8517.12', None]
+
+
+def seed():
+    missing = PRODUCTS - Product.objects.count()
+    for start in range(0, max(missing, 0), 10000):
+        Product.objects.bulk_create([
+            Product(name=f'Reprice bench {i}', sku=f'{random.choice("ABCDEF")}RB-{i}',
+                    price=Decimal(random.randint(50, 999999)) / 100, stock=10, hs_code=random.choice(HS_CODES))
+            for i in range(start, min(start + 10000, missing))
+        ], batch_size=2000)
+    price_list = PriceList.objects.create(name='Reprice bench', effective_from=datetime.date.today())
+    PriceRule.objects.bulk_create([
+        PriceRule(price_list=price_list, position=0, kind=PriceRule.AMOUNT, value=Decimal('-5.00'),
+                  product_ids=random.sample(list(Product.objects.values_list('id', flat=True)[:50000]), 500)),
+        PriceRule(price_list=price_list, position=1, kind=PriceRule.PERCENT, value=Decimal('7.50'), sku_prefix='ARB'),
+        PriceRule(price_list=price_list, position=2, kind=PriceRule.PERCENT, value=Decimal('-3.25'), hs_prefix='8471'),
+        PriceRule(price_list=price_list, position=3, kind=PriceRule.PERCENT, value=Decimal('2.00')),
+    ])
+    return price_list
+
+
+def minor_prices():
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, {pricing._minor_sql()}, revision FROM shop_product ORDER BY id')
+        return np.array(cursor.fetchall(), np.int64).reshape(-1, 3)
+
+
+with transaction.atomic():
+    try:
+        price_list = seed()
+        print(f'{connection.vendor} database, {Product.objects.count()} products')
+
+        start = time.perf_counter()
+        preview = pricing.preview(price_list, limit=0)
+        print(f'preview: {time.perf_counter() - start:.2f}s, {preview["products_changed"]} prices would change')
+
+        rules = list(price_list.rules.all())
+        ids, prices, skus, hs_codes = pricing._load_catalog(True)
+        _, expected = pricing.new_prices(rules, ids, prices, skus, hs_codes)
+
+        start = time.perf_counter()
+        changed = pricing.apply(price_list)
+        print(f'apply: {time.perf_counter() - start:.2f}s, {changed} prices changed')
+
+        after = minor_prices()
+        print(f'prices as previewed: {bool((after[:, 1] == expected).all())}, '
+              f'revisions unique: {len(np.unique(after[:, 2])) == len(after)}')
+    finally:
+        transaction.set_rollback(True)
@@ -1,41 +1,315 @@
-from django.contrib import admin
-from django.contrib.admin import AdminSite
-from .forms import CustomAdminLoginForm
+import datetime
 
-from .models import Product, Invoice, InvoiceItem, StockAdjustment, UserProfile
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-class CustomAdminSite(AdminSite):
-    login_form = CustomAdminLoginForm
-    site_header = "TradeTrack"
-    site_title = "TradeTrack Admin Portal"
-    index_title = "Welcome to TradeTrack Management"
+from . import pricing
+from .models import Product, Invoice, InvoiceItem, StockAdjustment, UserProfile, Customer, ArchivedYear, ReportJob, IdempotencyKey, DutyRule, TaxRule, DemandForecast, PriceList, PriceRule, PriceHistory, normalize_email, normalize_name, normalize_phone
 
-# Replace default admin with your custom admin site
-admin.site = CustomAdminSite()
+def estimated_row_count(model, using='default'):
+    """Row count from the database's statistics, without scanning the table; None if unavailable."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # sqlite_stat1 exists once ANALYZE has run; its first figure is the row count
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s AND idx IS NULL', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+            # otherwise the id span, read from both ends of the primary key
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            cursor.execute(f'SELECT MIN({pk}), MAX({pk}) FROM {connection.ops.quote_name(table)}')
+            low, high = cursor.fetchone()
+            return 0 if low is None else high - low + 1
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Changelist paginator that never runs COUNT(*) over a whole large table.
+
+    Unfiltered lists use the table's estimated row count once it is above
+    ADMIN_EXACT_COUNT_LIMIT; filtered lists count at most that many rows, so
+    paging stops there and the filters have to be narrowed to see further.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10000)
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = estimated_row_count(qs.model, qs.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return qs.order_by()[:limit].count()
+
+
+class IndexedSearchMixin:
+    """Search that turns each term into index lookups instead of LIKE '%term%'.
+
+    `search_fields` entries must be prefixed: '=field' is an exact match and
+    '^field' a prefix match written as a range (as in the API's typeahead);
+    both are case-sensitive, so `search_normalizers` maps a field to the
+    function that normalizes stored values (and hence the term) for it.
+    """
+    search_normalizers = {}
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        q = Q()
+        for entry in self.search_fields:
+            kind, field = entry[0], entry[1:]
+            value = self.search_normalizers.get(field, str)(term)
+            if not value:
+                continue
+            if kind == '=':
+                q |= Q(**{field: value})
+            elif kind == '^':
+                q |= Q(**{f'{field}__gte': value, f'{field}__lt': value + '\uffff'})
+        if not q:
+            return queryset.none(), False
+        return queryset.filter(q), False
+
+
+class DateHierarchyQuerySet(QuerySet):
+    """QuerySet whose datetimes() lists every year / month / day between the first
+    and last value instead of running SELECT DISTINCT over the matching rows.
+
+    The admin's date_hierarchy calls datetimes() on the changelist queryset; Min
+    and Max are two index lookups, at the price of also offering empty periods.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        tz = tzinfo or timezone.get_current_timezone()
+        first = timezone.localtime(bounds['first'], tz).replace(tzinfo=None)
+        last = timezone.localtime(bounds['last'], tz).replace(tzinfo=None)
+        if kind == 'year':
+            starts = [datetime.datetime(y, 1, 1) for y in range(first.year, last.year + 1)]
+        elif kind == 'month':
+            months = range(first.year * 12 + first.month - 1, last.year * 12 + last.month)
+            starts = [datetime.datetime(m // 12, m % 12 + 1, 1) for m in months]
+        else:
+            day, starts = datetime.datetime.combine(first.date(), datetime.time.min), []
+            while day <= last:
+                starts.append(day)
+                day += datetime.timedelta(days=1)
+        values = [timezone.make_aware(start, tz) for start in starts]
+        return values if order == 'ASC' else values[::-1]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Defaults for tables with millions of rows: estimated counts, no second full
+    count, and a date_hierarchy that does not scan the table.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return DateHierarchyQuerySet(model=qs.model, query=qs.query.chain(), using=qs._db)
 
 
 # Register models for management convenience
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'sku', 'price', 'stock', 'created_at')
+    # also backs the product autocomplete on invoice lines and stock adjustments
+    search_fields = ('=sku', '^name')
+    ordering = ('name',)
+
+    def save_model(self, request, obj, form, change):
+        if change and 'price' in form.changed_data:
+            old_price = form.initial['price']
+            # set by hand: no longer the price list's price
+            obj.price_list = None
+            super().save_model(request, obj, form, change)
+            pricing.record_edit(obj, old_price, request.user)
+        else:
+            super().save_model(request, obj, form, change)
+
+
+@admin.register(Customer)
+class CustomerAdmin(IndexedSearchMixin, LargeTableAdmin):
+    list_display = ('id', 'name', 'email', 'phone', 'created_at')
+    search_fields = ('=email', '=phone', '^name_key')
+    search_normalizers = {'email': normalize_email, 'phone': normalize_phone, 'name_key': normalize_name}
+    ordering = ('name_key',)
+
+
+class InvoiceItemInline(admin.TabularInline):
+    """Lines of an invoice, read-only: the invoice totals are computed from them at creation."""
+    model = InvoiceItem
+    fields = ('product', 'quantity', 'price', 'line_total', 'tax_percent', 'tax_amount')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ('invoice_no', 'created_by', 'date', 'total', 'status')
+class InvoiceAdmin(IndexedSearchMixin, LargeTableAdmin):
+    list_display = ('invoice_no', 'created_by', 'customer', 'date', 'total', 'status')
+    list_select_related = ('created_by', 'customer')
+    search_fields = ('=invoice_no',)
+    search_normalizers = {'invoice_no': lambda v: v.upper()}
+    date_hierarchy = 'date'
+    autocomplete_fields = ('customer',)
+    raw_id_fields = ('created_by',)
+    inlines = (InvoiceItemInline,)
 
 
 @admin.register(InvoiceItem)
-class InvoiceItemAdmin(admin.ModelAdmin):
+class InvoiceItemAdmin(IndexedSearchMixin, LargeTableAdmin):
     list_display = ('invoice', 'product', 'quantity', 'price', 'line_total')
+    list_select_related = ('invoice', 'product')
+    search_fields = ('=invoice__invoice_no',)
+    search_normalizers = {'invoice__invoice_no': lambda v: v.upper()}
+    autocomplete_fields = ('product',)
+    raw_id_fields = ('invoice',)
 
 
 @admin.register(StockAdjustment)
-class StockAdjustmentAdmin(admin.ModelAdmin):
+class StockAdjustmentAdmin(IndexedSearchMixin, LargeTableAdmin):
     list_display = ('product', 'change', 'reason', 'created_by', 'created_at')
+    list_select_related = ('product', 'created_by')
+    search_fields = ('=product__sku',)
+    date_hierarchy = 'created_at'
+    autocomplete_fields = ('product',)
+    raw_id_fields = ('created_by',)
+
+    # the ledger is append-only and each row moves Product.stock, which happens in
+    # the API (POST /api/stock-adjustments/ and its bulk action); here it is read-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedYear)
+class ArchivedYearAdmin(admin.ModelAdmin):
+    list_display = ('financial_year', 'start', 'end', 'invoice_count', 'completed', 'archived_at')
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'created_by', 'created_at', 'finished_at')
+    list_select_related = ('created_by',)
+    list_filter = ('status', 'kind')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(LargeTableAdmin):
+    list_display = ('key', 'scope', 'status_code', 'created_at', 'completed_at', 'expires_at')
+    search_fields = ('=key',)
+
+
+@admin.register(DutyRule, TaxRule)
+class HSRuleAdmin(admin.ModelAdmin):
+    list_display = ('hs_prefix', 'country', 'rate', 'effective_from', 'effective_to', 'description')
+    list_filter = ('country',)
+    search_fields = ('^hs_prefix', 'description')
+
+
+class PriceRuleInline(admin.TabularInline):
+    model = PriceRule
+    fields = ('position', 'kind', 'value', 'sku_prefix', 'hs_prefix', 'product_ids')
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return obj is None or obj.applied_at is None
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None or obj.applied_at is None
+
+    def has_delete_permission(self, request, obj=None):
+        return obj is None or obj.applied_at is None
+
+
+@admin.register(PriceList)
+class PriceListAdmin(admin.ModelAdmin):
+    list_display = ('name', 'effective_from', 'applied_at', 'applied_by', 'products_changed')
+    list_select_related = ('applied_by',)
+    readonly_fields = ('applied_at', 'applied_by', 'products_changed')
+    search_fields = ('name',)
+    inlines = (PriceRuleInline,)
+    actions = ('apply_price_lists',)
+
+    def has_change_permission(self, request, obj=None):
+        return super().has_change_permission(request, obj) and (obj is None or obj.applied_at is None)
+
+    def has_delete_permission(self, request, obj=None):
+        return super().has_delete_permission(request, obj) and (obj is None or obj.applied_at is None)
+
+    @admin.action(description='Apply selected price lists now')
+    def apply_price_lists(self, request, queryset):
+        for price_list in queryset.order_by('effective_from', 'id'):
+            try:
+                changed = pricing.apply(price_list, user=request.user, force=True)
+            except pricing.PricingError as e:
+                self.message_user(request, str(e), messages.ERROR)
+            else:
+                self.message_user(request, f'{price_list}: {changed} prices changed.', messages.SUCCESS)
+
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(IndexedSearchMixin, LargeTableAdmin):
+    list_display = ('product', 'old_price', 'new_price', 'price_list', 'changed_by', 'changed_at')
+    list_select_related = ('product', 'price_list', 'changed_by')
+    search_fields = ('=product__sku',)
+    date_hierarchy = 'changed_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DemandForecast)
+class DemandForecastAdmin(IndexedSearchMixin, LargeTableAdmin):
+    # rows are replaced by `manage.py forecast_demand`; nothing to edit here
+    list_display = ('product', 'method', 'demand_30', 'demand_60', 'demand_90', 'backtest_mae', 'as_of')
+    list_select_related = ('product',)
+    list_filter = ('method',)
+    search_fields = ('=product__sku',)
+    ordering = ('-demand_30',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'can_generate_invoice', 'can_view_reports')
+    list_select_related = ('user',)
     list_editable = ('can_generate_invoice', 'can_view_reports')
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.contrib.admin import apps as admin_apps
 
 
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+
+class ShopAdminConfig(admin_apps.AdminConfig):
+    # django.contrib.admin with our site as the one every admin.register()
+    # (ours, auth's, authtoken's) registers on
+    default = False
+    default_site = 'shop.sites.CustomAdminSite'
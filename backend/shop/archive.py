@@ -0,0 +1,130 @@
+"""Archival of closed financial years.
+
+Invoices (and their lines) from a closed financial year are moved in batches
+from shop_invoice / shop_invoiceitem into shop_archivedinvoice /
+shop_archivedinvoiceitem, so the hot tables only hold recent business.
+
+Readers call `sources(start, end)` to get the (invoice model, item model)
+pairs that a date range touches; the archive pair is only returned when the
+range overlaps an archived year, so day-to-day queries never read it. Lists
+that span both merge them with newest_first().
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem, ArchivedYear, ArchivedInvoice, ArchivedInvoiceItem
+
+HOT = (Invoice, InvoiceItem)
+ARCHIVE = (ArchivedInvoice, ArchivedInvoiceItem)
+
+
+def fy_start_month():
+    # Indian financial year (April - March) unless configured otherwise
+    return getattr(settings, 'FINANCIAL_YEAR_START_MONTH', 4)
+
+
+def financial_year_of(day):
+    """Financial year (named by its starting calendar year) that `day` falls in."""
+    return day.year if day.month >= fy_start_month() else day.year - 1
+
+
+def current_financial_year():
+    return financial_year_of(timezone.localdate())
+
+
+def financial_year_bounds(fy):
+    """Aware [start, end) datetimes of financial year `fy` in the project time zone."""
+    month = fy_start_month()
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.datetime(fy, month, 1), tz)
+    end = timezone.make_aware(datetime.datetime(fy + 1, month, 1), tz)
+    return start, end
+
+
+def range_needs_archive(start_date=None, end_date=None):
+    """True when the inclusive date range [start_date, end_date] overlaps an archived year."""
+    qs = ArchivedYear.objects.all()
+    if start_date:
+        qs = qs.filter(end__gt=timezone.make_aware(
+            datetime.datetime.combine(start_date, datetime.time.min), timezone.get_current_timezone()))
+    if end_date:
+        qs = qs.filter(start__lt=timezone.make_aware(
+            datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min),
+            timezone.get_current_timezone()))
+    return qs.exists()
+
+
+def sources(start_date=None, end_date=None):
+    """(invoice model, item model) pairs to query for a date range, hot tables first."""
+    if range_needs_archive(start_date, end_date):
+        return [HOT, ARCHIVE]
+    return [HOT]
+
+
+def newest_first(querysets, limit=None, before=None):
+    """Invoices of several querysets (one per table pair of sources()) merged newest first.
+
+    Rows are ordered by (date, id) descending, as the invoice list is;
+    `before` is the (date, id) of the last row of the previous page. Each
+    table contributes at most `limit` rows, so a page costs one indexed
+    query per table however many invoices there are.
+    """
+    rows = []
+    for qs in querysets:
+        if before is not None:
+            qs = qs.filter(Q(date__lt=before[0]) | Q(date=before[0], id__lt=before[1]))
+        qs = qs.order_by('-date', '-id')
+        rows.extend(qs[:limit] if limit is not None else qs)
+    rows.sort(key=lambda row: (row.date, row.id), reverse=True)
+    return rows[:limit] if limit is not None else rows
+
+
+def _copy(source_qs, target_model, **extra):
+    # copy every column the archive model shares with the hot model
+    names = [f.attname for f in target_model._meta.concrete_fields if f.attname not in extra]
+    target_model.objects.bulk_create(
+        [target_model(**row, **extra) for row in source_qs.values(*names)]
+    )
+
+
+def archive_financial_year(fy, batch_size=1000, stdout=None):
+    """Move all invoices of closed financial year `fy` into the archive tables.
+
+    Each batch is copied and deleted in its own transaction, so the command can
+    be interrupted and re-run; it resumes with whatever is still in the hot table.
+    Returns the number of invoices moved.
+    """
+    if fy >= current_financial_year():
+        raise ValueError(f"Financial year {fy} is not closed yet.")
+
+    start, end = financial_year_bounds(fy)
+    hot = Invoice.objects.filter(date__gte=start, date__lt=end)
+    if not hot.exists() and not ArchivedYear.objects.filter(financial_year=fy).exists():
+        return 0
+    # registered before the first batch so readers look in the archive while we move
+    year, _ = ArchivedYear.objects.get_or_create(financial_year=fy, defaults={'start': start, 'end': end})
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                hot.order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            _copy(Invoice.objects.filter(id__in=ids), ArchivedInvoice, financial_year=fy)
+            _copy(InvoiceItem.objects.filter(invoice_id__in=ids), ArchivedInvoiceItem)
+            InvoiceItem.objects.filter(invoice_id__in=ids).delete()
+            Invoice.objects.filter(id__in=ids).delete()
+        moved += len(ids)
+        if stdout:
+            stdout.write(f"FY {fy}: moved {moved} invoices")
+
+    year.invoice_count = ArchivedInvoice.objects.filter(financial_year=fy).count()
+    year.completed = True
+    year.save()
+    return moved
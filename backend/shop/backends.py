@@ -0,0 +1,66 @@
+"""Email login for django.contrib.auth users.
+
+User emails are unique case-insensitively: migration 0014 puts a unique
+index on LOWER(email) (blank emails excluded), so a login is one indexed
+lookup on the lowercased address however many users there are. Queries
+must compare the same expression, and repeat the `email <> ''` condition,
+for the database to use that partial index; users_by_email() does both.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import verify_password
+from django.db.models.functions import Lower
+
+User = get_user_model()
+
+
+def normalize_login_email(value):
+    return (value or '').strip().lower()
+
+
+def users_by_email(email):
+    """Users whose email equals `email` ignoring case (at most one)."""
+    return User.objects.alias(email_key=Lower('email')).filter(email_key=normalize_login_email(email)).exclude(email='')
+
+
+class EmailBackend(ModelBackend):
+    """ModelBackend that also accepts `authenticate(email=..., password=...)`.
+
+    Without `email` it behaves exactly like ModelBackend (username login).
+    aauthenticate() runs the password hasher in a worker thread that is not
+    the one shared by sync views, so an async login neither blocks the event
+    loop nor queues the site's sync requests behind a deliberately slow hash.
+    """
+
+    def authenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if email is None:
+            return super().authenticate(request, username=username, password=password, **kwargs)
+        if not email or password is None:
+            return None
+        user = users_by_email(email).first()
+        if user is None:
+            # hash anyway so unknown addresses take as long as wrong passwords
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, email=None, **kwargs):
+        if email is None:
+            return await sync_to_async(self.authenticate)(request, username=username, password=password, **kwargs)
+        if not email or password is None:
+            return None
+        user = await users_by_email(email).afirst()
+        if user is None:
+            await sync_to_async(User().set_password, thread_sensitive=False)(password)
+            return None
+        is_correct, must_update = await sync_to_async(verify_password, thread_sensitive=False)(password, user.password)
+        if not is_correct or not self.user_can_authenticate(user):
+            return None
+        if must_update:
+            # stored with an outdated hasher or iteration count: rehash and save
+            await sync_to_async(user.set_password, thread_sensitive=False)(password)
+            await user.asave(update_fields=['password'])
+        return user
@@ -0,0 +1,298 @@
+"""Streaming NDJSON backup and restore of the shop data (`manage.py export_data` / `import_data`).
+
+A backup is a directory:
+
+    manifest.json                    tables, their parts and row counts; `complete` once finished
+    <table>/part-000001.ndjson[.gz]  up to PART_ROWS rows, one JSON object per line
+
+Rows keep their primary and foreign keys (as `<field>_id` values), and
+tables are listed parents first, so a restore into an empty database needs
+no key remapping. Export reads each table in primary-key ranges with
+`.iterator()`, up to the highest key present when the export started;
+rows added later are left out with their children. A part is written to a
+temporary file and renamed, then recorded in the manifest, so an
+interrupted export resumes after its last complete part. Import loads each
+part with batched executemany in one transaction and records it in a checkpoint
+file; a resumed import repeats at most the part it was in, ignoring rows it
+already committed. Memory stays bounded by one batch either way.
+
+Users are exported with their password hashes (needed for created_by and
+profiles); group and permission memberships are not.
+"""
+import datetime
+import decimal
+import gzip
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.db.models.constants import OnConflict
+
+from .models import (
+    ArchivedInvoice, ArchivedInvoiceItem, ArchivedYear, CatalogRevision, Customer, DutyRule, Invoice,
+    InvoiceItem, PriceHistory, PriceList, PriceRule, Product, ProductTombstone, StockAdjustment, TaxRule,
+    UserProfile,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+FORMAT = 1
+PART_ROWS = 100000
+BATCH_SIZE = 2000
+# parents before children
+TABLES = [
+    ('users', get_user_model()),
+    ('profiles', UserProfile),
+    ('customers', Customer),
+    ('price_lists', PriceList),
+    ('price_rules', PriceRule),
+    ('products', Product),
+    ('product_tombstones', ProductTombstone),
+    ('price_history', PriceHistory),
+    ('invoices', Invoice),
+    ('invoice_items', InvoiceItem),
+    ('archived_years', ArchivedYear),
+    ('archived_invoices', ArchivedInvoice),
+    ('archived_invoice_items', ArchivedInvoiceItem),
+    ('stock_adjustments', StockAdjustment),
+    ('duty_rules', DutyRule),
+    ('tax_rules', TaxRule),
+]
+
+
+class BackupError(Exception):
+    pass
+
+
+def _default(obj):
+    # exact decimal strings; DecimalField / DateTimeField parse them back on import
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _dumps(row):
+    if orjson is not None:
+        return orjson.dumps(row, default=_default, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(row, default=_default, separators=(',', ':')) + '\n').encode()
+
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return default
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh, indent=1)
+    os.replace(tmp, path)
+
+
+def _columns(model):
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def _say(stdout, message):
+    if stdout is not None:
+        stdout.write(message)
+
+
+def export(root, compress=False, part_rows=PART_ROWS, stdout=None):
+    """Write (or finish writing) a backup into directory `root`; returns rows written this run."""
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = _read_json(root / 'manifest.json')
+    if manifest is None:
+        manifest = {
+            'format': FORMAT,
+            'compress': 'gzip' if compress else None,
+            'complete': False,
+            # later inserts are left for the next backup, children included
+            'tables': {name: {'high_water': model.objects.aggregate(m=Max('pk'))['m'] or 0, 'parts': [], 'done': False}
+                       for name, model in TABLES},
+        }
+        _write_json(root / 'manifest.json', manifest)
+    elif manifest['complete']:
+        raise BackupError(f'{root} already holds a complete backup.')
+    suffix = '.ndjson.gz' if manifest['compress'] else '.ndjson'
+
+    written = 0
+    for name, model in TABLES:
+        table = manifest['tables'][name]
+        if table['done']:
+            continue
+        (root / name).mkdir(exist_ok=True)
+        columns = _columns(model)
+        pk = model._meta.pk.attname
+        after = table['parts'][-1]['last_pk'] if table['parts'] else None
+        while True:
+            qs = model.objects.order_by('pk').filter(pk__lte=table['high_water'])
+            if after is not None:
+                qs = qs.filter(pk__gt=after)
+            part = f'{name}/part-{len(table["parts"]) + 1:06d}{suffix}'
+            fd, tmp = tempfile.mkstemp(dir=root / name, prefix='.tmp-')
+            rows, last = 0, None
+            with os.fdopen(fd, 'wb') as raw:
+                out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) if manifest['compress'] else raw
+                for values in qs.values_list(*columns)[:part_rows].iterator(chunk_size=BATCH_SIZE):
+                    row = dict(zip(columns, values))
+                    out.write(_dumps(row))
+                    rows, last = rows + 1, row[pk]
+                if out is not raw:
+                    out.close()
+            if not rows:
+                os.remove(tmp)
+                break
+            os.replace(tmp, root / part)
+            table['parts'].append({'file': part, 'rows': rows, 'last_pk': last})
+            _write_json(root / 'manifest.json', manifest)
+            written += rows
+            after = last
+            _say(stdout, f'{part}: {rows} rows')
+            if rows < part_rows:
+                break
+        table['done'] = True
+        _write_json(root / 'manifest.json', manifest)
+
+    manifest['complete'] = True
+    _write_json(root / 'manifest.json', manifest)
+    return written
+
+
+def _read_part(path):
+    opener = gzip.open if path.suffix == '.gz' else open
+    with opener(path, 'rb') as fh:
+        for line in fh:
+            if line.strip():
+                yield _loads(line)
+
+
+def import_(root, checkpoint=None, stdout=None):
+    """Load the backup in `root` into this database; returns rows inserted this run.
+
+    `checkpoint` (default root/import-checkpoint.json) records finished parts.
+    Without one the shop tables must be empty.
+    """
+    root = Path(root)
+    manifest = _read_json(root / 'manifest.json')
+    if manifest is None or not manifest.get('complete'):
+        raise BackupError(f'{root} does not hold a complete backup.')
+    if manifest['format'] != FORMAT:
+        raise BackupError(f'Unsupported backup format {manifest["format"]}.')
+    checkpoint = Path(checkpoint) if checkpoint else root / 'import-checkpoint.json'
+    target = f'{connection.vendor}:{connection.settings_dict["NAME"]}'
+    state = _read_json(checkpoint)
+    resuming = state is not None
+    if resuming and state.get('database') != target:
+        raise BackupError(f'{checkpoint} belongs to an import into {state.get("database")}; '
+                          'delete it to start over.')
+    if not resuming:
+        busy = [name for name, model in TABLES if model.objects.exists()]
+        if busy:
+            raise BackupError(f'Target tables are not empty: {", ".join(busy)}.')
+        state = {'database': target, 'parts_done': []}
+    done = set(state['parts_done'])
+
+    inserted = 0
+    for name, model in TABLES:
+        for part in manifest['tables'][name]['parts']:
+            if part['file'] in done:
+                continue
+            with transaction.atomic():
+                # a resumed part may have been committed just before the interruption
+                rows = _load_part(model, root / part['file'], ignore_conflicts=resuming)
+            state['parts_done'].append(part['file'])
+            _write_json(checkpoint, state)
+            resuming = False
+            inserted += rows
+            _say(stdout, f'{part["file"]}: {rows} rows')
+
+    _after_import()
+    return inserted
+
+
+def _load_part(model, path, ignore_conflicts=False):
+    """Insert the rows of one part file; returns how many were read.
+
+    A prepared INSERT run with executemany rather than bulk_create: bulk_create
+    calls pre_save() on every field, which spends most of the time in Python
+    and would stamp auto_now / auto_now_add fields (invoice dates, product
+    timestamps) with the time of the import.
+    """
+    fields = model._meta.concrete_fields
+    conn = connections[DEFAULT_DB_ALIAS]  # the wrapper itself, not the per-call proxy
+    on_conflict = OnConflict.IGNORE if ignore_conflicts else None
+    qn = conn.ops.quote_name
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        conn.ops.insert_statement(on_conflict=on_conflict), qn(model._meta.db_table),
+        ', '.join(qn(f.column) for f in fields), ', '.join(['%s'] * len(fields)),
+        conn.ops.on_conflict_suffix_sql(fields, on_conflict, None, None))
+    # ints, strings and booleans go in as read; other types are parsed and adapted
+    plain = {'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'PositiveIntegerField',
+             'PositiveSmallIntegerField', 'SmallIntegerField', 'CharField', 'TextField', 'BooleanField',
+             'ForeignKey', 'OneToOneField'}
+    prepare = [None if f.get_internal_type() in plain else f for f in fields]
+    names = [f.attname for f in fields]
+
+    def values(row):
+        return [row.get(name) if f is None or row.get(name) is None
+                else f.get_db_prep_save(f.to_python(row[name]), conn)
+                for name, f in zip(names, prepare)]
+
+    rows = 0
+    with conn.cursor() as cursor:
+        batch = []
+        for row in _read_part(path):
+            batch.append(values(row))
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            rows += len(batch)
+    return rows
+
+
+def _after_import():
+    """Move id sequences and the catalog revision counter past the loaded rows."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model for _, model in TABLES])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    # ids of deleted products stay retired: delta-sync clients know them from the tombstones
+    deleted = ProductTombstone.objects.aggregate(m=Max('product_id'))['m'] or 0
+    if deleted > (Product.objects.aggregate(m=Max('pk'))['m'] or 0):
+        _advance_sequence(Product, deleted)
+    latest = max(Product.objects.aggregate(m=Max('revision'))['m'] or 0,
+                 ProductTombstone.objects.aggregate(m=Max('revision'))['m'] or 0)
+    CatalogRevision.objects.update_or_create(pk=1, defaults={'value': latest})
+
+
+def _advance_sequence(model, value):
+    """Make the next id generated for `model` greater than `value`."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [value, table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, %s), %s)", [table, model._meta.pk.column, value])
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {int(value) + 1}')
@@ -0,0 +1,64 @@
+"""Product catalog change feed for offline clients.
+
+Every product write takes the next value of a catalog-wide counter as the
+product's `revision` (Product.save(), touch() for bulk UPDATEs) and every
+delete leaves a ProductTombstone with its own revision. The counter row is
+locked until the writing transaction commits, so revisions become visible
+in increasing order and a client that has seen everything up to revision N
+only needs the upserts and tombstones above N. changes() returns them
+merged in revision order, a page at a time.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from .models import CatalogRevision, Product, ProductTombstone, next_revisions
+
+# rows per CASE statement, as in shop/stock.py
+CHUNK_SIZE = 300
+
+
+def touch(product_ids):
+    """Give each product a new revision and updated_at after a QuerySet.update()
+    or raw UPDATE; call inside the transaction that changed them.
+    """
+    ids = sorted(set(product_ids))
+    if not ids:
+        return
+    last = next_revisions(len(ids))
+    first = last - len(ids) + 1
+    qn = connection.ops.quote_name
+    table = qn(Product._meta.db_table)
+    now = Product._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        for lo in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[lo:lo + CHUNK_SIZE]
+            whens = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            params = [now]
+            for i, pk in enumerate(chunk, start=first + lo):
+                params += [pk, i]
+            params += chunk
+            cursor.execute(
+                f'UPDATE {table} SET {qn("updated_at")} = %s, {qn("revision")} = CASE {qn("id")} {whens} END '
+                f'WHERE {qn("id")} IN ({", ".join(["%s"] * len(chunk))})',
+                params,
+            )
+
+
+def changes(since, limit):
+    """(products, tombstones, next_since, has_more) for revisions above `since`.
+
+    At most `limit` rows in all, the lowest revisions first; pass `next_since`
+    back to continue.
+    """
+    products = list(Product.objects.filter(revision__gt=since).order_by('revision')[:limit + 1])
+    tombstones = list(ProductTombstone.objects.filter(revision__gt=since).order_by('revision')[:limit + 1])
+    merged = sorted(products + tombstones, key=lambda row: row.revision)
+    page = merged[:limit]
+    has_more = len(merged) > limit
+    next_since = page[-1].revision if page else since
+    return ([r for r in page if isinstance(r, Product)], [r for r in page if isinstance(r, ProductTombstone)],
+            next_since, has_more)
+
+
+def current_revision():
+    return CatalogRevision.objects.values_list('value', flat=True).filter(pk=1).first() or 0
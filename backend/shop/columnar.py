@@ -0,0 +1,373 @@
+"""Column-file snapshots of invoices and invoice lines for analytics.
+
+`manage.py analytics_snapshot` copies invoices (hot and archived) into
+ANALYTICS_DIR as one `.npy` file per column, so heavy analysis reads
+memory-mapped arrays instead of querying the database:
+
+    ANALYTICS_DIR/
+      manifest.json              segments, high-water invoice id, time zone
+      products.json users.json   dictionaries: code -> [id, name]
+      statuses.json              code -> status
+      seg-000001/invoices/<column>.npy
+      seg-000001/lines/<column>.npy
+
+Products, users and statuses are dictionary-encoded as small int codes (the
+index into the json list), so grouping is an `np.bincount` over the code
+column. Money columns are int64 minor units; dates are the local calendar
+day as days since 1970-01-01. Each run appends a segment holding the invoices
+after the manifest's high-water id, so the snapshot is append-only: later
+edits to already-copied invoices need `--rebuild`. `--compact` merges the
+segments into one.
+"""
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F, IntegerField, Max
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from . import archive
+from .models import Product
+
+FORMAT = 1
+EPOCH = date(1970, 1, 1).toordinal()
+INVOICE_COLUMNS = {
+    'id': np.int64, 'ts': np.int64, 'day': np.int32, 'user': np.int32,
+    'customer': np.int64, 'status': np.int16, 'total': np.int64, 'tax': np.int64,
+}
+LINE_COLUMNS = {
+    'invoice': np.int64, 'day': np.int32, 'user': np.int32, 'product': np.int32,
+    'quantity': np.int64, 'amount': np.int64, 'tax': np.int64,
+}
+# null foreign keys (no user / customer)
+NONE = -1
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'ANALYTICS_DIR', Path(settings.BASE_DIR) / 'analytics'))
+
+
+def to_day(value):
+    """date -> the day number stored in `day` columns."""
+    return value.toordinal() - EPOCH
+
+
+def from_day(n):
+    return date.fromordinal(int(n) + EPOCH)
+
+
+def _minor(field):
+    # exact for 2-dp decimals; avoids building a Decimal per row in Python
+    return Cast(Round(F(field) * 100), IntegerField())
+
+
+def _write_json(path, data):
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh, default=str)
+    # mkstemp creates 0600; readers may run as another user (web server)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def _read_json(path, default):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return default
+
+
+class Dictionary:
+    """Append-only value -> code mapping persisted as a json list."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = _read_json(path, [])
+        self.codes = {self._key(e): i for i, e in enumerate(self.entries)}
+
+    @staticmethod
+    def _key(entry):
+        return entry[0] if isinstance(entry, list) else entry
+
+    def code(self, key, entry=None):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.entries)
+            self.entries.append(entry if entry is not None else key)
+        return code
+
+    def save(self):
+        _write_json(self.path, self.entries)
+
+
+def _extract(after, upto, products, users, statuses):
+    """Column arrays for invoices with after < id <= upto, from every source table."""
+    tz = timezone.get_current_timezone()
+    inv = {name: [] for name in INVOICE_COLUMNS}
+    line_rows = []
+    for invoice_model, item_model in (archive.HOT, archive.ARCHIVE):
+        rows = (invoice_model.objects.filter(id__gt=after, id__lte=upto).order_by('id')
+                .values_list('id', 'date', 'created_by_id', 'customer_id', 'status')
+                .annotate(total_minor=_minor('total'), tax_minor=_minor('tax_amount')))
+        for pk, when, user_id, customer_id, status, total, tax in rows.iterator(chunk_size=5000):
+            inv['id'].append(pk)
+            inv['ts'].append(int(when.timestamp()))
+            inv['day'].append(to_day(when.astimezone(tz).date()))
+            inv['user'].append(NONE if user_id is None else users.code(user_id, [user_id, '']))
+            inv['customer'].append(NONE if customer_id is None else customer_id)
+            inv['status'].append(statuses.code(status))
+            inv['total'].append(total or 0)
+            inv['tax'].append(tax or 0)
+        lines = (item_model.objects.filter(invoice_id__gt=after, invoice_id__lte=upto)
+                 .order_by('invoice_id', 'id')
+                 .values_list('invoice_id', 'product_id', 'quantity')
+                 .annotate(amount_minor=_minor('line_total'), tax_minor=_minor('tax_amount')))
+        line_rows.extend(lines.iterator(chunk_size=10000))
+
+    invoices = {name: np.array(values, dtype=INVOICE_COLUMNS[name]) for name, values in inv.items()}
+    order = np.argsort(invoices['id'], kind='stable')
+    invoices = {name: col[order] for name, col in invoices.items()}
+
+    raw = np.array(line_rows, dtype=np.int64).reshape(-1, 5)
+    raw = raw[np.argsort(raw[:, 0], kind='stable')]
+    # day and user are copied from the line's invoice so line queries need no join
+    pos = np.searchsorted(invoices['id'], raw[:, 0])
+    ids, inverse = np.unique(raw[:, 1], return_inverse=True)
+    product_codes = np.array([products.code(pid, [pid, '']) for pid in ids.tolist()], dtype=np.int32)[inverse]
+    lines = {
+        'invoice': raw[:, 0],
+        'day': invoices['day'][pos],
+        'user': invoices['user'][pos],
+        'product': product_codes,
+        'quantity': raw[:, 2],
+        'amount': raw[:, 3],
+        'tax': raw[:, 4],
+    }
+    lines = {name: np.ascontiguousarray(col, dtype=LINE_COLUMNS[name]) for name, col in lines.items()}
+    return invoices, lines
+
+
+def _refresh_labels(products, users):
+    """Current names for every dictionary entry (names can change after the code is assigned)."""
+    names = dict(Product.objects.filter(pk__in=[e[0] for e in products.entries]).values_list('pk', 'name'))
+    for entry in products.entries:
+        entry[1] = names.get(entry[0], entry[1])
+    User = get_user_model()
+    names = dict(User.objects.filter(pk__in=[e[0] for e in users.entries]).values_list('pk', 'username'))
+    for entry in users.entries:
+        entry[1] = names.get(entry[0], entry[1])
+
+
+def _write_segment(root, name, invoices, lines):
+    tmp = Path(tempfile.mkdtemp(dir=root, prefix='.tmp-seg-'))
+    tmp.chmod(0o755)
+    for table, columns in (('invoices', invoices), ('lines', lines)):
+        (tmp / table).mkdir(mode=0o755)
+        for column, values in columns.items():
+            np.save(tmp / table / f'{column}.npy', values)
+    os.replace(tmp, root / name)
+
+
+def update(rebuild=False, lag_seconds=None):
+    """Append invoices created since the last run as a new segment; returns (invoices, lines) added.
+
+    Invoices younger than `lag_seconds` (ANALYTICS_SNAPSHOT_LAG_SECONDS) wait
+    for the next run, so a transaction still committing a lower id is not skipped.
+    """
+    root = snapshot_dir()
+    if rebuild and root.exists():
+        shutil.rmtree(root)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = _read_json(root / 'manifest.json', None) or {
+        'format': FORMAT, 'time_zone': settings.TIME_ZONE, 'high_water': 0, 'segments': []}
+    if manifest['time_zone'] != settings.TIME_ZONE:
+        raise ValueError('TIME_ZONE changed since the snapshot was built; run with --rebuild.')
+
+    lag = getattr(settings, 'ANALYTICS_SNAPSHOT_LAG_SECONDS', 60) if lag_seconds is None else lag_seconds
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    after = manifest['high_water']
+    upto = max([m.objects.filter(id__gt=after, date__lt=cutoff).aggregate(m=Max('id'))['m'] or 0
+                for m, _ in (archive.HOT, archive.ARCHIVE)])
+    if upto <= after:
+        return 0, 0
+
+    products = Dictionary(root / 'products.json')
+    users = Dictionary(root / 'users.json')
+    statuses = Dictionary(root / 'statuses.json')
+    invoices, lines = _extract(after, upto, products, users, statuses)
+    _refresh_labels(products, users)
+    for d in (products, users, statuses):
+        d.save()
+
+    number = max([int(s['name'].split('-')[1]) for s in manifest['segments']] or [0]) + 1
+    name = f'seg-{number:06d}'
+    _write_segment(root, name, invoices, lines)
+    manifest['segments'].append({
+        'name': name, 'invoices': len(invoices['id']), 'lines': len(lines['invoice']),
+        'first_invoice': int(invoices['id'][0]) if len(invoices['id']) else None, 'last_invoice': upto,
+    })
+    manifest['high_water'] = upto
+    manifest['updated_at'] = timezone.now().isoformat()
+    # the manifest is the commit point: readers only see segments it lists
+    _write_json(root / 'manifest.json', manifest)
+    return len(invoices['id']), len(lines['invoice'])
+
+
+def compact():
+    """Merge all segments into one; returns the number of segments merged."""
+    root = snapshot_dir()
+    manifest = _read_json(root / 'manifest.json', None)
+    if not manifest or len(manifest['segments']) < 2:
+        return 0
+    snap = Snapshot(root)
+    invoices = {c: np.concatenate([s['invoices'][c] for s in snap.segments]) for c in INVOICE_COLUMNS}
+    lines = {c: np.concatenate([s['lines'][c] for s in snap.segments]) for c in LINE_COLUMNS}
+    old = [s['name'] for s in manifest['segments']]
+    number = max(int(n.split('-')[1]) for n in old) + 1
+    name = f'seg-{number:06d}'
+    _write_segment(root, name, invoices, lines)
+    manifest['segments'] = [{
+        'name': name, 'invoices': len(invoices['id']), 'lines': len(lines['invoice']),
+        'first_invoice': int(invoices['id'][0]) if len(invoices['id']) else None,
+        'last_invoice': manifest['high_water'],
+    }]
+    _write_json(root / 'manifest.json', manifest)
+    # readers holding the old manifest keep their mapped files until they let go (POSIX)
+    for n in old:
+        shutil.rmtree(root / n, ignore_errors=True)
+    return len(old)
+
+
+class Snapshot:
+    """The segments listed in the manifest, every column memory-mapped read-only."""
+
+    def __init__(self, root=None):
+        self.root = Path(root or snapshot_dir())
+        self.manifest = _read_json(self.root / 'manifest.json', None)
+        if self.manifest is None:
+            raise FileNotFoundError(f'No analytics snapshot in {self.root}; run manage.py analytics_snapshot.')
+        self.segments = []
+        for seg in self.manifest['segments']:
+            base = self.root / seg['name']
+            self.segments.append({
+                'invoices': {c: np.load(base / 'invoices' / f'{c}.npy', mmap_mode='r') for c in INVOICE_COLUMNS},
+                'lines': {c: np.load(base / 'lines' / f'{c}.npy', mmap_mode='r') for c in LINE_COLUMNS},
+            })
+        self.products = _read_json(self.root / 'products.json', [])
+        self.users = _read_json(self.root / 'users.json', [])
+        self.statuses = _read_json(self.root / 'statuses.json', [])
+
+    def user_code(self, user_id):
+        """Code of a user id, or None if the user has no invoices in the snapshot."""
+        return next((i for i, e in enumerate(self.users) if e[0] == user_id), None)
+
+
+_open = {}
+
+
+def open_snapshot():
+    """Snapshot for the current manifest, reused until the manifest changes."""
+    path = snapshot_dir() / 'manifest.json'
+    stamp = os.stat(path).st_mtime_ns
+    cached = _open.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _open[path] = (stamp, Snapshot(path.parent))
+    return cached[1]
+
+
+def _mask(cols, start=None, end=None, user=None):
+    """Row mask for a day range / user code, or None when nothing is filtered."""
+    mask = None
+    if start is not None:
+        mask = cols['day'] >= to_day(start)
+    if end is not None:
+        m = cols['day'] <= to_day(end)
+        mask = m if mask is None else mask & m
+    if user is not None:
+        m = cols['user'] == user
+        mask = m if mask is None else mask & m
+    return mask
+
+
+def _select(cols, mask, name):
+    return cols[name] if mask is None else cols[name][mask]
+
+
+def totals(snap, start=None, end=None, user=None):
+    """Sales, tax, quantity, line and invoice counts over the snapshot (amounts in minor units)."""
+    out = {'sales': 0, 'tax': 0, 'quantity': 0, 'lines': 0, 'invoices': 0, 'invoice_total': 0}
+    for seg in snap.segments:
+        lines, invoices = seg['lines'], seg['invoices']
+        mask = _mask(lines, start, end, user)
+        out['sales'] += int(_select(lines, mask, 'amount').sum())
+        out['tax'] += int(_select(lines, mask, 'tax').sum())
+        out['quantity'] += int(_select(lines, mask, 'quantity').sum())
+        out['lines'] += int(len(lines['amount']) if mask is None else np.count_nonzero(mask))
+        mask = _mask(invoices, start, end, user)
+        out['invoices'] += int(len(invoices['id']) if mask is None else np.count_nonzero(mask))
+        out['invoice_total'] += int(_select(invoices, mask, 'total').sum())
+    return out
+
+
+def _bincount(codes, weights, size):
+    # float64 weights are exact for sums below 2**53 minor units
+    return np.rint(np.bincount(codes, weights=weights, minlength=size)).astype(np.int64)
+
+
+def top_products(snap, n=10, start=None, end=None, user=None, by='amount'):
+    """[(product id, name, sales, quantity)] for the n best products by `by` (amount or quantity)."""
+    size = len(snap.products)
+    sales = np.zeros(size, dtype=np.int64)
+    quantity = np.zeros(size, dtype=np.int64)
+    for seg in snap.segments:
+        lines = seg['lines']
+        mask = _mask(lines, start, end, user)
+        codes = _select(lines, mask, 'product')
+        sales += _bincount(codes, _select(lines, mask, 'amount'), size)
+        quantity += _bincount(codes, _select(lines, mask, 'quantity'), size)
+    key = sales if by == 'amount' else quantity
+    n = min(n, size)
+    if n <= 0:
+        return []
+    best = np.argpartition(-key, n - 1)[:n]
+    best = best[np.argsort(-key[best], kind='stable')]
+    return [(snap.products[i][0], snap.products[i][1], int(sales[i]), int(quantity[i])) for i in best if key[i]]
+
+
+def time_series(snap, freq='day', start=None, end=None, user=None):
+    """[(period start date, sales, quantity)] per day or month, zero-filled over the range."""
+    days = [seg['lines']['day'] for seg in snap.segments if len(seg['lines']['day'])]
+    if start is None:
+        start = from_day(min(int(d.min()) for d in days)) if days else timezone.localdate()
+    if end is None:
+        end = from_day(max(int(d.max()) for d in days)) if days else start
+    first, span = to_day(start), to_day(end) - to_day(start) + 1
+    if span <= 0:
+        return []
+    sales = np.zeros(span, dtype=np.int64)
+    quantity = np.zeros(span, dtype=np.int64)
+    for seg in snap.segments:
+        lines = seg['lines']
+        mask = _mask(lines, start, end, user)
+        offsets = _select(lines, mask, 'day') - first
+        sales += _bincount(offsets, _select(lines, mask, 'amount'), span)
+        quantity += _bincount(offsets, _select(lines, mask, 'quantity'), span)
+    if freq == 'day':
+        return [(start + timedelta(days=i), int(s), int(q)) for i, (s, q) in enumerate(zip(sales, quantity))]
+
+    # fold days into months
+    out = {}
+    for i, (s, q) in enumerate(zip(sales.tolist(), quantity.tolist())):
+        day = start + timedelta(days=i)
+        key = day.replace(day=1)
+        prev = out.get(key, (0, 0))
+        out[key] = (prev[0] + s, prev[1] + q)
+    return [(k, s, q) for k, (s, q) in sorted(out.items())]
@@ -0,0 +1,159 @@
+"""Body of /api/dashboard/: everything the dashboard pages show on load, in one response.
+
+The sales figures (today, this month, the last 30 days and the 30 before,
+daily sales for 30 days and monthly sales for 12 months) come from a single
+GROUP BY over the invoices of the last 12 months (reports.bucket_totals).
+Rows are bucketed by a CASE over local-midnight bounds computed here (the
+days of the last 60 days and the month starts), so the date index is used
+and nothing is evaluated per row in Python; each figure is then a sum of
+consecutive buckets. Counts, top products, sales by user, low-stock products
+and recent invoices are one query each (top products of the quarter come
+from the per-day sketches of shop/sketches.py), so a dashboard costs the
+same handful of queries however much data there is (twice the invoice
+queries when the 12 months reach into an archived year). Results are cached
+for DASHBOARD_CACHE_SECONDS per data scope: one entry for everyone who may
+view reports, one per other user, whose invoice and customer counts only
+cover their own invoices.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from . import sketches
+from .models import Customer, Invoice, InvoiceItem, Product
+from .reports import _month_start, bucket_totals, day_start, money
+
+TOP_PRODUCTS = 10
+LOW_STOCK_ITEMS = 10
+RECENT_INVOICES = 10
+
+
+def _windows(today):
+    """name -> (first day, day after the last) of the summary windows."""
+    tomorrow = today + timedelta(days=1)
+    return {
+        'today': (today, tomorrow),
+        'this_month': (_month_start(today), tomorrow),
+        'last_30_days': (today - timedelta(days=29), tomorrow),
+        'previous_30_days': (today - timedelta(days=59), today - timedelta(days=29)),
+    }
+
+
+def _sales(today, scope):
+    """Window totals and the daily / monthly series, from one grouped query per invoice table."""
+    windows = _windows(today)
+    days = [today - timedelta(days=i) for i in range(59, -1, -1)]
+    months = [_month_start(today, i) for i in range(11, -1, -1)]
+    # bucket i holds [edges[i], edges[i + 1]); every window and series is a run of buckets
+    edges = sorted(set(months) | set(days) | {today + timedelta(days=1)})
+    sales, count = bucket_totals(edges, scope)
+
+    def total(lo, hi, of=sales):
+        return sum(of[edges.index(lo):edges.index(hi)])
+
+    result = {
+        name: {'start': lo, 'end': hi - timedelta(days=1), 'total_sales': money(total(lo, hi)),
+               'invoice_count': total(lo, hi, count)}
+        for name, (lo, hi) in windows.items()
+    }
+    result['daily_sales_last_30'] = [{'date': day.isoformat(), 'sales': money(total(day, day + timedelta(days=1)))}
+                                     for day in days[-30:]]
+    result['monthly_sales_last_12'] = [{'year': m.year, 'month': m.month, 'sales': money(total(m, nxt))}
+                                       for m, nxt in zip(months, months[1:] + [edges[-1]])]
+    return result
+
+
+def _top_products(lo, hi, scope):
+    """Best sellers of [lo, hi), hot table only (the window is at most a few weeks old)."""
+    qs = InvoiceItem.objects.filter(invoice__date__gte=day_start(lo), invoice__date__lt=day_start(hi))
+    if scope is not None:
+        qs = qs.filter(invoice__created_by=scope)
+    rows = (qs.values('product_id', 'product__name')
+            .annotate(total_quantity=Sum('quantity'), total_sales=Sum('line_total'))
+            .order_by('-total_sales')[:TOP_PRODUCTS])
+    return [{'product_id': r['product_id'], 'product_name': r['product__name'],
+             'total_quantity': int(r['total_quantity'] or 0), 'total_sales': money(r['total_sales'])}
+            for r in rows]
+
+
+def _sales_by_user(lo, hi):
+    rows = (Invoice.objects.filter(date__gte=day_start(lo), date__lt=day_start(hi))
+            .values('created_by_id', 'created_by__username')
+            .annotate(total_sales=Sum('total'), invoice_count=Count('id'))
+            .order_by('-total_sales'))
+    return [{'user_id': r['created_by_id'], 'username': r['created_by__username'],
+             'total_sales': money(r['total_sales']), 'invoice_count': r['invoice_count']}
+            for r in rows]
+
+
+def _recent_invoices(scope):
+    qs = Invoice.objects.order_by('-date', '-id')
+    if scope is not None:
+        qs = qs.filter(created_by=scope)
+    # a correlated count for the few rows shown, rather than grouping the whole table
+    item_count = (InvoiceItem.objects.filter(invoice=OuterRef('pk')).order_by()
+                  .values('invoice').annotate(n=Count('id')).values('n'))
+    qs = qs.annotate(item_count=Subquery(item_count, output_field=IntegerField()))
+    return [{
+        'id': inv.id,
+        'invoice_no': inv.invoice_no,
+        'date': inv.date.isoformat(),
+        'status': inv.status,
+        'created_by': inv.created_by.username if inv.created_by else None,
+        'customer_name': inv.customer.name if inv.customer else None,
+        'total': money(inv.total),
+        'item_count': inv.item_count or 0,
+    } for inv in qs.select_related('created_by', 'customer')[:RECENT_INVOICES]]
+
+
+def build(scope=None):
+    """The dashboard for all invoices, or only those created by `scope` (a user)."""
+    today = timezone.localdate()
+    threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 10)
+    sales = _sales(today, scope)
+    last_30 = _windows(today)['last_30_days']
+
+    counts = Product.objects.aggregate(
+        products=Count('id'),
+        low_stock_products=Count('id', filter=Q(stock__gt=0, stock__lte=threshold)),
+        out_of_stock_products=Count('id', filter=Q(stock__lte=0)),
+    )
+    invoices = Invoice.objects.all() if scope is None else Invoice.objects.filter(created_by=scope)
+    # hot table only: archived years are closed and counted in ArchivedYear
+    by_status = dict(invoices.values_list('status').annotate(n=Count('id')).order_by())
+    counts.update(invoices=sum(by_status.values()), invoices_by_status=by_status)
+    counts['customers'] = (Customer.objects if scope is None else Customer.objects.of_user(scope)).count()
+
+    low_stock = list(Product.objects.filter(stock__lte=threshold).order_by('stock', 'id')
+                     .values('id', 'name', 'sku', 'stock')[:LOW_STOCK_ITEMS])
+    return {
+        'scope': 'all' if scope is None else 'own',
+        'low_stock_threshold': threshold,
+        'counts': counts,
+        **sales,
+        'top_products': _top_products(*last_30, scope),
+        # only meaningful across users
+        'sales_by_user': _sales_by_user(*last_30) if scope is None else [],
+        # approximate, from the per-day sketches: one row per day, whatever the line volume
+        'top_products_this_quarter': (sketches.query(sketches.quarter_start(today), today, TOP_PRODUCTS)['top_products']
+                                      if scope is None else []),
+        'low_stock': low_stock,
+        'recent_invoices': _recent_invoices(scope),
+        'generated_at': timezone.now(),
+    }
+
+
+def cached_build(scope=None):
+    """build() through the cache; returns (result, hit)."""
+    # keyed by day too, so a cached dashboard never outlives the day it was built for
+    key = f'dashboard:{timezone.localdate()}:{"all" if scope is None else f"user:{scope.pk}"}'
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    result = build(scope)
+    cache.set(key, result, getattr(settings, 'DASHBOARD_CACHE_SECONDS', 30))
+    return result, False
+
@@ -0,0 +1,204 @@
+"""Batch demand forecasts for every product from invoice line quantities.
+
+Daily demand comes from one grouped query per invoice/line table pair
+(product, local day, units) and becomes a dense products x days float32
+matrix, built BLOCK_PRODUCTS rows at a time so a 200k-product, three-year
+catalog never needs more than a few hundred MB. Two models are fitted to
+all rows of a block at once with array arithmetic:
+
+- simple exponential smoothing, one level per product for each alpha in
+  ALPHAS, the alpha with the lowest one-step squared error kept per product;
+- weekly seasonal naive: each weekday's mean over the last four weeks.
+
+Both are scored on the last HOLDOUT_DAYS days after fitting on the days
+before, and each product gets the one with the smaller mean absolute error.
+Results replace the DemandForecast table; see `manage.py forecast_demand`.
+"""
+import csv
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import archive
+from .models import DemandForecast, Product
+from .pivot import date_bucket, group_key
+from .reports import day_start
+
+HORIZONS = (30, 60, 90)
+ALPHAS = np.array([0.05, 0.1, 0.2, 0.3, 0.5], dtype=np.float32)
+HOLDOUT_DAYS = 28  # whole weeks, so the seasonal profile stays aligned
+SEASON = 7
+BLOCK_PRODUCTS = 20000
+CSV_HEADER = ['product_id', 'sku', 'product_name', 'stock', 'method', 'alpha', 'demand_30', 'demand_60',
+              'demand_90', 'backtest_mae', 'history_units', 'as_of', 'generated_at']
+
+
+def _day_numbers(values):
+    """Bucket values (ISO strings on SQLite, datetimes elsewhere) -> int64 days since 1970-01-01."""
+    if values and not isinstance(values[0], str):
+        values = [v.date().isoformat() for v in values]
+    return np.array(values, dtype='datetime64[D]').astype(np.int64)
+
+
+def load_sales(start, end):
+    """Non-zero daily sales between `start` and `end` (local dates, inclusive)
+    as parallel arrays (product ids, day offsets from `start`, units).
+    """
+    products, days, units = [], [], []
+    for _, item_model in archive.sources(start, end):
+        rows = (item_model.objects
+                .filter(invoice__date__gte=day_start(start), invoice__date__lt=day_start(end + timedelta(days=1)))
+                .annotate(p=group_key('product_id'), d=date_bucket('day'))
+                .order_by().values_list('p', 'd').annotate(units=Sum('quantity')))
+        rows = list(rows.iterator(chunk_size=20000))
+        if rows:
+            p, d, u = zip(*rows)
+            products.append(np.array(p, dtype=np.int64))
+            days.append(_day_numbers(d) - np.datetime64(start, 'D').astype(np.int64))
+            units.append(np.array(u, dtype=np.float32))
+    if not products:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32)
+    return np.concatenate(products), np.concatenate(days), np.concatenate(units)
+
+
+def demand_matrix(product_ids, sales, n_days):
+    """Dense (len(product_ids), n_days) float32 matrix of daily units; `product_ids` sorted."""
+    pids, days, units = sales
+    rows = np.searchsorted(product_ids, pids)
+    keep = (rows < len(product_ids)) & (product_ids[np.minimum(rows, len(product_ids) - 1)] == pids)
+    flat = rows[keep] * n_days + days[keep]
+    counts = np.bincount(flat, weights=units[keep], minlength=len(product_ids) * n_days)
+    return counts.astype(np.float32).reshape(len(product_ids), n_days)
+
+
+def _ses(y, cut):
+    """Exponential smoothing over every row and alpha.
+
+    Returns (alpha index per row, level at `cut` and at the end for that alpha).
+    Alphas are chosen on the one-step errors before `cut`.
+    """
+    n = y.shape[0]
+    alphas = ALPHAS[:, None]
+    level = np.zeros((len(ALPHAS), n), dtype=np.float32)
+    sse = np.zeros((len(ALPHAS), n), dtype=np.float64)
+    at_cut = level
+    for t in range(y.shape[1]):
+        if t == cut:
+            at_cut = level.copy()
+        err = y[:, t] - level
+        if t < cut:
+            sse += err * err
+        level += alphas * err
+    best = sse.argmin(axis=0)
+    cols = np.arange(n)
+    return best, at_cut[best, cols], level[best, cols]
+
+
+def _weekly_profile(y, end):
+    """Mean units per weekday position over the four weeks before column `end`."""
+    return y[:, end - 4 * SEASON:end].reshape(y.shape[0], 4, SEASON).mean(axis=1)
+
+
+def _horizon_sum(profile, days):
+    weeks, rest = divmod(days, SEASON)
+    return profile.sum(axis=1) * weeks + profile[:, :rest].sum(axis=1)
+
+
+def fit(y):
+    """Forecasts for each row of a demand matrix; a dict of arrays keyed like DemandForecast fields."""
+    n_days = y.shape[1]
+    cut = n_days - HOLDOUT_DAYS
+    holdout = y[:, cut:]
+
+    best, ses_cut, ses_end = _ses(y, cut)
+    ses_mae = np.abs(holdout - ses_cut[:, None]).mean(axis=1)
+    # holdout and both profiles start at a multiple of SEASON before the end, so position i is the same weekday
+    seasonal_mae = np.abs(holdout - np.tile(_weekly_profile(y, cut), HOLDOUT_DAYS // SEASON)).mean(axis=1)
+    profile = _weekly_profile(y, n_days)
+
+    use_seasonal = seasonal_mae < ses_mae
+    units = y.sum(axis=1)
+    out = {
+        'use_seasonal': use_seasonal,
+        'no_sales': units == 0,
+        'alpha': ALPHAS[best],
+        'backtest_mae': np.where(use_seasonal, seasonal_mae, ses_mae),
+        'history_units': units,
+    }
+    for h in HORIZONS:
+        out[f'demand_{h}'] = np.where(use_seasonal, _horizon_sum(profile, h), ses_end * h)
+    return out
+
+
+def run(as_of=None, history_days=None):
+    """Fit every product on the `history_days` up to `as_of` (default yesterday) and
+    replace the DemandForecast rows. Returns the number of products forecast.
+    """
+    as_of = as_of or timezone.localdate() - timedelta(days=1)
+    history_days = history_days or getattr(settings, 'FORECAST_HISTORY_DAYS', 3 * 365)
+    if history_days < HOLDOUT_DAYS + 4 * SEASON:
+        raise ValueError(f'Use at least {HOLDOUT_DAYS + 4 * SEASON} days of history.')
+    start = as_of - timedelta(days=history_days - 1)
+
+    sales = load_sales(start, as_of)
+    order = np.argsort(sales[0], kind='stable')
+    sales = tuple(a[order] for a in sales)
+    product_ids = np.array(Product.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+
+    generated_at = timezone.now()
+    rows = []
+    for lo in range(0, len(product_ids), BLOCK_PRODUCTS):
+        block = product_ids[lo:lo + BLOCK_PRODUCTS]
+        # sales are sorted by product, so the block's entries are one slice
+        a, b = np.searchsorted(sales[0], [block[0], block[-1] + 1])
+        result = fit(demand_matrix(block, tuple(s[a:b] for s in sales), history_days))
+        method = np.where(result['no_sales'], DemandForecast.NO_SALES,
+                          np.where(result['use_seasonal'], DemandForecast.SEASONAL_NAIVE, DemandForecast.SES))
+        alpha = np.round(result['alpha'].astype(np.float64), 2)
+        rows.extend(zip(
+            block.tolist(),
+            method.tolist(),
+            [x if m == DemandForecast.SES else None for m, x in zip(method.tolist(), alpha.tolist())],
+            *(np.round(result[f'demand_{h}'].astype(np.float64), 2).tolist() for h in HORIZONS),
+            np.round(result['backtest_mae'].astype(np.float64), 4).tolist(),
+            result['history_units'].astype(np.int64).tolist(),
+        ))
+    _replace(rows, as_of, generated_at)
+    return len(rows)
+
+
+def _replace(rows, as_of, generated_at):
+    """Swap the DemandForecast table contents for `rows` in one transaction.
+
+    Plain executemany: bulk_create would split 200k rows into statements of
+    under a hundred rows to stay within SQLite's parameter limit.
+    """
+    fields = ['product_id', 'method', 'alpha'] + [f'demand_{h}' for h in HORIZONS] + [
+        'backtest_mae', 'history_units', 'as_of', 'generated_at']
+    meta = DemandForecast._meta
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(meta.db_table), ', '.join(qn(meta.get_field(f).column) for f in fields), ', '.join(['%s'] * len(fields)))
+    as_of = meta.get_field('as_of').get_db_prep_value(as_of, connection)
+    generated_at = meta.get_field('generated_at').get_db_prep_value(generated_at, connection)
+    with transaction.atomic(), connection.cursor() as cursor:
+        DemandForecast.objects.all().delete()
+        for lo in range(0, len(rows), 10000):
+            cursor.executemany(sql, [row + (as_of, generated_at) for row in rows[lo:lo + 10000]])
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    """CSV text for `rows` (tuples in CSV_HEADER order), one line at a time for a streaming response."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
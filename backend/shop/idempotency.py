@@ -0,0 +1,130 @@
+"""Idempotency-Key support for POST endpoints (used by invoice creation).
+
+The first request with a key inserts an IdempotencyKey row (unique on user
+scope + key) in the same transaction as the objects it creates, and stores
+its response there before committing. A concurrent request with the same key
+blocks on that uncommitted row (the unique index on PostgreSQL, the write lock
+on SQLite) until the owner finishes: if it committed, the retry finds the
+stored response and gets it back without running the view; if it failed or
+died, its transaction is rolled back, the key goes with it, and the retry
+runs as the first request. The claim therefore lasts exactly as long as the
+owner's transaction and is never released on a timer. Reusing a key with a
+different body is rejected.
+
+Keys expire after IDEMPOTENCY_KEY_TTL_HOURS; expired rows are swept from the
+table now and then by the requests themselves.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+SWEEP_INTERVAL = timedelta(minutes=10)
+
+_last_sweep = None
+
+
+def _scope(request):
+    user = request.user
+    return f'user:{user.pk}' if user and user.is_authenticated else 'anon'
+
+
+def fingerprint(request):
+    """Hash of what makes two requests "the same": method, path and the parsed body."""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    raw = f'{request.method} {request.path}\n{body}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def sweep(now=None):
+    """Delete expired keys; runs at most once per SWEEP_INTERVAL per process."""
+    global _last_sweep
+    now = now or timezone.now()
+    if _last_sweep is not None and now - _last_sweep < SWEEP_INTERVAL:
+        return 0
+    _last_sweep = now
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=now).delete()
+    return deleted
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _error(detail, code, **headers):
+    response = Response({'detail': detail}, status=code)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def handle(request, key, run):
+    """Call `run()` (which returns a Response) at most once per key and replay its result."""
+    if len(key) > MAX_KEY_LENGTH:
+        return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.', status.HTTP_400_BAD_REQUEST)
+    sweep()
+    scope = _scope(request)
+    fp = fingerprint(request)
+    ttl = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    delay = 0.05
+
+    while True:
+        existing = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if existing is not None:
+            now = timezone.now()
+            if existing.expires_at < now:
+                IdempotencyKey.objects.filter(pk=existing.pk, expires_at__lt=now).delete()
+                continue
+            if existing.fingerprint != fp:
+                return _error(f'This {HEADER} was already used with a different request.',
+                              status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if existing.completed_at is not None:
+                return _replay(existing)
+            # committed without a response: only left behind by an older version; expires with its TTL
+            return _error(f'A request with this {HEADER} is still in progress.', status.HTTP_409_CONFLICT,
+                          **{'Retry-After': '1'})
+
+        claimed = False
+        try:
+            with transaction.atomic():
+                # waits here while a concurrent request holds the same key uncommitted
+                record = IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=fp, expires_at=timezone.now() + ttl)
+                claimed = True
+                response = run()
+                if status.is_success(response.status_code):
+                    IdempotencyKey.objects.filter(pk=record.pk).update(
+                        completed_at=timezone.now(), status_code=response.status_code,
+                        response_body=response.data)
+                else:
+                    # nothing to replay: roll back the key with the request so it can be retried
+                    transaction.set_rollback(True)
+            return response
+        except IntegrityError:
+            if claimed:
+                raise
+            # the concurrent request committed the key first; read its response
+            continue
+        except OperationalError:
+            if claimed:
+                raise
+            # SQLite's busy timeout ran out behind a long write; try again until the deadline
+        if time.monotonic() >= deadline:
+            return _error(f'A request with this {HEADER} is still in progress.', status.HTTP_409_CONFLICT,
+                          **{'Retry-After': '1'})
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
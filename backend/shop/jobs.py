@@ -0,0 +1,150 @@
+"""Background report jobs.
+
+Wide-range reports are not computed inside a web request. POST
+/api/reports/jobs/ only stores a ReportJob and returns; the `run_report_jobs`
+worker computes it in a process pool and writes the result under
+`settings.REPORTS_DIR/jobs/`, and the client polls the job and downloads the
+file once it is DONE.
+
+Jobs are keyed on kind + parameters + data scope. Submitting a key that is
+already queued or running returns that job, and a finished result is reused
+while it is still valid: indefinitely when the range ended before the day it
+was computed, for REPORT_JOB_FRESH_SECONDS otherwise (today's invoices still
+change it).
+"""
+import hashlib
+import json
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import reports
+from .models import ReportJob
+from .renderers import dumps
+
+# kind -> (file extension, content type)
+KINDS = {
+    'sales_report': ('json', 'application/json'),
+    'sales_csv': ('csv', 'text/csv'),
+}
+# kinds that always cover the whole organisation
+ORG_WIDE_KINDS = {'sales_csv'}
+
+
+def reports_dir():
+    return Path(getattr(settings, 'REPORTS_DIR', settings.BASE_DIR / 'reports')) / 'jobs'
+
+
+def clean_params(kind, data, scope):
+    """Normalised job parameters; raises ValueError for an unknown kind or a bad date.
+
+    `scope` is the id of the only user whose invoices the report may include,
+    or None for an organisation-wide report.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown report kind, use one of: {", ".join(sorted(KINDS))}.')
+    sd = reports.parse_date(data.get('start_date'))
+    ed = reports.parse_date(data.get('end_date'))
+    return {
+        'start_date': sd.isoformat() if sd else None,
+        'end_date': ed.isoformat() if ed else None,
+        'scope': None if kind in ORG_WIDE_KINDS else scope,
+    }
+
+
+def job_key(kind, params):
+    raw = json.dumps({'kind': kind, 'params': params}, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def result_path(job):
+    return reports_dir() / job.result_file
+
+
+def is_reusable(job):
+    """Whether a DONE job's file can stand in for a new identical request."""
+    if job.status != ReportJob.DONE or not job.result_file or not result_path(job).exists():
+        return False
+    ed = reports.parse_date(job.params.get('end_date'))
+    if ed and ed < timezone.localdate(job.finished_at):
+        return True
+    fresh = getattr(settings, 'REPORT_JOB_FRESH_SECONDS', 300)
+    return job.finished_at >= timezone.now() - timedelta(seconds=fresh)
+
+
+def submit(kind, params, user):
+    """Queue a job, or return an identical one that is pending, running or reusable.
+
+    Returns (job, created).
+    """
+    key = job_key(kind, params)
+    recent = ReportJob.objects.filter(key=key).exclude(status=ReportJob.FAILED).order_by('-id')[:5]
+    for job in recent:
+        if job.status in (ReportJob.PENDING, ReportJob.RUNNING) or is_reusable(job):
+            return job, False
+    return ReportJob.objects.create(kind=kind, params=params, key=key, created_by=user), True
+
+
+def claim(job):
+    """Mark a PENDING job RUNNING; False if another worker got there first."""
+    return ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING, started_at=timezone.now()) == 1
+
+
+def _write_atomic(path, write):
+    """Write via a temporary file in the same directory so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.' + path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as f:
+            write(f)
+        os.chmod(tmp, 0o644)  # mkstemp creates owner-only files
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def run(job_id):
+    """Compute a claimed job and store its result; runs in a worker process."""
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        sd = reports.parse_date(job.params.get('start_date'))
+        ed = reports.parse_date(job.params.get('end_date'))
+        ext, _ = KINDS[job.kind]
+        # named by key: a re-run for the same parameters replaces the stale file
+        name = f'{job.kind}-{job.key[:32]}.{ext}'
+        if job.kind == 'sales_report':
+            data = reports.sales_report(sd, ed, job.params.get('scope'))
+            _write_atomic(reports_dir() / name, lambda f: f.write(dumps(data, indent=2).decode('utf-8')))
+        else:
+            _write_atomic(reports_dir() / name, lambda f: reports.write_sales_csv(f, sd, ed))
+    except Exception as exc:
+        ReportJob.objects.filter(pk=job.pk).update(
+            status=ReportJob.FAILED, finished_at=timezone.now(), error=f'{type(exc).__name__}: {exc}'[:1000])
+        return job.pk, ReportJob.FAILED
+    ReportJob.objects.filter(pk=job.pk).update(
+        status=ReportJob.DONE, finished_at=timezone.now(), result_file=name, error='')
+    return job.pk, ReportJob.DONE
+
+
+def serialize(job, request=None):
+    data = {
+        'id': job.id,
+        'kind': job.kind,
+        'params': job.params,
+        'status': job.status,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'error': job.error or None,
+        'download_url': None,
+    }
+    if job.status == ReportJob.DONE:
+        url = f'/api/reports/jobs/{job.id}/download/'
+        data['download_url'] = request.build_absolute_uri(url) if request is not None else url
+    return data
@@ -0,0 +1,133 @@
+"""Live dashboard updates pushed over Server-Sent Events.
+
+Outbox events (see shop/outbox.py) are published here once their transaction
+commits. Each event is turned into a dashboard delta exactly once - the SSE
+frame is encoded a single time - and the same bytes are fanned out to every
+open stream. A hundred open dashboards therefore cost one computation per
+event and no report queries after they connect.
+
+Today's totals are not kept in process memory, where every server process
+would hold a different figure. A stream starts with a `snapshot` read from
+the database (today_totals()) after subscribing, including the id of the
+newest invoice it counts; clients then add the `total` of every
+`invoice.created` whose `invoice.id` is higher and whose `invoice.day` is the
+snapshot's date (a new day starts again from zero).
+
+The broker is chosen by `settings.LIVE_BROKER` (dotted path). The default
+`InProcessBroker` only reaches streams served by the same process; a
+broker-backed class with the same `subscribe` / `unsubscribe` / `publish`
+methods can be dropped in for multi-process deployments.
+"""
+import asyncio
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from .renderers import dumps
+
+
+class InProcessBroker:
+    """Fan-out to asyncio queues owned by SSE streams; publish() is thread-safe."""
+
+    queue_size = 100
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        sub = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.queue_size))
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, frame)
+            except RuntimeError:
+                # the stream's loop has shut down; it unsubscribes on its way out
+                pass
+
+    @staticmethod
+    def _offer(queue, frame):
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # a stalled client misses a delta until it reconnects and gets a fresh snapshot
+            pass
+
+
+def today_totals():
+    """Invoice count, sales and newest invoice id of the current local day, from the database."""
+    from .models import Invoice
+    from .reports import day_start
+    today = timezone.localdate()
+    agg = Invoice.objects.filter(date__gte=day_start(today), date__lt=day_start(today + timedelta(days=1))).aggregate(
+        total=Sum('total'), count=Count('id'), last_invoice=Max('id'))
+    return {'date': today.isoformat(), 'total': Decimal(str(agg['total'] or 0)).quantize(Decimal('0.01')),
+            'invoice_count': agg['count'], 'last_invoice': agg['last_invoice']}
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'LIVE_BROKER', 'shop.live.InProcessBroker'))()
+    return _broker
+
+
+def frame(event, data, event_id=None):
+    """Encode one SSE frame."""
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    head += f'event: {event}\n'
+    return head.encode('utf-8') + b'data: ' + dumps(data) + b'\n\n'
+
+
+def _local_day(value):
+    when = parse_datetime(value) if isinstance(value, str) else value
+    return timezone.localdate(when).isoformat() if when else None
+
+
+def publish_outbox_event(event):
+    """Turn a committed outbox event into a dashboard delta and fan it out once."""
+    from . import outbox
+    payload = event.payload
+    if event.topic == outbox.INVOICE_CREATED:
+        data = {
+            'invoice': {
+                'id': payload.get('id'),
+                'invoice_no': payload.get('invoice_no'),
+                'date': payload.get('date'),
+                'total': payload.get('total'),
+                'created_by': payload.get('created_by'),
+                'customer': payload.get('customer'),
+                'item_count': len(payload.get('items') or []),
+                # local day the invoice counts towards in the snapshot totals
+                'day': _local_day(payload.get('date')),
+            },
+        }
+    elif event.topic == outbox.STOCK_ADJUSTED:
+        data = {'stock': {k: payload.get(k) for k in ('product', 'change', 'reason')}}
+    elif event.topic == outbox.STOCK_BATCH_ADJUSTED:
+        data = {'stock_batch': {'mode': payload.get('mode'), 'count': len(payload.get('adjustments') or [])}}
+    else:
+        return
+    get_broker().publish(frame(event.topic, data, event.id))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import columnar
+
+
+class Command(BaseCommand):
+    help = 'Append new invoices to the column-file analytics snapshot (see shop/columnar.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the snapshot and extract every invoice again')
+        parser.add_argument('--compact', action='store_true',
+                            help='Merge the snapshot segments into one after updating')
+        parser.add_argument('--lag-seconds', type=int, default=None,
+                            help='Leave invoices younger than this for the next run')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            invoices, lines = columnar.update(rebuild=options['rebuild'], lag_seconds=options['lag_seconds'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Added {invoices} invoices / {lines} lines in {time.monotonic() - started:.1f}s'))
+        if options['compact']:
+            merged = columnar.compact()
+            if merged:
+                self.stdout.write(self.style.SUCCESS(f'Merged {merged} segments'))
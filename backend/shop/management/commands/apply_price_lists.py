@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop import pricing
+from shop.models import PriceList
+
+
+class Command(BaseCommand):
+    help = 'Apply the price lists whose effective date has come (see shop/pricing.py); run daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only show what each due list would change')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        due = PriceList.objects.filter(applied_at__isnull=True, effective_from__lte=today).order_by('effective_from', 'id')
+        if not due:
+            self.stdout.write('No price lists due.')
+            return
+        for price_list in due:
+            started = time.monotonic()
+            try:
+                if options['dry_run']:
+                    preview = pricing.preview(price_list, limit=0)
+                    self.stdout.write(f'{price_list}: would change {preview["products_changed"]} of '
+                                      f'{preview["products"]} prices')
+                    continue
+                changed = pricing.apply(price_list)
+            except pricing.PricingError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'{price_list}: changed {changed} prices in {time.monotonic() - started:.1f}s'))
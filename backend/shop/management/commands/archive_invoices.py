@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop import archive
+from shop.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Move invoices of closed financial years into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, action='append', dest='years',
+                            help='Financial year to archive (starting calendar year, e.g. 2024 for FY 2024-25). Repeatable.')
+        parser.add_argument('--all-closed', action='store_true',
+                            help='Archive every closed financial year that still has invoices in the hot tables')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        years = options['years'] or []
+        if options['all_closed']:
+            oldest = Invoice.objects.order_by('date').values_list('date', flat=True).first()
+            if oldest is not None:
+                first = archive.financial_year_of(timezone.localtime(oldest))
+                years.extend(range(first, archive.current_financial_year()))
+        if not years:
+            raise CommandError('Pass --year YYYY or --all-closed.')
+
+        for fy in sorted(set(years)):
+            try:
+                moved = archive.archive_financial_year(fy, batch_size=options['batch_size'], stdout=self.stdout)
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'FY {fy}: archived {moved} invoices'))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from shop import archive, reports, sketches
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-day invoice sketches from the invoice tables (see shop/sketches.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD); default the oldest invoice')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD); default today')
+
+    def handle(self, *args, **options):
+        try:
+            start = reports.parse_date(options['start'])
+            end = reports.parse_date(options['end']) or timezone.localdate()
+        except ValueError:
+            raise CommandError('Dates must be YYYY-MM-DD.')
+        if start is None:
+            oldest = [m.objects.aggregate(d=Min('date'))['d'] for m, _ in (archive.HOT, archive.ARCHIVE)]
+            oldest = [timezone.localdate(d) for d in oldest if d is not None]
+            if not oldest:
+                self.stdout.write('No invoices.')
+                return
+            start = min(oldest)
+        started = time.monotonic()
+        days = sketches.rebuild(start, end, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote sketches for {days} days ({start} to {end}) in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import outbox
+
+PRUNE_INTERVAL = 3600  # seconds between retention prunes while delivering
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events (invoice.created, stock.adjusted) to the configured webhooks in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', dest='urls',
+                            help='Webhook URL (repeatable). Defaults to settings.OUTBOX_WEBHOOK_URLS.')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when there is nothing to send')
+        parser.add_argument('--timeout', type=float, default=10.0, help='HTTP timeout per batch')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain what is deliverable now and exit (for cron)')
+        parser.add_argument('--prune-days', type=int, default=None,
+                            help='Delete delivered events older than this many days and exit. The delivery '
+                                 'loop also prunes every hour after OUTBOX_RETENTION_DAYS.')
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            deleted = outbox.prune(options['prune_days'])
+            self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} delivered events'))
+            return
+
+        urls = options['urls'] or list(getattr(settings, 'OUTBOX_WEBHOOK_URLS', []))
+        if not urls:
+            raise CommandError('No webhook URLs: pass --url or set OUTBOX_WEBHOOK_URLS.')
+
+        total = 0
+        pruned_at = None
+        while True:
+            if pruned_at is None or time.monotonic() - pruned_at > PRUNE_INTERVAL:
+                pruned = outbox.prune()
+                pruned_at = time.monotonic()
+                if pruned:
+                    self.stdout.write(f'Pruned {pruned} delivered events')
+            sent, wait = outbox.deliver_pending(urls, batch_size=options['batch_size'], timeout=options['timeout'])
+            total += sent
+            if sent:
+                self.stdout.write(f'Delivered {sent} events')
+                continue
+            if wait:
+                self.stderr.write(f'Delivery failed or backing off, next attempt in {wait:.1f}s')
+            if options['once']:
+                break
+            time.sleep(wait or options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Delivered {total} events'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import backup
+
+
+class Command(BaseCommand):
+    help = 'Stream the shop data into a directory of NDJSON parts (see shop/backup.py); re-run to resume'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Backup directory; created if missing')
+        parser.add_argument('--gzip', action='store_true', help='Compress each part (fast gzip level)')
+        parser.add_argument('--part-rows', type=int, default=backup.PART_ROWS,
+                            help='Rows per part file, i.e. how much an interrupted run repeats')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            rows = backup.export(options['directory'], compress=options['gzip'],
+                                 part_rows=options['part_rows'], stdout=self.stdout)
+        except backup.BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Exported {rows} rows in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import forecast
+from shop.reports import parse_date
+
+
+class Command(BaseCommand):
+    help = 'Forecast 30/60/90-day demand for every product from invoice history (see shop/forecast.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--as-of', default=None,
+                            help='Last day of history, YYYY-MM-DD (default yesterday)')
+        parser.add_argument('--history-days', type=int, default=None,
+                            help='Days of history to fit on (default FORECAST_HISTORY_DAYS)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            as_of = parse_date(options['as_of'])
+            count = forecast.run(as_of=as_of, history_days=options['history_days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Forecast {count} products in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import backup
+
+
+class Command(BaseCommand):
+    help = 'Load a backup written by export_data into this database (see shop/backup.py); re-run to resume'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Backup directory')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Progress file (default <directory>/import-checkpoint.json)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            rows = backup.import_(options['directory'], checkpoint=options['checkpoint'], stdout=self.stdout)
+        except backup.BackupError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Imported {rows} rows in {time.monotonic() - started:.1f}s'))
@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop import jobs, workers
+from shop.models import ReportJob
+
+
+class Command(BaseCommand):
+    help = 'Compute queued report jobs (POST /api/reports/jobs/) in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'REPORT_JOB_WORKERS', min(4, os.cpu_count() or 1)))
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between polls for new jobs')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs queued now, wait for them and exit (for cron)')
+        parser.add_argument('--stale-minutes', type=int, default=60,
+                            help='Requeue RUNNING jobs started longer ago than this (a worker died)')
+        parser.add_argument('--prune-days', type=int, default=None,
+                            help='Delete finished jobs older than this many days, and their files, and exit')
+
+    def handle(self, *args, **options):
+        if options['prune_days'] is not None:
+            self.prune(options['prune_days'])
+            return
+
+        cutoff = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        requeued = ReportJob.objects.filter(status=ReportJob.RUNNING, started_at__lt=cutoff).update(
+            status=ReportJob.PENDING, started_at=None)
+        if requeued:
+            self.stderr.write(f'Requeued {requeued} stale jobs')
+
+        size = max(1, options['workers'])
+        running = set()
+        done = 0
+        # spawn rather than fork: children must not share the parent's database connections
+        with ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=workers.init) as pool:
+            while True:
+                free = size - len(running)
+                if free:
+                    for job in ReportJob.objects.filter(status=ReportJob.PENDING).order_by('id')[:free]:
+                        if jobs.claim(job):
+                            running.add(pool.submit(workers.run_report_job, job.pk))
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                finished, running = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job_id, state = future.result()
+                    done += 1
+                    self.stdout.write(f'Job #{job_id}: {state}')
+
+        self.stdout.write(self.style.SUCCESS(f'Finished {done} jobs'))
+
+    def prune(self, days):
+        cutoff = timezone.now() - timedelta(days=days)
+        old = ReportJob.objects.filter(status__in=[ReportJob.DONE, ReportJob.FAILED], finished_at__lt=cutoff)
+        files = set(old.exclude(result_file='').values_list('result_file', flat=True))
+        deleted, _ = old.delete()
+        # result files are shared by identical jobs; keep those still referenced
+        files -= set(ReportJob.objects.filter(result_file__in=files).values_list('result_file', flat=True))
+        for name in files:
+            try:
+                os.unlink(jobs.reports_dir() / name)
+            except FileNotFoundError:
+                pass
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} jobs and {len(files)} files'))
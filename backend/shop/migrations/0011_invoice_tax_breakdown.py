@@ -0,0 +1,106 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:34
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def itemize_remainder(Invoice, batch_size=1000):
+    # total = subtotal + tax_amount + customs_duty + shipping_charges must hold;
+    # what the breakdown does not explain is booked as customs duty
+    changed = []
+    rows = Invoice.objects.filter(customs_duty=0, shipping_charges=0).only('subtotal', 'tax_amount', 'total')
+    for invoice in rows.iterator(chunk_size=batch_size):
+        rest = invoice.total - invoice.subtotal - invoice.tax_amount
+        if rest:
+            invoice.customs_duty = rest
+            changed.append(invoice)
+        if len(changed) >= batch_size:
+            Invoice.objects.bulk_update(changed, ['customs_duty'])
+            changed = []
+    Invoice.objects.bulk_update(changed, ['customs_duty'])
+
+
+def backfill_subtotals(apps, schema_editor):
+    # Older invoices never stored a breakdown: subtotal is the sum of their
+    # lines and whatever else is in `total` was unitemized duty / shipping.
+    for invoice_model, item_model in (('Invoice', 'InvoiceItem'), ('ArchivedInvoice', 'ArchivedInvoiceItem')):
+        Invoice = apps.get_model('shop', invoice_model)
+        Item = apps.get_model('shop', item_model)
+        lines = (Item.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice')
+                 .annotate(s=Sum('line_total')).values('s'))
+        Invoice.objects.update(subtotal=Coalesce(
+            Subquery(lines, output_field=DecimalField(max_digits=10, decimal_places=2)), 0,
+            output_field=DecimalField(max_digits=10, decimal_places=2)))
+        itemize_remainder(Invoice)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='customs_duty',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='shipping_charges',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoice',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoiceitem',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='archivedinvoiceitem',
+            name='tax_percent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='customs_duty',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='shipping_charges',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='tax_percent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=5),
+        ),
+        migrations.RunPython(backfill_subtotals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_invoice_tax_breakdown'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DutyRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hs_prefix', models.CharField(help_text='Leading digits of the HS code, e.g. 8471 or 847130', max_length=10)),
+                ('country', models.CharField(blank=True, default='', max_length=2)),
+                ('rate', models.DecimalField(decimal_places=2, help_text='Percent of the line value', max_digits=5)),
+                ('effective_from', models.DateField()),
+                ('effective_to', models.DateField(blank=True, null=True)),
+                ('description', models.CharField(blank=True, default='', max_length=200)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['hs_prefix', 'country', 'effective_from'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TaxRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hs_prefix', models.CharField(help_text='Leading digits of the HS code, e.g. 8471 or 847130', max_length=10)),
+                ('country', models.CharField(blank=True, default='', max_length=2)),
+                ('rate', models.DecimalField(decimal_places=2, help_text='Percent of the line value', max_digits=5)),
+                ('effective_from', models.DateField()),
+                ('effective_to', models.DateField(blank=True, null=True)),
+                ('description', models.CharField(blank=True, default='', max_length=200)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['hs_prefix', 'country', 'effective_from'],
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import Lower, Trim
+
+
+def email_constraint():
+    # blank emails are allowed on any number of users
+    return models.UniqueConstraint(Lower('email'), name='auth_user_email_ci_unique', condition=~models.Q(email=''))
+
+
+def dedupe_emails(apps, schema_editor):
+    """Trim emails, then keep each address (ignoring case) on one user only.
+
+    The user who logged in most recently keeps it, the oldest account on a tie
+    or if none ever logged in; the others get a blank email and can still log
+    in with their username.
+    """
+    User = apps.get_model('auth', 'User')
+    User.objects.exclude(email=Trim('email')).update(email=Trim('email'))
+    duplicated = (User.objects.exclude(email='').values(key=Lower('email'))
+                  .annotate(n=Count('id')).filter(n__gt=1).values_list('key', flat=True))
+    for key in list(duplicated):
+        users = (User.objects.alias(key=Lower('email')).filter(key=key)
+                 .order_by(F('last_login').desc(nulls_last=True), 'id'))
+        keep = users.values_list('id', flat=True)[0]
+        users.exclude(id=keep).update(email='')
+
+
+def add_constraint(apps, schema_editor):
+    schema_editor.add_constraint(apps.get_model('auth', 'User'), email_constraint())
+
+
+def remove_constraint(apps, schema_editor):
+    schema_editor.remove_constraint(apps.get_model('auth', 'User'), email_constraint())
+
+
+class Migration(migrations.Migration):
+    # auth.User belongs to django.contrib.auth, so the index is created with the
+    # schema editor directly rather than recorded in the model's migration state
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('shop', '0013_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_emails, migrations.RunPython.noop),
+        migrations.RunPython(add_constraint, remove_constraint),
+    ]
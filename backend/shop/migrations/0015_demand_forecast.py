@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_user_email_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(choices=[('ses', 'Exponential smoothing'), ('seasonal_naive', 'Seasonal naive (weekly)'), ('none', 'No sales in history')], max_length=20)),
+                ('alpha', models.FloatField(blank=True, null=True)),
+                ('demand_30', models.FloatField(db_index=True)),
+                ('demand_60', models.FloatField()),
+                ('demand_90', models.FloatField()),
+                ('backtest_mae', models.FloatField(blank=True, null=True)),
+                ('history_units', models.PositiveIntegerField(default=0)),
+                ('as_of', models.DateField()),
+                ('generated_at', models.DateTimeField()),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='demand_forecast', to='shop.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.3 on 2026-10-19 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_demand_forecast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='hs_code',
+            field=models.CharField(blank=True, db_index=True, help_text='Harmonized System Code for international trade', max_length=20, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', '-date'], name='shop_inv_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_by', '-date'], name='shop_inv_creator_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['total'], name='shop_inv_total_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def backfill(apps, schema_editor):
+    """Existing products get revision = id and updated_at = created_at; the counter starts after them."""
+    Product = apps.get_model('shop', 'Product')
+    CatalogRevision = apps.get_model('shop', 'CatalogRevision')
+    Product.objects.update(revision=F('id'), updated_at=F('created_at'))
+    last = Product.objects.aggregate(m=Max('id'))['m'] or 0
+    CatalogRevision.objects.create(pk=1, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_invoice_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_id', models.BigIntegerField()),
+                ('sku', models.CharField(max_length=50)),
+                ('revision', models.BigIntegerField(unique=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='revision',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='revision',
+            field=models.BigIntegerField(editable=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def itemize_legacy_totals(apps, schema_editor):
+    # 0011 used to backfill only `subtotal`, so invoices from before it could have
+    # a total that their parts do not add up to; book the rest as customs duty.
+    # Invoices created since always add up and are left alone.
+    for invoice_model in ('Invoice', 'ArchivedInvoice'):
+        Invoice = apps.get_model('shop', invoice_model)
+        changed = []
+        rows = Invoice.objects.filter(customs_duty=0, shipping_charges=0).only('subtotal', 'tax_amount', 'total')
+        for invoice in rows.iterator(chunk_size=1000):
+            rest = invoice.total - invoice.subtotal - invoice.tax_amount
+            if rest:
+                invoice.customs_duty = rest
+                changed.append(invoice)
+            if len(changed) >= 1000:
+                Invoice.objects.bulk_update(changed, ['customs_duty'])
+                changed = []
+        Invoice.objects.bulk_update(changed, ['customs_duty'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0019_daily_sketches'),
+    ]
+
+    operations = [
+        migrations.RunPython(itemize_legacy_totals, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -15,7 +18,7 @@ class UserProfile(models.Model):
 
 
 # create profile automatically when a user is created
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -29,30 +32,213 @@ def save_user_profile(sender, instance, **kwargs):
     if getattr(instance, 'profile', None):
         instance.profile.save()
 
+class CatalogRevision(models.Model):
+    """Single-row counter behind Product.revision and ProductTombstone.revision (see shop/catalog.py)."""
+    value = models.BigIntegerField(default=0)
+
+
+def next_revisions(count=1):
+    """Reserve `count` catalog revisions; returns the last. Call inside the
+    transaction that writes them: the counter row stays locked until it commits,
+    so revisions become visible in increasing order.
+    """
+    with transaction.atomic():
+        if not CatalogRevision.objects.filter(pk=1).update(value=F('value') + count):
+            CatalogRevision.objects.create(pk=1, value=count)
+        return CatalogRevision.objects.values_list('value', flat=True).get(pk=1)
+
+
+class ProductManager(models.Manager):
+    def bulk_create(self, objs, *args, **kwargs):
+        """bulk_create that gives each new product its catalog revision (save() is not called)."""
+        objs = list(objs)
+        missing = [obj for obj in objs if obj.revision is None]
+        with transaction.atomic(using=self.db):
+            if missing:
+                last = next_revisions(len(missing))
+                for revision, obj in enumerate(missing, last - len(missing) + 1):
+                    obj.revision = revision
+            return super().bulk_create(objs, *args, **kwargs)
+
+
 # ✅ Product model
 class Product(models.Model):
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     sku = models.CharField(max_length=50, unique=True)
     barcode = models.CharField(max_length=100, blank=True, null=True)
-    hs_code = models.CharField(max_length=20, blank=True, null=True, help_text="Harmonized System Code for international trade")
+    hs_code = models.CharField(max_length=20, blank=True, null=True, db_index=True, help_text="Harmonized System Code for international trade")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     # Whether this product should be shown in the invoice product selector
     available_for_invoice = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # catalog-wide, bumped on every change; offline clients sync from the last one they saw
+    revision = models.BigIntegerField(unique=True, editable=False)
+    # the price list that set `price`; cleared when the price is edited by hand
+    price_list = models.ForeignKey('PriceList', on_delete=models.SET_NULL, null=True, blank=True,
+                                   editable=False, related_name='+')
+
+    objects = ProductManager()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'revision', 'updated_at'}
+        with transaction.atomic():
+            self.revision = next_revisions()
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+class ProductTombstone(models.Model):
+    """A deleted product, kept so offline clients learn about the deletion (see shop/catalog.py)."""
+    product_id = models.BigIntegerField()
+    sku = models.CharField(max_length=50)
+    revision = models.BigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sku} deleted at revision {self.revision}"
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    # runs inside the delete's transaction, for QuerySet.delete() too
+    ProductTombstone.objects.create(product_id=instance.pk, sku=instance.sku, revision=next_revisions())
+
+
+def normalize_email(value):
+    """Lowercase and strip an email so lookups hit the index regardless of case."""
+    value = (value or '').strip().lower()
+    return value or None
+
+
+def normalize_phone(value):
+    """Keep only digits (and a leading +) so '+91 98765-43210' and '+919876543210' match."""
+    value = (value or '').strip()
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    if not digits:
+        return None
+    return ('+' + digits) if value.startswith('+') else digits
+
+
+def normalize_name(value):
+    """Case-folded, whitespace-collapsed name used for prefix (typeahead) lookups."""
+    return ' '.join((value or '').split()).lower()
+
+
+class CustomerManager(models.Manager):
+    def of_user(self, user):
+        """Customers on invoices created by `user`, hot or archived."""
+        return self.filter(models.Q(id__in=Invoice.objects.filter(created_by=user).values('customer_id'))
+                           | models.Q(id__in=ArchivedInvoice.objects.filter(created_by=user).values('customer_id')))
+
+    def resolve(self, name=None, email=None, phone=None):
+        """Return the customer matching email (then phone), creating it if needed.
+
+        Lookups use the normalized, indexed columns so deduplication costs one
+        index probe per key. Blank details on an existing customer are filled in.
+        A phone match only counts when it cannot contradict the email: with an
+        email, only a customer without one is matched by phone, so two buyers
+        sharing a phone stay apart.
+        With a name only, an existing name-only customer of the same normalized
+        name is reused; customers with an email or phone are never matched by
+        name. Returns None when no identifying detail was given.
+        """
+        email = normalize_email(email)
+        phone = normalize_phone(phone)
+        name = ' '.join((name or '').split())
+        if not (email or phone or name):
+            return None
+
+        customer = None
+        if email:
+            customer = self.filter(email=email).first()
+        if customer is None and phone:
+            by_phone = self.filter(phone=phone)
+            if email:
+                by_phone = by_phone.filter(email__isnull=True)
+            customer = by_phone.order_by('id').first()
+
+        if customer is None:
+            if email:
+                # get_or_create copes with a concurrent insert of the same email
+                customer, _ = self.get_or_create(
+                    email=email,
+                    defaults={'name': name, 'phone': phone},
+                )
+                return customer
+            if phone:
+                return self.create(name=name, phone=phone)
+            customer = (self.filter(name_key=normalize_name(name), email__isnull=True, phone__isnull=True)
+                        .order_by('id').first())
+            return customer or self.create(name=name)
+
+        changed = []
+        if email and not customer.email:
+            customer.email = email
+            changed.append('email')
+        if phone and not customer.phone:
+            customer.phone = phone
+            changed.append('phone')
+        if name and not customer.name:
+            customer.name = name
+            changed.extend(['name', 'name_key'])
+        if changed:
+            customer.save(update_fields=changed)
+        return customer
+
+
+# ✅ Customer model
+class Customer(models.Model):
+    name = models.CharField(max_length=200, blank=True, default='')
+    # lowercased name used for prefix searches (typeahead)
+    name_key = models.CharField(max_length=200, blank=True, default='', db_index=True)
+    # stored normalized (see normalize_email / normalize_phone)
+    email = models.CharField(max_length=254, unique=True, null=True, blank=True)
+    phone = models.CharField(max_length=32, null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CustomerManager()
+
+    def save(self, *args, **kwargs):
+        self.email = normalize_email(self.email)
+        self.phone = normalize_phone(self.phone)
+        self.name_key = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name or self.email or self.phone or f"Customer #{self.pk}"
+
+
 # ✅ Invoice model
 class Invoice(models.Model):
     invoice_no = models.CharField(max_length=100, unique=True, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    date = models.DateTimeField(auto_now_add=True)
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name='invoices')
+    date = models.DateTimeField(auto_now_add=True, db_index=True)
+    # total = subtotal + tax_amount + customs_duty + shipping_charges (see shop/money.py);
+    # invoices from before the breakdown carry the unitemized rest of their total as customs_duty
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    customs_duty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    shipping_charges = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     status = models.CharField(max_length=20, default="PAID")
 
+    class Meta:
+        indexes = [
+            # per-customer invoice history, newest first
+            models.Index(fields=['customer', '-date'], name='shop_inv_customer_date_idx'),
+            # invoice list filters (reports.filter_invoices), each walked in list order
+            models.Index(fields=['status', '-date'], name='shop_inv_status_date_idx'),
+            models.Index(fields=['created_by', '-date'], name='shop_inv_creator_date_idx'),
+            models.Index(fields=['total'], name='shop_inv_total_idx'),
+        ]
+
     def __str__(self):
         return self.invoice_no or "No Invoice No"
 
@@ -63,7 +249,12 @@ class InvoiceItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # quantity * price, before tax
     line_total = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # the price list behind `price`, when the line was billed at the product's list price
+    price_list = models.ForeignKey('PriceList', on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
@@ -75,7 +266,286 @@ class StockAdjustment(models.Model):
     change = models.IntegerField(help_text="Positive for stock add, negative for stock reduce")
     reason = models.CharField(max_length=200, blank=True, null=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f"{self.product.name} ({self.change})"
+
+
+# ✅ Archive of closed financial years (see shop/archive.py)
+class ArchivedYear(models.Model):
+    # financial year named by the calendar year it starts in (2024 = Apr 2024 - Mar 2025)
+    financial_year = models.PositiveIntegerField(unique=True)
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    invoice_count = models.PositiveIntegerField(default=0)
+    # False while batches are still being moved; readers include the archive either way
+    completed = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"FY {self.financial_year}-{(self.financial_year + 1) % 100:02d}"
+
+
+class ArchivedInvoice(models.Model):
+    # keeps the original Invoice primary key so links and invoice numbers stay valid
+    id = models.BigIntegerField(primary_key=True)
+    invoice_no = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_invoices')
+    date = models.DateTimeField(db_index=True)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    customs_duty = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    shipping_charges = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, default="PAID")
+    financial_year = models.PositiveIntegerField(db_index=True)
+
+    def __str__(self):
+        return self.invoice_no or "No Invoice No"
+
+
+class ArchivedInvoiceItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    invoice = models.ForeignKey(ArchivedInvoice, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=10, decimal_places=2)
+    tax_percent = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    price_list = models.ForeignKey('PriceList', on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity}"
+
+
+# ✅ Transactional outbox (see shop/outbox.py)
+class OutboxEvent(models.Model):
+    # the auto-increment id doubles as the consumer cursor
+    topic = models.CharField(max_length=50, db_index=True)
+    object_id = models.CharField(max_length=64, blank=True, default='')
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # webhook delivery state
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # the delivery worker scans undelivered events in id order
+            models.Index(fields=['delivered_at', 'id'], name='shop_outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.topic}"
+
+
+class ReportJob(models.Model):
+    """A report computed in the background by the `run_report_jobs` worker."""
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [(s, s.title()) for s in (PENDING, RUNNING, DONE, FAILED)]
+
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict)
+    # hash of kind + params + data scope; identical requests share one result
+    key = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # file name relative to settings.REPORTS_DIR
+    result_file = models.CharField(max_length=255, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # the worker claims pending jobs oldest first
+            models.Index(fields=['status', 'id'], name='shop_reportjob_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.status}"
+
+
+class IdempotencyKey(models.Model):
+    """A client-supplied Idempotency-Key and the response it produced (see shop/idempotency.py)."""
+    # 'user:<id>' or 'anon'; the same key from different users never collides
+    scope = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # null while the first request is still in flight
+    completed_at = models.DateTimeField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='shop_idempotency_scope_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key}"
+
+
+def normalize_hs_code(value):
+    """'8471.30 00' -> '84713000'; HS codes are matched on their digits only."""
+    return ''.join(ch for ch in str(value or '') if ch.isdigit())
+
+
+class HSRule(models.Model):
+    """A rate for HS codes starting with `hs_prefix`, shipped to `country`, over a date range.
+
+    Looked up by shop/tariffs.py: the longest matching prefix wins, then a rule
+    for the destination country over one for any country ('').
+    """
+    hs_prefix = models.CharField(max_length=10, help_text="Leading digits of the HS code, e.g. 8471 or 847130")
+    # ISO 3166 alpha-2; blank applies to every destination
+    country = models.CharField(max_length=2, blank=True, default='')
+    rate = models.DecimalField(max_digits=5, decimal_places=2, help_text="Percent of the line value")
+    effective_from = models.DateField()
+    # exclusive; null means still in force
+    effective_to = models.DateField(null=True, blank=True)
+    description = models.CharField(max_length=200, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['hs_prefix', 'country', 'effective_from']
+
+    def save(self, *args, **kwargs):
+        self.hs_prefix = normalize_hs_code(self.hs_prefix)
+        self.country = (self.country or '').strip().upper()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.hs_prefix} {self.country or '*'} {self.rate}% from {self.effective_from}"
+
+
+class DutyRule(HSRule):
+    """Customs duty rate."""
+
+
+class TaxRule(HSRule):
+    """Tax (e.g. IGST) rate applied to the line; becomes the line's tax_percent."""
+
+
+class DemandForecast(models.Model):
+    """Latest demand forecast for a product, written by `manage.py forecast_demand` (shop/forecast.py)."""
+    SES = 'ses'
+    SEASONAL_NAIVE = 'seasonal_naive'
+    NO_SALES = 'none'
+    METHOD_CHOICES = [(SES, 'Exponential smoothing'), (SEASONAL_NAIVE, 'Seasonal naive (weekly)'),
+                      (NO_SALES, 'No sales in history')]
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='demand_forecast')
+    method = models.CharField(max_length=20, choices=METHOD_CHOICES)
+    # smoothing factor, for `ses` only
+    alpha = models.FloatField(null=True, blank=True)
+    # expected units over the next 30 / 60 / 90 days, starting the day after `as_of`
+    demand_30 = models.FloatField(db_index=True)
+    demand_60 = models.FloatField()
+    demand_90 = models.FloatField()
+    # mean absolute daily error of the chosen method on the held-out last weeks
+    backtest_mae = models.FloatField(null=True, blank=True)
+    history_units = models.PositiveIntegerField(default=0)
+    as_of = models.DateField()
+    generated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.product_id} {self.method} 30d={self.demand_30:.1f}"
+
+
+class PriceList(models.Model):
+    """A named set of PriceRules that reprices the catalog in one go (see shop/pricing.py).
+
+    `manage.py apply_price_lists` applies it once `effective_from` has come;
+    it can only be applied once, and cannot be edited after that.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    description = models.CharField(max_length=200, blank=True, default='')
+    effective_from = models.DateField()
+    applied_at = models.DateTimeField(null=True, blank=True)
+    applied_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    products_changed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-effective_from', '-id']
+
+    def __str__(self):
+        return self.name
+
+
+class PriceRule(models.Model):
+    """One rule of a price list. A product gets the first rule (by position) whose
+    filters all match it; a rule without filters matches every product.
+    """
+    PERCENT = 'percent'
+    AMOUNT = 'amount'
+    KIND_CHOICES = [(PERCENT, 'Percentage change'), (AMOUNT, 'Absolute change')]
+
+    price_list = models.ForeignKey(PriceList, on_delete=models.CASCADE, related_name='rules')
+    position = models.PositiveIntegerField(default=0)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # percent (-12.50 lowers prices by 12.5%) or an amount added to the price; results are
+    # rounded half-up to the minor unit and never go below zero
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    sku_prefix = models.CharField(max_length=50, blank=True, default='')
+    hs_prefix = models.CharField(max_length=10, blank=True, default='', help_text="Leading digits of the HS code")
+    product_ids = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['price_list', 'position', 'id']
+
+    def save(self, *args, **kwargs):
+        self.hs_prefix = normalize_hs_code(self.hs_prefix)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.value}"
+
+
+class PriceHistory(models.Model):
+    """A change of Product.price: by a price list, or by hand when `price_list` is null."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    price_list = models.ForeignKey(PriceList, on_delete=models.PROTECT, null=True, blank=True, related_name='history')
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['product', '-changed_at'], name='shop_pricehist_product_idx')]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.old_price} -> {self.new_price}"
+
+
+class DailySketch(models.Model):
+    """Mergeable summaries of one local day's invoice lines (see shop/sketches.py)."""
+    day = models.DateField(unique=True)
+    invoices = models.PositiveIntegerField(default=0)
+    lines = models.PositiveIntegerField(default=0)
+    quantity = models.BigIntegerField(default=0)
+    # zlib-compressed arrays: count-min counters of quantity per product and
+    # HyperLogLog registers over customer ids and product ids
+    product_counts = models.BinaryField(default=b'')
+    buyers = models.BinaryField(default=b'')
+    products = models.BinaryField(default=b'')
+    # Misra-Gries summary of quantity per product: {"<product id>": count}
+    heavy_hitters = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.day}: {self.invoices} invoices, {self.lines} lines"
@@ -0,0 +1,123 @@
+"""Exact invoice arithmetic in integer minor units (paise / cents).
+
+Amounts are converted once to ints of minor units and tax rates to ints of
+hundredths of a percent (18.00% -> 1800). Line amounts, taxes and totals are
+then plain int arithmetic over whole lists of lines, and Decimals only appear
+again when results are written to DecimalFields.
+
+Rounding is half-up (away from zero) to the minor unit. With
+`settings.INVOICE_TAX_ROUNDING = 'line'` (the default) each line's tax is
+rounded on its own and the invoice tax is their sum. With 'invoice' the
+unrounded line taxes are summed and rounded once, and that total is spread
+back over the lines (largest remainder), so the stored line taxes still add up
+exactly.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+
+MINOR_DIGITS = 2
+SCALE = 10 ** MINOR_DIGITS
+# tax rates are percentages with two decimals: amount * rate / RATE_SCALE
+RATE_SCALE = 100 * 100
+
+LINE = 'line'
+INVOICE = 'invoice'
+
+InvoiceTotals = namedtuple('InvoiceTotals', 'line_totals line_taxes subtotal tax_total customs_duty shipping total')
+
+
+def _parse_fixed(value, digits):
+    """int(value * 10**digits) for int / str / Decimal input; ValueError if that is not exact."""
+    if isinstance(value, bool):
+        raise ValueError(f'Not an amount: {value!r}')
+    if isinstance(value, int):
+        return value * 10 ** digits
+    if isinstance(value, Decimal):
+        sign, coeff, exp = value.as_tuple()
+        if not isinstance(exp, int):
+            raise ValueError(f'Not an amount: {value!r}')
+        n = int(''.join(map(str, coeff)) or 0)
+        shift = exp + digits
+        if shift >= 0:
+            n *= 10 ** shift
+        else:
+            n, rest = divmod(n, 10 ** -shift)
+            if rest:
+                raise ValueError(f'{value} has more than {digits} decimal places')
+        return -n if sign else n
+    text = str(value).strip()
+    sign = 1
+    if text and text[0] in '+-':
+        sign, text = (-1 if text[0] == '-' else 1), text[1:]
+    whole, _, frac = text.partition('.')
+    if not (whole or frac) or not (whole or '0').isdigit() or (frac and not frac.isdigit()):
+        raise ValueError(f'Not an amount: {value!r}')
+    frac = frac.rstrip('0')
+    if len(frac) > digits:
+        raise ValueError(f'{value} has more than {digits} decimal places')
+    return sign * (int(whole or 0) * 10 ** digits + int(frac.ljust(digits, '0') or 0))
+
+
+def to_minor(value):
+    """'12.34' / Decimal('12.34') / 12 -> 1234 / 1234 / 1200; None counts as zero."""
+    return 0 if value is None else _parse_fixed(value, MINOR_DIGITS)
+
+
+def to_rate(percent):
+    """Tax percentage -> hundredths of a percent: '18' -> 1800, '5.25' -> 525."""
+    return 0 if percent is None else _parse_fixed(percent, 2)
+
+
+def to_decimal(minor):
+    """1234 -> Decimal('12.34'), exactly."""
+    return Decimal(minor).scaleb(-MINOR_DIGITS)
+
+
+def div_round(n, d):
+    """n / d rounded half away from zero, for int n and positive int d."""
+    q = (2 * abs(n) + d) // (2 * d)
+    return q if n >= 0 else -q
+
+
+def _spread(raw, total):
+    """Round `raw` (numerators over RATE_SCALE) to ints summing to `total`, by largest remainder."""
+    floors = [r // RATE_SCALE for r in raw]
+    missing = total - sum(floors)
+    if missing:
+        order = sorted(range(len(raw)), key=lambda i: raw[i] % RATE_SCALE, reverse=True)
+        for i in order[:missing]:
+            floors[i] += 1
+    return floors
+
+
+def compute_invoice(quantities, prices, rates, customs_duty=0, shipping=0, rounding=None):
+    """Totals for an invoice, all in minor units.
+
+    `quantities`, `prices` (minor units) and `rates` (see to_rate) are parallel
+    sequences, one entry per line. Duty and shipping are invoice-level amounts
+    in minor units added after tax.
+    """
+    rounding = rounding or getattr(settings, 'INVOICE_TAX_ROUNDING', LINE)
+    line_totals = [q * p for q, p in zip(quantities, prices)]
+    # unrounded tax, as a numerator over RATE_SCALE
+    raw = [n * r for n, r in zip(line_totals, rates)]
+    if rounding == INVOICE:
+        tax_total = div_round(sum(raw), RATE_SCALE)
+        line_taxes = _spread(raw, tax_total)
+    elif rounding == LINE:
+        line_taxes = [div_round(r, RATE_SCALE) for r in raw]
+        tax_total = sum(line_taxes)
+    else:
+        raise ValueError(f'Unknown INVOICE_TAX_ROUNDING {rounding!r}')
+    subtotal = sum(line_totals)
+    return InvoiceTotals(
+        line_totals=line_totals,
+        line_taxes=line_taxes,
+        subtotal=subtotal,
+        tax_total=tax_total,
+        customs_duty=customs_duty,
+        shipping=shipping,
+        total=subtotal + tax_total + customs_duty + shipping,
+    )
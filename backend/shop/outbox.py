@@ -0,0 +1,196 @@
+"""Transactional outbox for invoice and stock events.
+
+`record()` must be called inside the transaction that makes the change, so an
+event exists exactly when the change was committed. Consumers then either
+page through `/api/events/?after=<cursor>` or receive batches POSTed by the
+`deliver_outbox` management command to `settings.OUTBOX_WEBHOOK_URLS`.
+Committed events are also pushed to live dashboards (shop/live.py).
+
+Delivery is at-least-once and in id order: a failing batch is retried with
+exponential backoff before anything newer is sent, and consumers should
+de-duplicate on the event `id`. Several delivery workers may run: the worker
+that claims the oldest undelivered event (an atomic UPDATE setting its
+`next_attempt_at` to a lease) sends the batch, the others wait, so no event
+is posted by two workers at once. Delivered events are deleted after
+OUTBOX_RETENTION_DAYS (prune()).
+
+The `after` cursor of /api/events/ is the event id. Ids are assigned when the
+row is inserted but become visible when the transaction commits, so with
+concurrent writers an event can commit after one with a higher id and a
+consumer that already moved past it never sees it. The cursor is only safe
+with a single writer (SQLite, which serializes write transactions, or the
+group-commit invoice writer of shop/writer.py); other setups should re-read a
+margin behind their cursor and de-duplicate on `id`.
+"""
+import hashlib
+import hmac
+import json
+import random
+import urllib.error
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import live
+from .models import OutboxEvent
+
+INVOICE_CREATED = 'invoice.created'
+STOCK_ADJUSTED = 'stock.adjusted'
+# bulk stock counts: one event per batch of adjustments instead of one per row
+STOCK_BATCH_ADJUSTED = 'stock.batch_adjusted'
+
+
+def record(topic, payload, object_id=''):
+    """Queue an event; call inside the transaction that performs the change.
+
+    Once the transaction commits the event is also pushed to live dashboards.
+    """
+    event = OutboxEvent.objects.create(topic=topic, object_id=str(object_id), payload=payload)
+    transaction.on_commit(lambda: live.publish_outbox_event(event), robust=True)
+    return event
+
+
+def invoice_payload(invoice, items):
+    """Event body for a new invoice; `items` are the InvoiceItem rows just written."""
+    return {
+        'id': invoice.id,
+        'invoice_no': invoice.invoice_no,
+        'date': invoice.date,
+        'subtotal': invoice.subtotal,
+        'tax_amount': invoice.tax_amount,
+        'customs_duty': invoice.customs_duty,
+        'shipping_charges': invoice.shipping_charges,
+        'total': invoice.total,
+        'status': invoice.status,
+        'created_by': invoice.created_by_id,
+        'customer': invoice.customer_id,
+        'items': [
+            {'product': it.product_id, 'quantity': it.quantity, 'price': it.price, 'line_total': it.line_total,
+             'tax_percent': it.tax_percent, 'tax_amount': it.tax_amount}
+            for it in items
+        ],
+    }
+
+
+def stock_adjustment_payload(adjustment):
+    return {
+        'id': adjustment.id,
+        'product': adjustment.product_id,
+        'change': adjustment.change,
+        'reason': adjustment.reason,
+        'created_by': adjustment.created_by_id,
+        'created_at': adjustment.created_at,
+    }
+
+
+def stock_batch_payload(adjustments, mode):
+    first = adjustments[0]
+    return {
+        'mode': mode,
+        'created_by': first.created_by_id,
+        'created_at': first.created_at,
+        'adjustments': [
+            {'id': a.id, 'product': a.product_id, 'change': a.change, 'reason': a.reason}
+            for a in adjustments
+        ],
+    }
+
+
+def serialize(event):
+    return {
+        'id': event.id,
+        'topic': event.topic,
+        'object_id': event.object_id,
+        'created_at': event.created_at,
+        'payload': event.payload,
+    }
+
+
+def backoff(attempts, base=None, cap=None):
+    """Seconds to wait after `attempts` failures: exponential, capped, with jitter."""
+    base = base if base is not None else getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 2)
+    cap = cap if cap is not None else getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def post_batch(url, body, timeout=10):
+    """POST one JSON batch; raises on network errors and non-2xx responses."""
+    headers = {'Content-Type': 'application/json'}
+    secret = getattr(settings, 'OUTBOX_WEBHOOK_SECRET', '')
+    if secret:
+        digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+        headers['X-Outbox-Signature'] = f'sha256={digest}'
+    req = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        if not 200 <= resp.getcode() < 300:
+            raise urllib.error.HTTPError(url, resp.getcode(), 'Unexpected status', resp.headers, None)
+
+
+def _claim(head, lease_seconds, now):
+    """Lease the oldest undelivered event to this worker; False when another worker holds it
+    or has delivered it meanwhile.
+    """
+    due = Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now)
+    return OutboxEvent.objects.filter(due, pk=head.pk, delivered_at__isnull=True).update(
+        next_attempt_at=now + timedelta(seconds=lease_seconds)) == 1
+
+
+def deliver_pending(urls, batch_size=100, timeout=10):
+    """Send the oldest undelivered events to every webhook URL as one batch.
+
+    Returns (delivered_count, seconds_to_wait). On failure the batch is kept,
+    its attempt counters are bumped and the wait is the backoff before retry.
+    The batch is only sent after claiming its first event, so concurrent
+    workers never post the same events; a worker that dies mid-batch leaves
+    the claim to expire after the HTTP timeouts.
+    """
+    batch = list(OutboxEvent.objects.filter(delivered_at__isnull=True).order_by('id')[:batch_size])
+    if not batch:
+        return 0, None
+
+    now = timezone.now()
+    head = batch[0]
+    if head.next_attempt_at and head.next_attempt_at > now:
+        return 0, (head.next_attempt_at - now).total_seconds()
+    lease = timeout * (len(urls) + 1)
+    if not _claim(head, lease, now):
+        # another worker is sending this batch (or just has)
+        return 0, getattr(settings, 'OUTBOX_CLAIM_RETRY_SECONDS', 1)
+
+    body = json.dumps({'events': [serialize(e) for e in batch]}, cls=DjangoJSONEncoder).encode('utf-8')
+    ids = [e.id for e in batch]
+    try:
+        for url in urls:
+            post_batch(url, body, timeout=timeout)
+    except Exception as exc:
+        attempts = head.attempts + 1
+        wait = backoff(attempts)
+        OutboxEvent.objects.filter(id__in=ids).update(
+            attempts=attempts,
+            next_attempt_at=now + timedelta(seconds=wait),
+            last_error=str(exc)[:1000],
+        )
+        return 0, wait
+
+    OutboxEvent.objects.filter(id__in=ids).update(delivered_at=timezone.now(), next_attempt_at=None, last_error='')
+    return len(ids), 0
+
+
+def prune(days=None):
+    """Delete events older than `days` (default OUTBOX_RETENTION_DAYS); returns how many.
+
+    With webhooks configured only delivered events go; without, events only
+    serve the /api/events/ feed and are dropped by age alone.
+    """
+    days = getattr(settings, 'OUTBOX_RETENTION_DAYS', 7) if days is None else days
+    qs = OutboxEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=days))
+    if getattr(settings, 'OUTBOX_WEBHOOK_URLS', []):
+        qs = qs.filter(delivered_at__isnull=False)
+    deleted, _ = qs.delete()
+    return deleted
@@ -0,0 +1,217 @@
+"""Ad-hoc group-by over invoice lines for /api/reports/pivot/.
+
+A request names up to MAX_DIMENSIONS dimensions and any measures from the
+whitelists below; they become one `GROUP BY` query per invoice/line table
+pair the date range touches (see archive.sources()), with date dimensions
+bucketed in SQL. The result is columnar: one list per dimension and per
+measure, row i being the i-th entry of every list, plus labels for id
+dimensions (product / user / customer names). Results are cached for
+PIVOT_CACHE_SECONDS under a hash of the normalized request and data scope.
+"""
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import CharField, Count, F, Func, Sum, Value
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import archive
+from .models import Customer, Product
+from .reports import day_start, money, parse_date
+
+MAX_DIMENSIONS = 2
+
+# name -> (lookup on the line model, (model, field) that labels the ids)
+DIMENSIONS = {
+    'product': ('product_id', (Product, 'name')),
+    'hs_code': ('product__hs_code', None),
+    'status': ('invoice__status', None),
+    'user': ('invoice__created_by_id', (get_user_model(), 'username')),
+    'customer': ('invoice__customer_id', (Customer, 'name')),
+}
+DATE_DIMENSIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+# name -> (aggregate, is money)
+MEASURES = {
+    'sales': (lambda: Sum('line_total'), True),
+    'tax': (lambda: Sum('tax_amount'), True),
+    'quantity': (lambda: Sum('quantity'), False),
+    'lines': (lambda: Count('id'), False),
+    'invoices': (lambda: Count('invoice_id', distinct=True), False),
+}
+DEFAULT_MEASURES = ['sales', 'quantity']
+LIST_FILTERS = {'status': 'invoice__status', 'product': 'product_id', 'customer': 'invoice__customer_id'}
+
+
+class PivotError(ValueError):
+    pass
+
+
+def _split(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def parse(params):
+    """Query params -> normalized spec (a plain dict, usable as a cache key)."""
+    dims = _split(params.get('dimensions'))
+    if not dims:
+        raise PivotError('Give 1 to %d `dimensions`.' % MAX_DIMENSIONS)
+    if len(dims) > MAX_DIMENSIONS or len(set(dims)) != len(dims):
+        raise PivotError('Give at most %d distinct `dimensions`.' % MAX_DIMENSIONS)
+    known = list(DIMENSIONS) + list(DATE_DIMENSIONS)
+    for d in dims:
+        if d not in known:
+            raise PivotError(f'Unknown dimension {d!r}; use one of: {", ".join(known)}.')
+    if len([d for d in dims if d in DATE_DIMENSIONS]) > 1:
+        raise PivotError('Use at most one date dimension.')
+    measures = _split(params.get('measures')) or DEFAULT_MEASURES
+    for m in measures:
+        if m not in MEASURES:
+            raise PivotError(f'Unknown measure {m!r}; use one of: {", ".join(MEASURES)}.')
+
+    filters = {}
+    try:
+        for name in ('start_date', 'end_date'):
+            if params.get(name):
+                filters[name] = parse_date(params[name]).isoformat()
+        for name in LIST_FILTERS:
+            values = _split(params.get(name))
+            if values:
+                filters[name] = sorted({v.upper() for v in values} if name == 'status' else {int(v) for v in values})
+    except ValueError:
+        raise PivotError('Dates are YYYY-MM-DD; `product` and `customer` take ids.')
+    if params.get('hs_code'):
+        filters['hs_code'] = params['hs_code'].strip()
+    return {'dimensions': dims, 'measures': list(dict.fromkeys(measures)), 'filters': filters}
+
+
+def _lines(item_model, filters, scope):
+    qs = item_model.objects.all()
+    if scope is not None:
+        qs = qs.filter(invoice__created_by=scope)
+    # aware datetime bounds rather than `date__date`, which SQLite evaluates per row in Python
+    if filters.get('start_date'):
+        qs = qs.filter(invoice__date__gte=day_start(parse_date(filters['start_date'])))
+    if filters.get('end_date'):
+        qs = qs.filter(invoice__date__lt=day_start(parse_date(filters['end_date']) + timedelta(days=1)))
+    for name, lookup in LIST_FILTERS.items():
+        if name in filters:
+            qs = qs.filter(**{f'{lookup}__in': filters[name]})
+    if 'hs_code' in filters:
+        # prefix range rather than LIKE, as in the customer typeahead
+        prefix = filters['hs_code']
+        qs = qs.filter(product__hs_code__gte=prefix, product__hs_code__lt=prefix + '\uffff')
+    return qs
+
+
+def _fixed_offset_minutes():
+    """UTC offset of the current time zone in minutes if it has no DST, else None."""
+    tz = timezone.get_current_timezone()
+    year = timezone.now().year
+    offsets = {tz.utcoffset(datetime(y, m, 1)) for y in (year - 1, year) for m in (1, 4, 7, 10)}
+    return int(offsets.pop().total_seconds() // 60) if len(offsets) == 1 else None
+
+
+def date_bucket(kind):
+    """SQL expression for the local-time bucket of the invoice date.
+
+    Django's Trunc functions on SQLite call back into Python for every row; in
+    a zone without DST the same bucket is a native date()/strftime() call with
+    a fixed offset, several times faster. Quarters are grouped by month here
+    and folded by _fold_quarter().
+    """
+    offset = _fixed_offset_minutes() if connection.vendor == 'sqlite' else None
+    if offset is None:
+        return DATE_DIMENSIONS[kind]('invoice__date')
+    shift = Value(f'{offset:+d} minutes')
+    if kind == 'week':
+        # Monday of the week: back six days, then forward to the next Monday
+        return Func(F('invoice__date'), shift, Value('-6 days'), Value('weekday 1'),
+                    function='date', output_field=CharField())
+    fmt = {'day': '%Y-%m-%d', 'month': '%Y-%m-01', 'quarter': '%Y-%m-01', 'year': '%Y-01-01'}[kind]
+    return Func(Value(fmt), F('invoice__date'), shift, function='strftime', output_field=CharField())
+
+
+def group_key(lookup):
+    if connection.vendor == 'sqlite':
+        # unary + keeps SQLite from walking the FK index in key order, which
+        # turns the scan into random row lookups; a table scan plus a sort is faster
+        return Func(F(lookup), template='+%(expressions)s')
+    return F(lookup)
+
+
+def _bucket(value, kind=None):
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str) and kind in DATE_DIMENSIONS:
+        value = date.fromisoformat(value)
+    if kind == 'quarter' and value is not None:
+        value = value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    return value
+
+
+def run(spec, scope=None):
+    """Execute a parsed spec; `scope` limits it to one user's invoices."""
+    dims, measures, filters = spec['dimensions'], spec['measures'], spec['filters']
+    group = {f'd_{d}': date_bucket(d) if d in DATE_DIMENSIONS else group_key(DIMENSIONS[d][0]) for d in dims}
+    aggregates = {f'm_{m}': MEASURES[m][0]() for m in measures}
+
+    merged = {}
+    sd, ed = parse_date(filters.get('start_date')), parse_date(filters.get('end_date'))
+    for _, item_model in archive.sources(sd, ed):
+        qs = _lines(item_model, filters, scope).annotate(**group)
+        for row in qs.order_by().values_list(*group).annotate(**aggregates):
+            # several SQL groups can fold into one key (quarters, archive + live tables)
+            key = tuple(_bucket(v, d) for v, d in zip(row, dims))
+            values = row[len(dims):]
+            prev = merged.get(key)
+            merged[key] = values if prev is None else tuple((a or 0) + (b or 0) for a, b in zip(prev, values))
+
+    keys = sorted(merged, key=lambda k: tuple((v is None, v if v is not None else '') for v in k))
+    columns = {}
+    for i, d in enumerate(dims):
+        columns[d] = [k[i].isoformat() if hasattr(k[i], 'isoformat') else k[i] for k in keys]
+    for j, m in enumerate(measures):
+        is_money = MEASURES[m][1]
+        columns[m] = [money(merged[k][j]) if is_money else int(merged[k][j] or 0) for k in keys]
+
+    labels = {}
+    for i, d in enumerate(dims):
+        label = DIMENSIONS.get(d, (None, None))[1]
+        if label is not None:
+            label_model, field = label
+            ids = {k[i] for k in keys if k[i] is not None}
+            labels[d] = {str(pk): name for pk, name in
+                         label_model.objects.filter(pk__in=ids).values_list('pk', field)} if ids else {}
+
+    return {
+        'dimensions': dims,
+        'measures': measures,
+        'filters': filters,
+        'row_count': len(keys),
+        'columns': columns,
+        'labels': labels,
+        'generated_at': timezone.now(),
+    }
+
+
+def cached_run(spec, scope=None):
+    """run() through the cache; returns (result, hit)."""
+    signature = json.dumps({'spec': spec, 'scope': scope.pk if scope is not None else None}, sort_keys=True)
+    key = 'pivot:' + hashlib.sha256(signature.encode('utf-8')).hexdigest()
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    result = run(spec, scope)
+    cache.set(key, result, getattr(settings, 'PIVOT_CACHE_SECONDS', 60))
+    return result, False
@@ -0,0 +1,253 @@
+"""Price lists: repricing the catalog from PriceRules.
+
+A product gets the first rule of the list (by position) whose filters all
+match it: SKU prefix, HS code prefix (dots, spaces and dashes ignored) and
+explicit product ids; a rule without filters matches every product. Prices
+are worked in integer minor units like invoice amounts (shop/money.py): a
+percentage rule gives price * (100% + value) rounded half-up, an amount rule
+price + value, and neither goes below zero.
+
+apply() turns the list into one CASE expression over those filters and runs
+it on the products in primary-key ranges of CHUNK_IDS. Per range, one
+INSERT ... SELECT writes the PriceHistory rows and one UPDATE sets price,
+price_list, revision and updated_at on the products whose price changes, so
+nothing goes through Python per product; the whole list commits as one
+transaction. preview() works out the same prices with NumPy over the
+catalog and writes nothing.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from . import money
+from .models import PriceHistory, PriceList, PriceRule, Product, next_revisions
+
+CHUNK_IDS = 50000
+# percent rules multiply minor units by (RATE_SCALE + rate) / RATE_SCALE
+HALF = money.RATE_SCALE // 2
+
+
+class PricingError(Exception):
+    pass
+
+
+def _qn(name):
+    return connection.ops.quote_name(name)
+
+
+def _minor_sql():
+    return f'CAST(ROUND({_qn("price")} * {money.SCALE}) AS BIGINT)'
+
+
+def _hs_sql():
+    hs = f"COALESCE({_qn('hs_code')}, '')"
+    for ch in '. -':
+        hs = f"REPLACE({hs}, '{ch}', '')"
+    return hs
+
+
+def _hs_digits(value):
+    value = value or ''
+    for ch in '. -':
+        value = value.replace(ch, '')
+    return value
+
+
+def _rules(price_list):
+    rules = list(price_list.rules.all())
+    if not rules:
+        raise PricingError('The price list has no rules.')
+    return rules
+
+
+def _rule_sql(rule, lo, hi):
+    """(condition, expression) SQL with params for products lo..hi, or None if the rule
+    cannot match any of them.
+    """
+    conds, params = [], []
+    if rule.sku_prefix:
+        conds.append(f'SUBSTR({_qn("sku")}, 1, %s) = %s')
+        params += [len(rule.sku_prefix), rule.sku_prefix]
+    if rule.hs_prefix:
+        conds.append(f'SUBSTR({_hs_sql()}, 1, %s) = %s')
+        params += [len(rule.hs_prefix), rule.hs_prefix]
+    if rule.product_ids:
+        ids = sorted({pk for pk in rule.product_ids if lo <= pk <= hi})
+        if not ids:
+            return None
+        conds.append(f'{_qn("id")} IN ({", ".join(["%s"] * len(ids))})')
+        params += ids
+
+    m = _minor_sql()
+    if rule.kind == PriceRule.PERCENT:
+        expr = f'({m} * %s + %s) / %s'
+        expr_params = [money.RATE_SCALE + money.to_rate(rule.value), HALF, money.RATE_SCALE]
+    else:
+        expr = f'CASE WHEN {m} + %s < 0 THEN 0 ELSE {m} + %s END'
+        expr_params = [money.to_minor(rule.value)] * 2
+    return ' AND '.join(conds) or '1 = 1', params, expr, expr_params
+
+
+def _case_sql(rules, lo, hi):
+    """New price in minor units for products lo..hi: CASE WHEN <rule> THEN <price> ... END
+    (NULL where no rule matches), or (None, None) if no rule can match there.
+    """
+    parts, params = [], []
+    for rule in rules:
+        sql = _rule_sql(rule, lo, hi)
+        if sql is None:
+            continue
+        cond, cond_params, expr, expr_params = sql
+        parts.append(f'WHEN {cond} THEN {expr}')
+        params += cond_params + expr_params
+    if not parts:
+        return None, None
+    return f'CASE {" ".join(parts)} END', params
+
+
+def apply(price_list, user=None, force=False):
+    """Reprice the catalog with `price_list`; returns the number of products changed.
+
+    Raises PricingError if the list was already applied, has no rules, or
+    takes effect later (unless `force`).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        price_list = PriceList.objects.select_for_update().get(pk=price_list.pk)
+        if price_list.applied_at is not None:
+            raise PricingError(f'Price list "{price_list.name}" was already applied on {price_list.applied_at:%Y-%m-%d}.')
+        if price_list.effective_from > timezone.localdate() and not force:
+            raise PricingError(f'Price list "{price_list.name}" takes effect on {price_list.effective_from}.')
+        rules = _rules(price_list)
+
+        product_table, history_table = _qn(Product._meta.db_table), _qn(PriceHistory._meta.db_table)
+        pk, m = _qn('id'), _minor_sql()
+        updated_at = Product._meta.get_field('updated_at').get_db_prep_value(now, connection)
+        changed_at = PriceHistory._meta.get_field('changed_at').get_db_prep_value(now, connection)
+        bounds = Product.objects.aggregate(lo=Min('id'), hi=Max('id'))
+        changed = 0
+        with connection.cursor() as cursor:
+            for lo in range(bounds['lo'] or 0, (bounds['hi'] or -1) + 1, CHUNK_IDS):
+                hi = lo + CHUNK_IDS - 1
+                case, case_params = _case_sql(rules, lo, hi)
+                if case is None:
+                    continue
+                where = f'{pk} BETWEEN %s AND %s AND {case} <> {m}'
+                where_params = [lo, hi] + case_params
+                cursor.execute(
+                    f'INSERT INTO {history_table} ({_qn("product_id")}, {_qn("old_price")}, {_qn("new_price")}, '
+                    f'{_qn("price_list_id")}, {_qn("changed_by_id")}, {_qn("changed_at")}) '
+                    f'SELECT {pk}, {_qn("price")}, {case} / {money.SCALE}.0, %s, %s, %s FROM {product_table} '
+                    f'WHERE {where}',
+                    case_params + [price_list.pk, user.pk if user else None, changed_at] + where_params,
+                )
+                cursor.execute(
+                    f'SELECT MIN({_qn("product_id")}), MAX({_qn("product_id")}), COUNT(*) FROM {history_table} '
+                    f'WHERE {_qn("price_list_id")} = %s AND {_qn("product_id")} BETWEEN %s AND %s',
+                    [price_list.pk, lo, hi],
+                )
+                first_id, last_id, count = cursor.fetchone()
+                if not count:
+                    continue
+                # a block of catalog revisions covering the changed ids: revision = id + offset
+                offset = next_revisions(last_id - first_id + 1) - last_id
+                cursor.execute(
+                    f'UPDATE {product_table} SET {_qn("price")} = {case} / {money.SCALE}.0, '
+                    f'{_qn("price_list_id")} = %s, {_qn("revision")} = {pk} + %s, {_qn("updated_at")} = %s '
+                    f'WHERE {where}',
+                    case_params + [price_list.pk, offset, updated_at] + where_params,
+                )
+                changed += count
+
+        price_list.applied_at = now
+        price_list.applied_by = user
+        price_list.products_changed = changed
+        price_list.save(update_fields=['applied_at', 'applied_by', 'products_changed', 'updated_at'])
+    return changed
+
+
+def _load_catalog(need_hs):
+    """Parallel (ids, minor-unit prices, skus, normalized HS codes or None) for every product."""
+    columns = [_qn('id'), _minor_sql(), _qn('sku')] + ([_qn('hs_code')] if need_hs else [])
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(columns)} FROM {_qn(Product._meta.db_table)} ORDER BY {_qn("id")}')
+        rows = cursor.fetchall()
+    if not rows:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), [], [] if need_hs else None
+    cols = list(zip(*rows))
+    hs = [_hs_digits(v) for v in cols[3]] if need_hs else None
+    return np.array(cols[0], np.int64), np.array(cols[1], np.int64), cols[2], hs
+
+
+def _startswith(values, prefix):
+    return np.fromiter((v.startswith(prefix) for v in values), bool, len(values))
+
+
+def new_prices(rules, ids, prices, skus, hs_codes):
+    """(index of the matching rule or -1, new price) per product, in minor units; the
+    NumPy twin of the CASE expression apply() runs.
+    """
+    chosen = np.full(len(ids), -1, np.int32)
+    new = prices.copy()
+    for i, rule in enumerate(rules):
+        mask = chosen < 0
+        if rule.sku_prefix:
+            mask &= _startswith(skus, rule.sku_prefix)
+        if rule.hs_prefix:
+            mask &= _startswith(hs_codes, rule.hs_prefix)
+        if rule.product_ids:
+            mask &= np.isin(ids, np.array(rule.product_ids, np.int64))
+        chosen[mask] = i
+        if rule.kind == PriceRule.PERCENT:
+            factor = money.RATE_SCALE + money.to_rate(rule.value)
+            new[mask] = (prices[mask] * factor + HALF) // money.RATE_SCALE
+        else:
+            new[mask] = np.maximum(prices[mask] + money.to_minor(rule.value), 0)
+    return chosen, new
+
+
+def preview(price_list, limit=100):
+    """What apply() would do, without writing: counts per rule, catalog price sums
+    before and after, and the first `limit` changes by product id.
+    """
+    rules = _rules(price_list)
+    ids, prices, skus, hs_codes = _load_catalog(any(rule.hs_prefix for rule in rules))
+    chosen, new = new_prices(rules, ids, prices, skus, hs_codes)
+    changed = (chosen >= 0) & (new != prices)
+    sample = np.flatnonzero(changed)[:limit]
+    d = money.to_decimal
+    pct = (new[changed] - prices[changed]) / np.maximum(prices[changed], 1) * 100
+    return {
+        'price_list': price_list.pk,
+        'name': price_list.name,
+        'effective_from': price_list.effective_from,
+        'applied_at': price_list.applied_at,
+        'products': len(ids),
+        'products_matched': int((chosen >= 0).sum()),
+        'products_changed': int(changed.sum()),
+        'rules': [
+            {'id': rule.id, 'position': rule.position, 'matched': int((chosen == i).sum()),
+             'changed': int((changed & (chosen == i)).sum())}
+            for i, rule in enumerate(rules)
+        ],
+        # over the changed products only
+        'price_sum_before': d(int(prices[changed].sum())),
+        'price_sum_after': d(int(new[changed].sum())),
+        'min_change_percent': round(float(pct.min()), 2) if len(pct) else None,
+        'max_change_percent': round(float(pct.max()), 2) if len(pct) else None,
+        'changes': [
+            {'product': int(ids[i]), 'sku': skus[i], 'old_price': d(int(prices[i])), 'new_price': d(int(new[i])),
+             'rule': rules[chosen[i]].id}
+            for i in sample
+        ],
+    }
+
+
+def record_edit(product, old_price, user=None):
+    """History row for a price set by hand (API or admin); call after saving `product`."""
+    if product.price is not None and Decimal(product.price) != Decimal(old_price):
+        PriceHistory.objects.create(product=product, old_price=old_price, new_price=product.price,
+                                    changed_by=user if user and user.is_authenticated else None)
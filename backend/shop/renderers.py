@@ -0,0 +1,127 @@
+"""Fast JSON renderer / parser for the API.
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise; both paths produce the same output. `Decimal` values (money) are
+written as exact decimal strings, the same way DRF serializers already render
+`DecimalField`, so report endpoints can return aggregates without converting
+them through float. Dates, times and datetimes follow DRF's format (ISO 8601,
+"...Z" for UTC).
+"""
+import datetime
+import decimal
+import json
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.utils import encoders
+from rest_framework.utils import json as drf_json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _datetime(obj):
+    representation = obj.isoformat()
+    if representation.endswith('+00:00'):
+        representation = representation[:-6] + 'Z'
+    return representation
+
+
+def _default(obj):
+    """Types orjson does not handle (or that we format like DRF does)."""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        return _datetime(obj)
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class MoneyJSONEncoder(encoders.JSONEncoder):
+    """DRF's encoder, but Decimals stay exact (as strings) instead of becoming floats."""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return str(obj)
+        return super().default(obj)
+
+
+if orjson is not None:
+    ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_SERIALIZE_NUMPY
+    )
+    # orjson imports numpy the first time it meets a non-native type with
+    # OPT_SERIALIZE_NUMPY; a thread doing the same while that import runs
+    # aborts the process, so do it once here, under the import lock
+    orjson.dumps(decimal.Decimal(0), default=str, option=ORJSON_OPTIONS)
+
+
+def dumps(data, indent=None):
+    """Serialize `data` to JSON bytes (compact unless `indent` is given)."""
+    if orjson is not None and indent in (None, 2):
+        options = ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            ret = orjson.dumps(data, default=_default, option=options)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits; let the stdlib path decide
+            ret = None
+        if ret is not None:
+            if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+                ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+            return ret
+
+    separators = (',', ': ') if indent is not None else (',', ':')
+    ret = json.dumps(data, cls=MoneyJSONEncoder, indent=indent, ensure_ascii=False, separators=separators)
+    # keep the output a strict JavaScript subset, as DRF does
+    ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+    return ret.encode()
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """Drop-in replacement for DRF's JSONRenderer."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(data, indent=indent)
+
+
+class FastJSONParser(JSONParser):
+    """Drop-in replacement for DRF's JSONParser."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            raw = stream.read() if stream is not None else b''
+            if orjson is not None and encoding.lower().replace('-', '') == 'utf8':
+                return orjson.loads(raw)
+            parse_constant = drf_json.strict_constant if self.strict else None
+            return json.loads(raw.decode(encoding), parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
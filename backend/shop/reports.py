@@ -0,0 +1,234 @@
+"""Report builders shared by the report endpoints and the background job worker.
+
+Closed financial years may have been moved to the archive tables (see
+shop/archive.py); each report asks archive.sources() which table pairs its date
+range touches and merges the per-table results.
+"""
+import csv
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, Sum, Value, When
+from django.utils import timezone
+
+from . import archive
+from .models import Product
+
+CENT = Decimal('0.01')
+
+
+def money(value):
+    """Exact 2-dp Decimal for a money amount; rendered as a decimal string, never via float."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value or 0))
+    return value.quantize(CENT)
+
+def parse_date(value):
+    """YYYY-MM-DD to a date (None for empty values); raises ValueError otherwise."""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def day_start(day):
+    """Aware datetime at local midnight starting `day`."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _month_start(day, months_back=0):
+    index = day.year * 12 + day.month - 1 - months_back
+    return day.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def bucket_totals(edges, scope=None):
+    """(sales, invoice counts) per bucket [edges[i], edges[i + 1]) of the sorted dates `edges`.
+
+    Rows are bucketed by a CASE over local-midnight bounds, oldest first, so the
+    date index bounds the scan and nothing is evaluated per row in Python; one
+    GROUP BY per invoice table the range touches. `scope` limits it to one user's invoices.
+    """
+    bucket = Case(*[When(date__lt=day_start(edge), then=Value(i - 1)) for i, edge in enumerate(edges[1:], 1)],
+                  output_field=IntegerField())
+    sales, count = [0] * (len(edges) - 1), [0] * (len(edges) - 1)
+    for invoice_model, _ in archive.sources(edges[0], edges[-1] - timedelta(days=1)):
+        qs = invoices_in_range(invoice_model, edges[0], edges[-1] - timedelta(days=1), scope)
+        for row in qs.annotate(bucket=bucket).values('bucket').annotate(sales=Sum('total'), n=Count('id')).order_by():
+            sales[row['bucket']] += row['sales'] or 0
+            count[row['bucket']] += row['n']
+    return sales, count
+
+
+def invoices_in_range(invoice_model, sd=None, ed=None, user=None):
+    """`invoice_model` rows in the inclusive date range, limited to `user`'s invoices when given."""
+    qs = invoice_model.objects.all()
+    if user is not None:
+        qs = qs.filter(created_by=user)
+    # aware datetime bounds rather than `date__date`, which SQLite evaluates per row in Python
+    if sd:
+        qs = qs.filter(date__gte=day_start(sd))
+    if ed:
+        qs = qs.filter(date__lt=day_start(ed + timedelta(days=1)))
+    return qs
+
+
+def _split(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def filter_invoices(qs, params):
+    """Apply invoice list filters from query params; raises ValueError on bad values.
+
+    status=PAID[,DRAFT]    min_total= / max_total=    created_by=<user id>[,...]
+    invoice_no=<prefix>    start_date= / end_date= (YYYY-MM-DD, inclusive)
+    product=<id>[,...]     hs_code=<prefix>
+
+    Each is an indexed comparison on the invoice row (see the Invoice indexes)
+    or, for product and HS code, an EXISTS over the invoice's lines, so an
+    invoice with several matching lines is still returned once.
+    """
+    statuses = _split(params.get('status'))
+    if statuses:
+        qs = qs.filter(status__in=[s.upper() for s in statuses])
+    try:
+        if params.get('min_total'):
+            qs = qs.filter(total__gte=Decimal(params['min_total']))
+        if params.get('max_total'):
+            qs = qs.filter(total__lte=Decimal(params['max_total']))
+    except InvalidOperation:
+        raise ValueError('`min_total` and `max_total` must be amounts.')
+    try:
+        creators = [int(v) for v in _split(params.get('created_by'))]
+        products = [int(v) for v in _split(params.get('product'))]
+    except ValueError:
+        raise ValueError('`created_by` and `product` take ids.')
+    if creators:
+        qs = qs.filter(created_by_id__in=creators)
+    prefix = (params.get('invoice_no') or '').strip().upper()
+    if prefix:
+        # a range on the unique index rather than LIKE
+        qs = qs.filter(invoice_no__gte=prefix, invoice_no__lt=prefix + '\uffff')
+    try:
+        sd, ed = parse_date(params.get('start_date')), parse_date(params.get('end_date'))
+    except ValueError:
+        raise ValueError('Invalid date format, use YYYY-MM-DD.')
+    if sd:
+        qs = qs.filter(date__gte=day_start(sd))
+    if ed:
+        qs = qs.filter(date__lt=day_start(ed + timedelta(days=1)))
+
+    item_model = qs.model._meta.get_field('items').related_model
+    if products:
+        qs = qs.filter(Exists(item_model.objects.filter(invoice=OuterRef('pk'), product_id__in=products)))
+    hs_code = (params.get('hs_code') or '').strip()
+    if hs_code:
+        lines = item_model.objects.filter(invoice=OuterRef('pk'), product__in=Product.objects.filter(
+            hs_code__gte=hs_code, hs_code__lt=hs_code + '\uffff').values('pk'))
+        qs = qs.filter(Exists(lines))
+    return qs
+
+
+def sales_by_product(sd=None, ed=None, user=None):
+    """Quantity and sales per product, highest sales first."""
+    merged = {}
+    for invoice_model, item_model in archive.sources(sd, ed):
+        rows = (
+            item_model.objects.filter(invoice__in=invoices_in_range(invoice_model, sd, ed, user))
+            .values('product__id', 'product__name')
+            .annotate(total_quantity=Sum('quantity'), total_sales=Sum('line_total'))
+        )
+        for p in rows:
+            row = merged.setdefault(p['product__id'], {
+                'product_id': p['product__id'],
+                'product_name': p['product__name'],
+                'total_quantity': 0,
+                'total_sales': 0,
+            })
+            row['total_quantity'] += p['total_quantity'] or 0
+            row['total_sales'] += p['total_sales'] or 0
+    return sorted(merged.values(), key=lambda r: r['total_sales'], reverse=True)
+
+def sales_report(sd=None, ed=None, scope=None):
+    """Body of /api/reports/sales/; `scope` limits it to one user's invoices."""
+    # totals and sales by user
+    total_sales = 0
+    invoice_count = 0
+    by_user = {}
+    for invoice_model, _ in archive.sources(sd, ed):
+        invoices = invoices_in_range(invoice_model, sd, ed, scope)
+        agg = invoices.aggregate(sum=Sum('total'), count=Count('id'))
+        total_sales += agg['sum'] or 0
+        invoice_count += agg['count']
+        users_qs = (
+            invoices
+            .values('created_by__id', 'created_by__username')
+            .annotate(total_sales=Sum('total'), invoice_count=Count('id'))
+        )
+        for u in users_qs:
+            row = by_user.setdefault(u['created_by__id'], {
+                'user_id': u['created_by__id'],
+                'username': u.get('created_by__username'),
+                'total_sales': 0,
+                'invoice_count': 0,
+            })
+            row['total_sales'] += u['total_sales'] or 0
+            row['invoice_count'] += u['invoice_count'] or 0
+
+    # sales by product
+    by_product = []
+    for p in sales_by_product(sd, ed, scope):
+        by_product.append({
+            'product_id': p['product_id'],
+            'product_name': p['product_name'],
+            'total_quantity': int(p['total_quantity'] or 0),
+            'total_sales': money(p['total_sales'])
+        })
+
+    sales_by_user = []
+    for u in sorted(by_user.values(), key=lambda r: r['total_sales'], reverse=True):
+        sales_by_user.append({
+            'user_id': u['user_id'],
+            'username': u['username'],
+            'total_sales': money(u['total_sales']),
+            'invoice_count': int(u['invoice_count'] or 0)
+        })
+
+    # top products
+    top_products = by_product[:10]
+
+    # monthly sales for the last 12 months and daily sales for the last 30 days, both
+    # relative to end_date or today and clipped to the requested range: one grouped
+    # query per table over the union of their bounds
+    today = ed or timezone.localdate()
+    month_starts = [_month_start(today, i) for i in range(11, -1, -1)]
+    days = [today - timedelta(days=i) for i in range(29, -1, -1)]
+    tomorrow = today + timedelta(days=1)
+    lo = min(max(sd, month_starts[0]), tomorrow) if sd else month_starts[0]
+    edges = sorted(e for e in set(month_starts) | set(days) | {lo, tomorrow} if e >= lo)
+    sales = bucket_totals(edges, scope)[0] if lo < tomorrow else []
+
+    def clipped(first, after):
+        first, after = max(first, lo), min(after, tomorrow)
+        return sum(sales[edges.index(first):edges.index(after)]) if first < after else 0
+
+    months = [{'year': m.year, 'month': m.month, 'sales': money(clipped(m, nxt))}
+              for m, nxt in zip(month_starts, month_starts[1:] + [tomorrow])]
+    daily = [{'date': d.isoformat(), 'sales': money(clipped(d, d + timedelta(days=1)))} for d in days]
+
+    return {
+        'total_sales': money(total_sales),
+        'invoice_count': invoice_count,
+        'sales_by_product': by_product,
+        'sales_by_user': sales_by_user,
+        'top_products': top_products,
+        'monthly_sales_last_12': months,
+        'daily_sales_last_30': daily,
+    }
+
+
+SALES_CSV_HEADER = ['product_id', 'product_name', 'total_quantity', 'total_sales']
+
+
+def write_sales_csv(fileobj, sd=None, ed=None):
+    """Write sales_by_product as CSV to a file-like object (or an HttpResponse)."""
+    writer = csv.writer(fileobj)
+    writer.writerow(SALES_CSV_HEADER)
+    for p in sales_by_product(sd, ed):
+        writer.writerow([p['product_id'], p['product_name'], int(p['total_quantity'] or 0), money(p['total_sales'])])
@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from django.db import transaction
-from .models import Product, Invoice, InvoiceItem, StockAdjustment
+from django.db import IntegrityError, transaction
+from . import money, outbox, pricing, sketches, tariffs, writer
+from .models import (Product, Invoice, InvoiceItem, StockAdjustment, Customer, ArchivedInvoice, ArchivedInvoiceItem,
+                     PriceList, PriceRule, PriceHistory, normalize_email)
 from django.contrib.auth import get_user_model
+from .backends import users_by_email
 
 User = get_user_model()
 
@@ -15,8 +18,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ['username', 'email', 'password']
     
     def validate_email(self, value):
-        """Check if email already exists"""
-        if User.objects.filter(email=value).exists():
+        """Check if email already exists (ignoring case, through the LOWER(email) index)"""
+        value = value.strip()
+        if value and users_by_email(value).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
     
@@ -28,27 +32,137 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         """Create a new user with encrypted password"""
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password']
-        )
+        try:
+            user = User.objects.create_user(
+                username=validated_data['username'],
+                email=validated_data.get('email', ''),
+                password=validated_data['password']
+            )
+        except IntegrityError:
+            # a concurrent signup took the username or email after validation
+            raise serializers.ValidationError("A user with this username or email already exists.")
         return user
 
 
-class ProductSerializer(serializers.ModelSerializer):
+def parse_field_spec(value):
+    """'id,total,items.quantity' -> {'id': {}, 'total': {}, 'items': {'quantity': {}}}"""
+    spec = {}
+    for path in (value or '').split(','):
+        node = spec
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part.strip(), {})
+    return spec
+
+
+def _query_list(request, name):
+    return {v.strip() for v in request.query_params.get(name, '').split(',') if v.strip()}
+
+
+def requested_expansions(request):
+    """Relations to embed: `product` unless the products are side-loaded with
+    `?include=products`, plus the names passed in `?expand=` (comma separated).
+    """
+    if request is None:
+        return {'product'}
+    expand = _query_list(request, 'expand')
+    if 'products' not in _query_list(request, 'include'):
+        expand.add('product')
+    return expand
+
+
+class DynamicFieldsMixin:
+    """Sparse fieldsets and opt-in expansion driven by the request's query string.
+
+    `?fields=id,total,items.quantity` keeps only the listed readable fields; dotted
+    names reach into nested serializers and a bare nested name keeps all of its
+    fields. Fields listed in `Meta.expandable_fields` (field name -> expansion
+    name) are rendered unless their rows are side-loaded instead (see
+    requested_expansions(); `?expand=<name>` keeps them embedded anyway), and
+    `?fields=` leaves them out like any other field, so views can skip fetching
+    the related rows. Write-only fields are never pruned. Without a request in
+    the context (scripts, shell) every field is kept.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+
+        expand = requested_expansions(request)
+        for name, key in getattr(self.Meta, 'expandable_fields', {}).items():
+            if key not in expand:
+                fields.pop(name, None)
+
+        spec = self._field_spec(request)
+        if spec:
+            for name in list(fields):
+                if name not in spec and not fields[name].write_only:
+                    fields.pop(name)
+        return fields
+
+    def _field_spec(self, request):
+        spec = parse_field_spec(request.query_params.get('fields'))
+        # descend from the root serializer to this (possibly nested) one
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        for name in reversed(path):
+            spec = spec.get(name) or {}
+            if not spec:
+                break
+        return spec
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'name', 'sku', 'barcode', 'price', 'stock', 'available_for_invoice', 'created_at']
+        fields = ['id', 'name', 'sku', 'barcode', 'price', 'price_list', 'stock', 'available_for_invoice',
+                  'created_at', 'updated_at', 'revision']
+
+    def update(self, instance, validated_data):
+        old_price = instance.price
+        if 'price' in validated_data and validated_data['price'] != old_price:
+            # set by hand: no longer the price list's price
+            validated_data['price_list'] = None
+        request = self.context.get('request')
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            pricing.record_edit(instance, old_price, request.user if request else None)
+        return instance
 
 
-class InvoiceItemSerializer(serializers.ModelSerializer):
+class CustomerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Customer
+        fields = ['id', 'name', 'email', 'phone', 'created_at']
+        read_only_fields = ['created_at']
+
+    def validate_email(self, value):
+        """Emails are stored normalized; reject one that already belongs to another customer"""
+        value = normalize_email(value)
+        if value:
+            qs = Customer.objects.filter(email=value)
+            if self.instance is not None:
+                qs = qs.exclude(pk=self.instance.pk)
+            if qs.exists():
+                raise serializers.ValidationError("A customer with this email already exists.")
+        return value
+
+
+class InvoiceItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductSerializer(source='product', read_only=True)
 
     class Meta:
         model = InvoiceItem
-        fields = ['id', 'product', 'product_detail', 'quantity', 'price', 'line_total']
-        read_only_fields = ['line_total', 'product_detail']
+        fields = ['id', 'product', 'product_detail', 'quantity', 'price', 'price_list', 'line_total', 'tax_percent',
+                  'tax_amount']
+        read_only_fields = ['price_list', 'line_total', 'tax_amount', 'product_detail']
+        expandable_fields = {'product_detail': 'product'}
 
 
 class InvoiceCreateItemSerializer(serializers.Serializer):
@@ -60,7 +174,7 @@ class InvoiceCreateItemSerializer(serializers.Serializer):
     tax_percent = serializers.DecimalField(max_digits=5, decimal_places=2, required=False, default=0)
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = InvoiceItemSerializer(many=True, read_only=True)
     create_items = InvoiceCreateItemSerializer(many=True, write_only=True, required=False)
     
@@ -70,114 +184,149 @@ class InvoiceSerializer(serializers.ModelSerializer):
     customer_phone = serializers.CharField(required=False, write_only=True)
     invoice_date = serializers.DateTimeField(required=False, write_only=True)
     due_date = serializers.DateTimeField(required=False, write_only=True)
-    customs_duty = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0, write_only=True)
-    shipping_charges = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0, write_only=True)
-    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, write_only=True)
-    tax_amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, write_only=True)
+    # without customs_duty the duty is computed from the DutyRule table (shop/tariffs.py)
+    # for the lines' HS codes and the destination `country`
+    customs_duty = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    country = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    shipping_charges = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
 
     class Meta:
         model = Invoice
         fields = [
-            'id', 'invoice_no', 'created_by', 'date', 'total', 'status', 'items', 'create_items',
+            'id', 'invoice_no', 'created_by', 'customer', 'date', 'total', 'status', 'items', 'create_items',
             'customer_name', 'customer_email', 'customer_phone', 'invoice_date', 'due_date',
-            'customs_duty', 'shipping_charges', 'subtotal', 'tax_amount'
+            'customs_duty', 'country', 'shipping_charges', 'subtotal', 'tax_amount'
         ]
-        read_only_fields = ['id', 'invoice_no', 'created_by', 'date', 'total', 'items']
+        # subtotal / tax_amount / total are computed from the lines; values posted for them are ignored
+        read_only_fields = ['id', 'invoice_no', 'created_by', 'customer', 'date', 'subtotal', 'tax_amount', 'total', 'items']
 
     def validate(self, data):
         # ensure create_items present when creating
         if self.context['request'].method == 'POST':
-            items = self.initial_data.get('create_items') or self.initial_data.get('items') or []
-            if not items:
+            if 'create_items' not in data:
+                # older clients post the lines as `items`
+                raw = self.initial_data.get('items') or []
+                items = InvoiceCreateItemSerializer(data=raw, many=True)
+                if not items.is_valid():
+                    raise serializers.ValidationError({'items': items.errors})
+                data['create_items'] = items.validated_data
+            if not data['create_items']:
                 raise serializers.ValidationError("Invoice must contain at least one item.")
         return data
 
+    def _resolve_products(self, items_data):
+        """Product for each line: by ID, then by name, else a stub product is created."""
+        idents = [str(item.get('product') or '').strip() for item in items_data]
+        by_id = Product.objects.in_bulk({int(i) for i in idents if i.isdigit()})
+        products = {i: by_id[int(i)] for i in idents if i.isdigit() and int(i) in by_id}
+        names = {i for i in idents if i and i not in products}
+        for product in Product.objects.filter(name__in=names).order_by('-pk'):
+            # lowest pk wins when names repeat
+            products[product.name] = product
+
+        result = []
+        for ident, item in zip(idents, items_data):
+            if not ident:
+                raise serializers.ValidationError(f"Product '{ident}' not found.")
+            product = products.get(ident)
+            if product is None:
+                # In development, create a generic product entry
+                product, _ = Product.objects.get_or_create(
+                    name=ident,
+                    defaults={
+                        'sku': f"SKU-{ident[:10]}",
+                        'price': item['price'],
+                        'available_for_invoice': True
+                    }
+                )
+                products[ident] = product
+            result.append(product)
+        return result
+
+    def _totals(self, validated_data, items_data, products):
+        """money.compute_invoice() for the new invoice, with the rule-based duty when none was posted."""
+        # all amounts in integer minor units from here on; see shop/money.py
+        try:
+            prices = [money.to_minor(item['price']) for item in items_data]
+            duty = validated_data.get('customs_duty')
+            if duty is None:
+                lines = [{'hs_code': item.get('hs_code') or product.hs_code, 'quantity': item['quantity'], 'price': price}
+                         for item, product, price in zip(items_data, products, prices)]
+                duty = tariffs.customs_duty(lines, validated_data.get('country'))
+            else:
+                duty = money.to_minor(duty)
+            return money.compute_invoice(
+                [item['quantity'] for item in items_data],
+                prices,
+                [money.to_rate(item.get('tax_percent')) for item in items_data],
+                customs_duty=duty,
+                shipping=money.to_minor(validated_data.get('shipping_charges')),
+            )
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
     def create(self, validated_data):
+        # with settings.INVOICE_WRITE_QUEUE, concurrent creations share one commit (shop/writer.py)
+        return writer.run(self._create, validated_data)
+
+    def _create(self, validated_data):
         request = self.context['request']
-        items_data = self.initial_data.get('create_items', []) or self.initial_data.get('items', [])
+        items_data = validated_data['create_items']
 
         from django.db import IntegrityError
         import datetime
 
+        to_decimal = money.to_decimal
+
         # Try a few times to avoid UNIQUE constraint collisions on invoice_no
         max_attempts = 5
         last_exc = None
         for attempt in range(max_attempts):
             try:
                 with transaction.atomic():
+                    # persist the customer (deduplicated on normalized email / phone)
+                    customer = Customer.objects.resolve(
+                        name=validated_data.get('customer_name'),
+                        email=validated_data.get('customer_email'),
+                        phone=validated_data.get('customer_phone'),
+                    )
+                    products = self._resolve_products(items_data)
+                    totals = self._totals(validated_data, items_data, products)
                     # include microseconds to reduce collision probability
                     invoice_no = f"INV-{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}"
                     invoice = Invoice.objects.create(
                         invoice_no=invoice_no,
                         created_by=request.user if request.user.is_authenticated else None,
-                        total=0
+                        customer=customer,
+                        subtotal=to_decimal(totals.subtotal),
+                        tax_amount=to_decimal(totals.tax_total),
+                        customs_duty=to_decimal(totals.customs_duty),
+                        shipping_charges=to_decimal(totals.shipping),
+                        total=to_decimal(totals.total),
                     )
 
-                    total = 0
-                    for item in items_data:
-                        # item can be {product: id_or_name, quantity, price, ...}
-                        qty = int(item['quantity'])
-                        price = float(item['price'])
-                        
-                        # Try to resolve product: first by ID, then by name, or create stub
-                        product = None
-                        prod_identifier = item.get('product')
-                        
-                        if prod_identifier:
-                            try:
-                                # Try as ID first
-                                product = Product.objects.get(pk=int(prod_identifier))
-                            except (ValueError, Product.DoesNotExist):
-                                # Try as name
-                                try:
-                                    product = Product.objects.get(name=prod_identifier)
-                                except Product.DoesNotExist:
-                                    # In development, create a generic product entry
-                                    if getattr(request, 'user', None) and (request.user.is_staff or getattr(request, 'auth', None)):
-                                        product, _ = Product.objects.get_or_create(
-                                            name=prod_identifier,
-                                            defaults={
-                                                'sku': f"SKU-{prod_identifier[:10]}",
-                                                'price': price,
-                                                'available_for_invoice': True
-                                            }
-                                        )
-                                    else:
-                                        # Create it anyway in DEBUG mode
-                                        product, _ = Product.objects.get_or_create(
-                                            name=prod_identifier,
-                                            defaults={
-                                                'sku': f"SKU-{prod_identifier[:10]}",
-                                                'price': price,
-                                                'available_for_invoice': True
-                                            }
-                                        )
-                        
-                        if not product:
-                            raise serializers.ValidationError(f"Product '{prod_identifier}' not found.")
-                        
-                        line_total = qty * price
-                        InvoiceItem.objects.create(
+                    # Don't reduce stock in dev (product might be dummy data)
+                    # In production, you'd want to check stock and deduct
+                    created_items = InvoiceItem.objects.bulk_create([
+                        InvoiceItem(
                             invoice=invoice,
                             product=product,
-                            quantity=qty,
-                            price=price,
-                            line_total=line_total
+                            quantity=item['quantity'],
+                            price=item['price'],
+                            # which price list the line was sold under, if it kept the list price
+                            price_list_id=product.price_list_id if item['price'] == product.price else None,
+                            line_total=to_decimal(line_total),
+                            tax_percent=item.get('tax_percent') or 0,
+                            tax_amount=to_decimal(line_tax),
                         )
-                        
-                        # Don't reduce stock in dev (product might be dummy data)
-                        # In production, you'd want to check stock and deduct
-                        # prod.stock = prod.stock - qty
-                        # prod.save()
-                        
-                        total += line_total
-
-                    # Add customs duty and shipping to total
-                    total += float(validated_data.get('customs_duty', 0) or 0)
-                    total += float(validated_data.get('shipping_charges', 0) or 0)
-                    
-                    invoice.total = total
-                    invoice.save()
+                        for item, product, line_total, line_tax
+                        in zip(items_data, products, totals.line_totals, totals.line_taxes)
+                    ], batch_size=500)
+
+                    # folded into the day's sketch after the commit, not under this transaction
+                    sketches.record_invoice(invoice, created_items)
+                    # queued in the same transaction, so the event exists iff the invoice does
+                    outbox.record(outbox.INVOICE_CREATED, outbox.invoice_payload(invoice, created_items), invoice.id)
                     return invoice
             except IntegrityError as e:
                 # UNIQUE collision on invoice_no, retry generating a new number
@@ -190,11 +339,104 @@ class InvoiceSerializer(serializers.ModelSerializer):
         # fallback (shouldn't get here)
         raise serializers.ValidationError("Could not create invoice due to an unexpected error.")
 
+    def update(self, instance, validated_data):
+        # lines and amounts are fixed once the invoice exists; total depends on them
+        for name in ('create_items', 'customs_duty', 'country', 'shipping_charges'):
+            validated_data.pop(name, None)
+        return super().update(instance, validated_data)
+
+
+class ArchivedInvoiceItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    product_detail = ProductSerializer(source='product', read_only=True)
+
+    class Meta:
+        model = ArchivedInvoiceItem
+        fields = ['id', 'product', 'product_detail', 'quantity', 'price', 'price_list', 'line_total', 'tax_percent',
+                  'tax_amount']
+        read_only_fields = fields
+        expandable_fields = {'product_detail': 'product'}
+
+
+class ArchivedInvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Read-only invoice from a closed financial year, shaped like InvoiceSerializer output"""
+    items = ArchivedInvoiceItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedInvoice
+        fields = ['id', 'invoice_no', 'created_by', 'customer', 'date', 'subtotal', 'tax_amount', 'customs_duty',
+                  'shipping_charges', 'total', 'status', 'items', 'financial_year']
+        read_only_fields = fields
+
 
-class StockAdjustmentSerializer(serializers.ModelSerializer):
+class StockAdjustmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductSerializer(source='product', read_only=True)
 
     class Meta:
         model = StockAdjustment
         fields = ['id', 'product', 'product_detail', 'change', 'reason', 'created_by', 'created_at']
         read_only_fields = ['created_by', 'created_at']
+        expandable_fields = {'product_detail': 'product'}
+
+
+class PriceRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceRule
+        fields = ['id', 'position', 'kind', 'value', 'sku_prefix', 'hs_prefix', 'product_ids']
+
+    def validate_product_ids(self, value):
+        if not isinstance(value, list) or not all(isinstance(pk, int) and pk > 0 for pk in value):
+            raise serializers.ValidationError("Expected a list of product IDs.")
+        if len(value) > 1000:
+            raise serializers.ValidationError("At most 1000 product IDs per rule; use a SKU or HS code prefix.")
+        return sorted(set(value))
+
+    def validate(self, data):
+        if data.get('kind') == PriceRule.PERCENT and data.get('value') is not None and data['value'] < -100:
+            raise serializers.ValidationError({'value': "A price cannot drop by more than 100%."})
+        return data
+
+
+class PriceListSerializer(serializers.ModelSerializer):
+    """A price list with its rules; rules are replaced as a whole on update, until the list is applied."""
+    rules = PriceRuleSerializer(many=True)
+
+    class Meta:
+        model = PriceList
+        fields = ['id', 'name', 'description', 'effective_from', 'rules', 'applied_at', 'applied_by',
+                  'products_changed', 'created_at', 'updated_at']
+        read_only_fields = ['applied_at', 'applied_by', 'products_changed', 'created_at', 'updated_at']
+
+    def validate(self, data):
+        if self.instance is not None and self.instance.applied_at is not None:
+            raise serializers.ValidationError("An applied price list cannot be changed.")
+        if 'rules' in data and not data['rules']:
+            raise serializers.ValidationError({'rules': "A price list needs at least one rule."})
+        return data
+
+    def _set_rules(self, price_list, rules):
+        price_list.rules.all().delete()
+        for position, rule in enumerate(rules):
+            rule.setdefault('position', position)
+            PriceRule.objects.create(price_list=price_list, **rule)
+
+    def create(self, validated_data):
+        rules = validated_data.pop('rules')
+        with transaction.atomic():
+            price_list = super().create(validated_data)
+            self._set_rules(price_list, rules)
+        return price_list
+
+    def update(self, instance, validated_data):
+        rules = validated_data.pop('rules', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if rules is not None:
+                self._set_rules(instance, rules)
+        return instance
+
+
+class PriceHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PriceHistory
+        fields = ['id', 'product', 'old_price', 'new_price', 'price_list', 'changed_by', 'changed_at']
+        read_only_fields = fields
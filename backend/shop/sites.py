@@ -0,0 +1,10 @@
+from django.contrib.admin import AdminSite
+
+from .forms import CustomAdminLoginForm
+
+
+class CustomAdminSite(AdminSite):
+    login_form = CustomAdminLoginForm
+    site_header = "TradeTrack"
+    site_title = "TradeTrack Admin Portal"
+    index_title = "Welcome to TradeTrack Management"
@@ -0,0 +1,293 @@
+"""Per-day sketches of invoice lines for approximate range analytics.
+
+Exact top products and distinct counts over a range are GROUP BYs over every
+line in it. Instead, each local day keeps a DailySketch row holding:
+
+- a count-min sketch (DEPTH rows of WIDTH counters) of quantity per product:
+  an estimate is never below the true quantity and, with probability at least
+  1 - e**-DEPTH, exceeds it by at most e / WIDTH of the range's total quantity;
+- a Misra-Gries summary of at most HEAVY_HITTERS products with a lower bound
+  of their quantity, undercounting each by at most the `missed` amount that
+  query() reports ((total - summary total) / (HEAVY_HITTERS + 1)); any product
+  with more than that is in the summary, which is where top products come from;
+- HyperLogLog registers (2**HLL_BITS of them) over customer ids and over
+  product ids, for distinct buyers and distinct products sold, with a relative
+  standard error of 1.04 / sqrt(2**HLL_BITS).
+
+All three merge exactly across days (counters add, summaries add and prune,
+registers take the maximum), so a range query reads one row per day and its
+cost does not depend on how many lines the days hold. record_invoice()
+folds a new invoice into its day's row once the creating transaction has
+committed, in a short transaction of its own: there is one row per day, and
+locking it inside the invoice transaction would make every invoice write wait
+for the one before it. An invoice whose fold fails (or whose process dies
+before it runs) is missing from the sketch until the day is rebuilt;
+`manage.py build_sketches` rebuilds days from the invoice tables (hot and
+archived), e.g. after deletions, which the sketches do not follow. Changing
+WIDTH, DEPTH or HLL_BITS needs a rebuild of every day.
+"""
+import math
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from . import archive
+from .models import DailySketch, Product
+from .reports import day_start
+
+WIDTH = 2048
+DEPTH = 4
+HLL_BITS = 12
+HEAVY_HITTERS = 256
+# one hash per count-min row; fixed, as they are baked into the stored counters
+SEEDS = np.array([0x8F1BBCDC, 0xCA62C1D6, 0x5A827999, 0x6ED9EBA1], dtype=np.uint64)[:DEPTH]
+
+
+def _mix(x):
+    """splitmix64 finalizer over a uint64 array."""
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _ids(values):
+    return np.asarray(values, dtype=np.int64).astype(np.uint64)
+
+
+def _pack(array):
+    return zlib.compress(np.ascontiguousarray(array).tobytes(), 1)
+
+
+def _unpack(blob, dtype, shape):
+    if not blob:
+        return np.zeros(shape, dtype)
+    return np.frombuffer(zlib.decompress(bytes(blob)), dtype).reshape(shape).copy()
+
+
+class HyperLogLog:
+    def __init__(self, registers=None):
+        self.registers = np.zeros(1 << HLL_BITS, np.uint8) if registers is None else registers
+
+    def add(self, ids):
+        if not len(ids):
+            return
+        h = _mix(_ids(ids))
+        index = (h >> np.uint64(64 - HLL_BITS)).astype(np.intp)
+        rest = (h & np.uint64((1 << (64 - HLL_BITS)) - 1)).astype(np.float64)  # < 2**52, exact
+        # position of the first 1 bit in the remaining 64 - HLL_BITS bits
+        rank = (64 - HLL_BITS + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small ranges: linear counting is more accurate
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class Sketch:
+    """The summaries of one day, or of several merged."""
+
+    def __init__(self):
+        self.invoices = self.lines = self.quantity = 0
+        self.counts = np.zeros((DEPTH, WIDTH), np.int64)
+        self.heavy = {}
+        self.buyers = HyperLogLog()
+        self.products = HyperLogLog()
+
+    @classmethod
+    def from_row(cls, row):
+        sketch = cls()
+        sketch.invoices, sketch.lines, sketch.quantity = row.invoices, row.lines, row.quantity
+        blob = zlib.decompress(bytes(row.product_counts)) if row.product_counts else b''
+        if blob:
+            # int32 counters unless a day outgrew them
+            dtype = '<i4' if len(blob) == DEPTH * WIDTH * 4 else '<i8'
+            sketch.counts = np.frombuffer(blob, dtype).reshape(DEPTH, WIDTH).astype(np.int64)
+        sketch.heavy = {int(k): v for k, v in row.heavy_hitters.items()}
+        sketch.buyers = HyperLogLog(_unpack(row.buyers, np.uint8, 1 << HLL_BITS))
+        sketch.products = HyperLogLog(_unpack(row.products, np.uint8, 1 << HLL_BITS))
+        return sketch
+
+    def to_row(self, row):
+        row.invoices, row.lines, row.quantity = self.invoices, self.lines, self.quantity
+        row.product_counts = _pack(self.counts.astype('<i4' if self.counts.max() < 2 ** 31 else '<i8'))
+        row.heavy_hitters = {str(k): v for k, v in self.heavy.items()}
+        row.buyers = _pack(self.buyers.registers)
+        row.products = _pack(self.products.registers)
+        return row
+
+    def _buckets(self, product_ids):
+        h = _ids(product_ids)
+        return [(_mix(h ^ seed) % np.uint64(WIDTH)).astype(np.intp) for seed in SEEDS]
+
+    def _prune(self):
+        if len(self.heavy) > HEAVY_HITTERS:
+            cut = sorted(self.heavy.values(), reverse=True)[HEAVY_HITTERS]
+            self.heavy = {k: v - cut for k, v in self.heavy.items() if v > cut}
+
+    def add(self, invoices, product_ids, quantities, customer_ids):
+        """Add `invoices` invoices with the given lines (parallel product id / quantity
+        sequences) and customer ids (None for invoices without a customer).
+        """
+        product_ids = np.asarray(product_ids, np.int64)
+        quantities = np.asarray(quantities, np.int64)
+        self.invoices += invoices
+        self.lines += len(product_ids)
+        self.quantity += int(quantities.sum())
+        for row, buckets in enumerate(self._buckets(product_ids)):
+            self.counts[row] += np.bincount(buckets, weights=quantities, minlength=WIDTH).astype(np.int64)
+        ids, per_product = np.unique(product_ids, return_inverse=True)
+        for pid, qty in zip(ids.tolist(), np.bincount(per_product, weights=quantities).astype(np.int64).tolist()):
+            self.heavy[pid] = self.heavy.get(pid, 0) + qty
+        self._prune()
+        self.buyers.add([c for c in customer_ids if c is not None])
+        self.products.add(ids)
+
+    def merge(self, other, prune=True):
+        """Add `other` in; merging many, prune only after the last (the error bound is the same)."""
+        self.invoices += other.invoices
+        self.lines += other.lines
+        self.quantity += other.quantity
+        self.counts += other.counts
+        for pid, qty in other.heavy.items():
+            self.heavy[pid] = self.heavy.get(pid, 0) + qty
+        if prune:
+            self._prune()
+        self.buyers.merge(other.buyers)
+        self.products.merge(other.products)
+
+    def estimate(self, product_ids):
+        """(upper bound, point estimate) of quantity for `product_ids`.
+
+        The upper bound is the count-min estimate. The point estimate is the
+        count-mean-min one: each row's counter minus the mean share of the other
+        products that hash into the same counter, median over rows, kept within
+        the Misra-Gries lower bound and the upper bound. It ranks products whose
+        quantities are within the count-min error of each other far better.
+        """
+        ids = np.asarray(product_ids, np.int64)
+        if not len(ids):
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        counters = np.array([self.counts[row][buckets] for row, buckets in enumerate(self._buckets(ids))])
+        upper = counters.min(axis=0)
+        noise = (self.quantity - counters) / (WIDTH - 1)
+        lower = np.array([self.heavy.get(pid, 0) for pid in ids.tolist()], np.int64)
+        point = np.clip(np.rint(np.median(counters - noise, axis=0)).astype(np.int64), lower, upper)
+        return upper, point
+
+
+def record_invoice(invoice, items):
+    """Fold a new invoice and its lines into its day's sketch after the creating transaction commits."""
+    day = timezone.localdate(invoice.date)
+    product_ids = [item.product_id for item in items]
+    quantities = [item.quantity for item in items]
+    customer_ids = [invoice.customer_id]
+    transaction.on_commit(lambda: fold(day, 1, product_ids, quantities, customer_ids), robust=True)
+
+
+def fold(day, invoices, product_ids, quantities, customer_ids):
+    """Add invoices and their lines (as for Sketch.add) to `day`'s row, locking only that row."""
+    with transaction.atomic():
+        row, _ = DailySketch.objects.select_for_update().get_or_create(day=day)
+        sketch = Sketch.from_row(row)
+        sketch.add(invoices, product_ids, quantities, customer_ids)
+        sketch.to_row(row).save()
+
+
+def merged(start, end):
+    """Sketch of the days start..end (inclusive) and the number of days with data."""
+    sketch, days = Sketch(), 0
+    for row in DailySketch.objects.filter(day__gte=start, day__lte=end).iterator():
+        sketch.merge(Sketch.from_row(row), prune=False)
+        days += 1
+    sketch._prune()
+    return sketch, days
+
+
+def query(start, end, limit=10):
+    """Approximate totals, distinct counts and top products for start..end with error bounds."""
+    sketch, days = merged(start, end)
+    candidates = sorted(sketch.heavy)
+    upper, point = (dict(zip(candidates, values.tolist())) for values in sketch.estimate(candidates))
+    top = sorted(candidates, key=lambda pid: (-point[pid], pid))[:limit]
+    names = dict(Product.objects.filter(pk__in=top).values_list('pk', 'name'))
+    hll_error = round(1.04 / math.sqrt(1 << HLL_BITS), 4)
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'invoice_count': sketch.invoices,
+        'line_count': sketch.lines,
+        'quantity': sketch.quantity,
+        'distinct_buyers': sketch.buyers.estimate(),
+        'distinct_products': sketch.products.estimate(),
+        'top_products': [
+            {'product_id': pid, 'product_name': names.get(pid), 'quantity': point[pid],
+             'at_least': sketch.heavy[pid], 'at_most': upper[pid]}
+            for pid in top
+        ],
+        'error': {
+            # count-min: at_most - true quantity is at most this, with this probability
+            'quantity': math.ceil(math.e / WIDTH * sketch.quantity),
+            'confidence': round(1 - math.exp(-DEPTH), 4),
+            # Misra-Gries: any product with more than this quantity is a candidate
+            'missed': (sketch.quantity - sum(sketch.heavy.values())) // (HEAVY_HITTERS + 1),
+            # HyperLogLog relative standard error of the distinct counts
+            'distinct_relative': hll_error,
+        },
+    }
+
+
+def quarter_start(day):
+    return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+
+
+def rebuild(start, end, chunk=50000, stdout=None):
+    """Recompute the sketches of days start..end from the invoice tables (hot and archived).
+    Invoices created while it runs may be missed or counted twice; run it when none are.
+    Returns days written.
+    """
+    tz = timezone.get_current_timezone()
+    sketches = {}
+    for invoice_model, item_model in archive.sources(start, end):
+        invoices = invoice_model.objects.filter(date__gte=day_start(start), date__lt=day_start(end + timedelta(days=1)))
+        last = 0
+        while True:
+            rows = list(invoices.filter(id__gt=last).order_by('id').values_list('id', 'date', 'customer_id')[:chunk])
+            if not rows:
+                break
+            first, last = rows[0][0], rows[-1][0]
+            ids = np.array([pk for pk, _, _ in rows], np.int64)
+            days = np.array([when.astimezone(tz).date().toordinal() for _, when, _ in rows], np.int64)
+            lines = np.array(list(item_model.objects.filter(invoice_id__gte=first, invoice_id__lte=last)
+                                  .values_list('invoice_id', 'product_id', 'quantity')), np.int64).reshape(-1, 3)
+            # lines of invoices outside the date range fall between the ids read
+            pos = np.minimum(np.searchsorted(ids, lines[:, 0]), len(ids) - 1)
+            lines = lines[ids[pos] == lines[:, 0]]
+            line_days = days[np.searchsorted(ids, lines[:, 0])]
+            by_day = np.argsort(line_days, kind='stable')
+            line_days, lines = line_days[by_day], lines[by_day]
+            for ordinal in np.unique(days).tolist():
+                lo, hi = np.searchsorted(line_days, [ordinal, ordinal + 1])
+                customers = [c for (_, _, c), d in zip(rows, days.tolist()) if d == ordinal]
+                sketches.setdefault(ordinal, Sketch()).add(len(customers), lines[lo:hi, 1], lines[lo:hi, 2], customers)
+            if stdout:
+                stdout.write(f'{invoice_model._meta.db_table}: up to invoice {last}, {len(sketches)} days')
+    with transaction.atomic():
+        DailySketch.objects.filter(day__gte=start, day__lte=end).delete()
+        DailySketch.objects.bulk_create(
+            [sketch.to_row(DailySketch(day=date.fromordinal(ordinal))) for ordinal, sketch in sorted(sketches.items())],
+            batch_size=200,
+        )
+    return len(sketches)
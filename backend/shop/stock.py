@@ -0,0 +1,202 @@
+"""Applying stock adjustments to Product.stock.
+
+Every adjustment is a StockAdjustment ledger row plus the same change applied
+to the product's `stock`, in one transaction. `bulk_adjust()` does this for a
+whole stock count at once: the rows are validated in a single pass against
+products fetched in chunks, the ledger is written with bulk_create, and the
+new stock levels are applied with chunked `UPDATE ... SET stock = CASE id ...`
+statements instead of one save() per product.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from . import catalog, outbox
+from .models import Product, StockAdjustment
+
+DELTA = 'delta'
+ABSOLUTE = 'absolute'
+MODES = (DELTA, ABSOLUTE)
+
+# rows per IN (...) lookup / CASE statement; keeps each query under SQLite's
+# bound-parameter limit
+CHUNK_SIZE = 300
+# adjustments per outbox event for bulk changes
+EVENT_BATCH_SIZE = 1000
+MAX_ERRORS = 100
+
+
+class BulkAdjustmentError(Exception):
+    """The request was rejected as a whole; `errors` lists the offending rows."""
+
+    def __init__(self, detail, errors=(), error_count=0):
+        super().__init__(detail)
+        self.detail = detail
+        self.errors = list(errors)
+        self.error_count = error_count
+
+
+def _chunks(seq, size):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _apply_deltas(items):
+    """UPDATE product SET stock = stock + CASE id WHEN .. THEN .. END for (product_id, delta) pairs.
+
+    Written as SQL: compiling a When() per row through the ORM costs more than
+    running the statement.
+    """
+    qn = connection.ops.quote_name
+    table, pk_col, stock_col = qn(Product._meta.db_table), qn('id'), qn('stock')
+    with connection.cursor() as cursor:
+        for chunk in _chunks(items, CHUNK_SIZE):
+            whens = ' '.join(['WHEN %s THEN %s'] * len(chunk))
+            placeholders = ', '.join(['%s'] * len(chunk))
+            params = [v for pair in chunk for v in pair] + [pk for pk, _ in chunk]
+            cursor.execute(
+                f'UPDATE {table} SET {stock_col} = {stock_col} + CASE {pk_col} {whens} ELSE 0 END '
+                f'WHERE {pk_col} IN ({placeholders})',
+                params,
+            )
+
+
+def apply_change(adjustment):
+    """Apply one saved adjustment to its product; call inside the transaction that saved it."""
+    try:
+        with transaction.atomic():
+            Product.objects.filter(pk=adjustment.product_id).update(stock=F('stock') + adjustment.change)
+            catalog.touch([adjustment.product_id])
+    except IntegrityError:
+        raise ValidationError({'change': 'Stock cannot go below zero.'})
+
+
+def _parse_int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        value = value.strip()
+    result = int(value)
+    if isinstance(value, float) and value != result:
+        raise ValueError
+    return result
+
+
+def _fetch_products(ids, skus):
+    """{id: (id, stock)} and {sku: (id, stock)} for the referenced products."""
+    # locked until the adjustments are applied, so stock read here is what they apply to
+    products = Product.objects.select_for_update()
+    by_id, by_sku = {}, {}
+    for chunk in _chunks(sorted(ids), CHUNK_SIZE):
+        for pk, sku, stock in products.filter(pk__in=chunk).values_list('id', 'sku', 'stock'):
+            by_id[pk] = (pk, stock)
+    for chunk in _chunks(sorted(skus), CHUNK_SIZE):
+        for pk, sku, stock in products.filter(sku__in=chunk).values_list('id', 'sku', 'stock'):
+            by_sku[sku] = (pk, stock)
+    return by_id, by_sku
+
+
+def _validate(rows, mode, default_reason):
+    """One pass over the request rows -> [(product_id, change, reason)] with zero changes dropped."""
+    if mode not in MODES:
+        raise BulkAdjustmentError(f'`mode` must be one of: {", ".join(MODES)}.')
+    if not isinstance(rows, list) or not rows:
+        raise BulkAdjustmentError('Provide a non-empty list of `rows`.')
+    amount_field = 'count' if mode == ABSOLUTE else 'change'
+
+    errors = []
+    parsed = []
+    ids, skus = set(), set()
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'row': i, 'error': 'Expected an object.'})
+            continue
+        ref = row.get('product')
+        sku = row.get('sku')
+        if row.get(amount_field) is None:
+            errors.append({'row': i, 'error': f'`{amount_field}` is required in {mode} mode.'})
+            continue
+        try:
+            if ref is not None:
+                ref = _parse_int(ref)
+            amount = _parse_int(row[amount_field])
+        except (TypeError, ValueError):
+            errors.append({'row': i, 'error': f'`product` and `{amount_field}` must be integers.'})
+            continue
+        if ref is None and not sku:
+            errors.append({'row': i, 'error': 'Give `product` (id) or `sku`.'})
+            continue
+        if mode == ABSOLUTE and amount < 0:
+            errors.append({'row': i, 'error': '`count` cannot be negative.'})
+            continue
+        reason = str(row.get('reason') or default_reason or '')[:200]
+        if ref is not None:
+            ids.add(ref)
+        else:
+            sku = str(sku)
+            skus.add(sku)
+        parsed.append((i, ref, sku, amount, reason))
+
+    by_id, by_sku = _fetch_products(ids, skus)
+    seen = set()
+    stock_after = {}
+    result = []
+    for i, ref, sku, amount, reason in parsed:
+        product = by_id.get(ref) if ref is not None else by_sku.get(sku)
+        if product is None:
+            errors.append({'row': i, 'error': f'Unknown product {ref if ref is not None else sku!r}.'})
+            continue
+        pk, stock = product
+        if mode == ABSOLUTE:
+            if pk in seen:
+                errors.append({'row': i, 'error': f'Product {pk} is counted more than once.'})
+                continue
+            change = amount - stock
+        else:
+            change = amount
+        seen.add(pk)
+        after = stock_after.get(pk, stock) + change
+        if after < 0:
+            errors.append({'row': i, 'error': f'Stock of product {pk} would go below zero ({after}).'})
+            continue
+        stock_after[pk] = after
+        if change:
+            result.append((pk, change, reason))
+
+    if errors:
+        errors.sort(key=lambda e: e['row'])
+        raise BulkAdjustmentError(f'{len(errors)} invalid rows; nothing was applied.', errors[:MAX_ERRORS], len(errors))
+    return result
+
+
+def bulk_adjust(rows, mode=DELTA, user=None, reason=''):
+    """Validate and apply a batch of adjustments atomically.
+
+    `rows` are dicts with `product` (id) or `sku`, plus `change` (DELTA mode) or
+    `count` (ABSOLUTE mode: the counted stock level) and an optional `reason`.
+    Raises BulkAdjustmentError listing the bad rows; nothing is written then.
+    Returns the number of ledger rows written.
+    """
+    try:
+        with transaction.atomic():
+            changes = _validate(rows, mode, reason or ('Stock count' if mode == ABSOLUTE else ''))
+            if not changes:
+                return 0
+            adjustments = StockAdjustment.objects.bulk_create(
+                [StockAdjustment(product_id=pk, change=change, reason=reason or None, created_by=user)
+                 for pk, change, reason in changes],
+                batch_size=500,
+            )
+            # several delta rows for one product become one term of the CASE
+            per_product = {}
+            for pk, change, _ in changes:
+                per_product[pk] = per_product.get(pk, 0) + change
+            deltas = [(pk, d) for pk, d in per_product.items() if d]
+            _apply_deltas(deltas)
+            catalog.touch([pk for pk, _ in deltas])
+            for batch in _chunks(adjustments, EVENT_BATCH_SIZE):
+                outbox.record(outbox.STOCK_BATCH_ADJUSTED, outbox.stock_batch_payload(batch, mode))
+    except IntegrityError:
+        # CHECK (stock >= 0); only reachable where the row locks above are not enforced
+        raise BulkAdjustmentError('Stock changed while applying the adjustments; nothing was applied, retry.')
+    return len(adjustments)
@@ -0,0 +1,237 @@
+"""Customs duty and tax rates by HS code, from the DutyRule and TaxRule tables.
+
+The rule tables are small and read for every line of an invoice, so each
+process keeps them in an in-memory index keyed by (country, hs_prefix). A
+line's HS code is looked up from its full length down to one digit, so the
+longest matching prefix wins, and a 500-line invoice costs dict lookups
+rather than queries. The index is rebuilt when the tables change: saves and
+deletes in this process drop it at once, and other processes notice the
+tables' row count or latest `updated_at` moving on their next evaluation
+(one aggregate query per table). Changes made with QuerySet.update() skip
+both, so edit rules through the admin or save().
+
+Invoice creation stores customs_duty() of its lines when the client posts no
+`customs_duty` (the destination is the optional `country` of the request);
+tax rates still come from each line's `tax_percent`, which the dry run of
+evaluate() can supply.
+"""
+import threading
+from collections import namedtuple
+
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import money
+from .models import DutyRule, Product, TaxRule, normalize_hs_code
+
+Rule = namedtuple('Rule', 'id hs_prefix country rate effective_from effective_to')
+
+_lock = threading.Lock()
+_cache = {}  # model -> (version, index)
+
+
+def _version(model):
+    stats = model.objects.aggregate(n=Count('id'), latest=Max('updated_at'))
+    return stats['n'], stats['latest']
+
+
+def _build(model):
+    index = {}
+    rows = model.objects.order_by('effective_from', 'id').values_list(
+        'id', 'hs_prefix', 'country', 'rate', 'effective_from', 'effective_to')
+    for pk, prefix, country, rate, start, end in rows:
+        rule = Rule(pk, prefix, country, money.to_rate(rate), start, end)
+        index.setdefault((country, prefix), []).append(rule)
+    return index
+
+
+def get_index(model):
+    """{(country, hs_prefix): [Rule, ...] oldest first} for DutyRule or TaxRule."""
+    version = _version(model)
+    cached = _cache.get(model)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _cache.get(model)
+        if cached is None or cached[0] != version:
+            cached = _cache[model] = (version, _build(model))
+    return cached[1]
+
+
+def invalidate(model=None):
+    if model is None:
+        _cache.clear()
+    else:
+        _cache.pop(model, None)
+
+
+@receiver(post_save, sender=DutyRule)
+@receiver(post_delete, sender=DutyRule)
+@receiver(post_save, sender=TaxRule)
+@receiver(post_delete, sender=TaxRule)
+def _rules_changed(sender, **kwargs):
+    invalidate(sender)
+
+
+def match(index, hs_code, country, on_date):
+    """The rule in force on `on_date` with the longest prefix of `hs_code`, or None.
+
+    At equal prefix length a rule for `country` beats one for any country; a
+    prefix whose rules are all out of date falls through to shorter ones.
+    """
+    for n in range(len(hs_code), 0, -1):
+        prefix = hs_code[:n]
+        for c in (country, ''):
+            for rule in reversed(index.get((c, prefix), ())):
+                if rule.effective_from <= on_date and (rule.effective_to is None or on_date < rule.effective_to):
+                    return rule
+    return None
+
+
+def _line_duty(duties, line, country, on_date):
+    """(normalized HS code, duty rule or None, duty in minor units) of one line."""
+    code = normalize_hs_code(line.get('hs_code'))
+    rule = match(duties, code, country, on_date) if code else None
+    duty = money.div_round(line['quantity'] * line['price'] * rule.rate, money.RATE_SCALE) if rule else 0
+    return code, rule, duty
+
+
+def customs_duty(lines, country, on_date=None):
+    """Total duty of `lines` (as for evaluate()) in minor units, rounded per line as there."""
+    country = (country or '').strip().upper()
+    on_date = on_date or timezone.localdate()
+    duties = get_index(DutyRule)
+    return sum(_line_duty(duties, line, country, on_date)[2] for line in lines)
+
+
+def evaluate(lines, country, on_date=None, shipping=0, rounding=None):
+    """Duty and tax for invoice lines shipped to `country` on `on_date` (default today).
+
+    `lines` are dicts with `hs_code`, `quantity` and `price` (minor units).
+    Duty is charged per line on its value and rounded per line; the tax rate
+    becomes the line's tax_percent and goes through money.compute_invoice, so
+    the result matches what creating the invoice with these rates and the
+    summed duty would store. Amounts in the result are minor units.
+    """
+    country = (country or '').strip().upper()
+    on_date = on_date or timezone.localdate()
+    duties, taxes = get_index(DutyRule), get_index(TaxRule)
+
+    out = []
+    for line in lines:
+        code, duty_rule, duty = _line_duty(duties, line, country, on_date)
+        tax_rule = match(taxes, code, country, on_date) if code else None
+        out.append({
+            'hs_code': code,
+            'quantity': line['quantity'],
+            'price': line['price'],
+            'duty_rule': duty_rule.id if duty_rule else None,
+            'duty_rate': duty_rule.rate if duty_rule else 0,
+            'duty': duty,
+            'tax_rule': tax_rule.id if tax_rule else None,
+            'tax_rate': tax_rule.rate if tax_rule else 0,
+        })
+
+    totals = money.compute_invoice(
+        [line['quantity'] for line in out],
+        [line['price'] for line in out],
+        [line['tax_rate'] for line in out],
+        customs_duty=sum(line['duty'] for line in out),
+        shipping=shipping,
+        rounding=rounding,
+    )
+    for line, line_total, tax in zip(out, totals.line_totals, totals.line_taxes):
+        line['line_total'] = line_total
+        line['tax'] = tax
+    return out, totals
+
+
+class TariffInputError(Exception):
+    """Bad dry-run input; `errors` lists offending lines as {'line': i, 'error': ...}."""
+
+    def __init__(self, detail, errors=()):
+        super().__init__(detail)
+        self.detail = detail
+        self.errors = list(errors)
+
+
+def lines_from_data(rows):
+    """Request lines -> evaluate() input. A line may give `product` (id) instead of
+    `hs_code` and/or `price`; those are filled in from the products in one query.
+    """
+    if not isinstance(rows, list) or not rows:
+        raise TariffInputError('Provide a non-empty list of `lines`, or an `invoice` id.')
+    errors, parsed, ids = [], [], set()
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({'line': i, 'error': 'Expected an object.'})
+            continue
+        try:
+            quantity = int(row.get('quantity', 1))
+            price = None if row.get('price') in (None, '') else money.to_minor(row['price'])
+            product = None if row.get('product') in (None, '') else int(row['product'])
+        except (TypeError, ValueError) as exc:
+            errors.append({'line': i, 'error': str(exc) if 'decimal places' in str(exc) else
+                           '`quantity` and `product` must be integers and `price` an amount.'})
+            continue
+        if quantity < 1:
+            errors.append({'line': i, 'error': '`quantity` must be at least 1.'})
+            continue
+        if product is None and (price is None or not row.get('hs_code')):
+            errors.append({'line': i, 'error': 'Give `hs_code` and `price`, or a `product` id.'})
+            continue
+        if product is not None:
+            ids.add(product)
+        parsed.append((i, row.get('hs_code'), quantity, price, product))
+
+    products = Product.objects.in_bulk(ids) if ids else {}
+    lines = []
+    for i, hs_code, quantity, price, product in parsed:
+        if product is not None:
+            found = products.get(product)
+            if found is None:
+                errors.append({'line': i, 'error': f'Unknown product {product}.'})
+                continue
+            hs_code = hs_code or found.hs_code
+            price = money.to_minor(found.price) if price is None else price
+        lines.append({'hs_code': hs_code, 'quantity': quantity, 'price': price})
+    if errors:
+        errors.sort(key=lambda e: e['line'])
+        raise TariffInputError(f'{len(errors)} invalid lines.', errors)
+    return lines
+
+
+def lines_from_invoice(invoice):
+    """evaluate() input for a saved invoice, using its products' current HS codes."""
+    rows = invoice.items.order_by('id').values_list('product__hs_code', 'quantity', 'price')
+    return [{'hs_code': hs, 'quantity': q, 'price': money.to_minor(p)} for hs, q, p in rows]
+
+
+def render(lines, totals):
+    """evaluate() output as API data, amounts and rates as 2-dp Decimals."""
+    d = money.to_decimal
+    return {
+        'lines': [
+            {
+                'hs_code': line['hs_code'],
+                'quantity': line['quantity'],
+                'price': d(line['price']),
+                'line_total': d(line['line_total']),
+                'duty_rule': line['duty_rule'],
+                'duty_percent': d(line['duty_rate']),
+                'duty': d(line['duty']),
+                'tax_rule': line['tax_rule'],
+                'tax_percent': d(line['tax_rate']),
+                'tax': d(line['tax']),
+            }
+            for line in lines
+        ],
+        'unmatched': [i for i, line in enumerate(lines) if line['duty_rule'] is None and line['tax_rule'] is None],
+        'subtotal': d(totals.subtotal),
+        'tax_amount': d(totals.tax_total),
+        'customs_duty': d(totals.customs_duty),
+        'shipping_charges': d(totals.shipping),
+        'total': d(totals.total),
+    }
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from shop import archive
+from shop.models import ArchivedInvoice, Invoice
+
+User = get_user_model()
+
+
+class ArchivedInvoiceListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        closed = archive.current_financial_year() - 1
+        start, _ = archive.financial_year_bounds(closed)
+        self.hot = [self.invoice(f'HOT-{i}', now - timedelta(minutes=i)) for i in range(3)]
+        for i in range(4):
+            self.invoice(f'OLD-{i}', start + timedelta(days=i))
+        archive.archive_financial_year(closed)
+        self.closed_start = timezone.localdate(start)
+
+    def invoice(self, invoice_no, when):
+        # `date` is auto_now_add, so it is moved afterwards
+        invoice = Invoice.objects.create(invoice_no=invoice_no, created_by=self.user, total=1)
+        Invoice.objects.filter(pk=invoice.pk).update(date=when)
+        return invoice
+
+    def test_open_ended_list_reads_only_the_hot_table(self):
+        data = self.client.get('/api/invoices/').json()
+        self.assertEqual([row['id'] for row in data], [invoice.id for invoice in self.hot])
+
+    def test_archive_is_merged_in_pages_when_asked_for(self):
+        ids, url = [], '/api/invoices/?include_archived=1&limit=2'
+        while url:
+            data = self.client.get(url).json()
+            self.assertIsNone(data['previous'])
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        archived = list(ArchivedInvoice.objects.order_by('-date').values_list('id', flat=True))
+        self.assertEqual(ids, [invoice.id for invoice in self.hot] + archived)
+
+    def test_range_reaching_an_archived_year_is_paginated(self):
+        data = self.client.get(f'/api/invoices/?start_date={self.closed_start}').json()
+        self.assertEqual(len(data['results']), 7)
+        self.assertIsNone(data['next'])
@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from shop import catalog, stock
+from shop.models import Product
+
+User = get_user_model()
+
+
+class CatalogChangesTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True))
+        Product.objects.bulk_create([Product(name=f'P{i}', sku=f'P-{i}', price='1.00', stock=5) for i in range(5)])
+        self.products = list(Product.objects.order_by('id'))
+
+    def sync(self, since, limit=500):
+        """Follow `next_since` until `has_more` is false, as an offline client would."""
+        upserts, deletes = {}, set()
+        while True:
+            page = self.client.get('/api/products/changes/', {'since': since, 'limit': limit}).json()
+            for row in page['upserts']:
+                upserts[row['id']] = row
+                deletes.discard(row['id'])
+            for row in page['deletes']:
+                deletes.add(row['id'])
+                upserts.pop(row['id'], None)
+            since = page['next_since']
+            if not page['has_more']:
+                return upserts, deletes, since
+
+    def test_bulk_created_products_get_distinct_revisions(self):
+        revisions = [p.revision for p in self.products]
+        self.assertEqual(len(set(revisions)), len(revisions))
+        self.assertEqual(catalog.current_revision(), max(revisions))
+
+    def test_full_sync_pages_through_the_catalog(self):
+        upserts, deletes, since = self.sync(0, limit=2)
+        self.assertEqual(set(upserts), {p.id for p in self.products})
+        self.assertEqual(deletes, set())
+        self.assertEqual(since, catalog.current_revision())
+
+    def test_delta_returns_edits_and_tombstones_after_the_cursor(self):
+        _, _, since = self.sync(0)
+        edited, deleted, untouched = self.products[0], self.products[1], self.products[2]
+        deleted_id = deleted.id
+        edited.price = '2.00'
+        edited.save()
+        deleted.delete()
+        # bulk stock changes bump revisions through catalog.touch()
+        stock.bulk_adjust([{'product': self.products[3].id, 'change': 1}])
+
+        upserts, deletes, next_since = self.sync(since, limit=1)
+        self.assertEqual(set(upserts), {edited.id, self.products[3].id})
+        self.assertEqual(upserts[edited.id]['price'], '2.00')
+        self.assertEqual(deletes, {deleted_id})
+        self.assertNotIn(untouched.id, upserts)
+        self.assertGreater(next_since, since)
+        # nothing new after the cursor
+        self.assertEqual(self.sync(next_since)[:2], ({}, set()))
+
+    def test_deleted_then_recreated_sku_is_an_upsert(self):
+        _, _, since = self.sync(0)
+        old = self.products[0]
+        old_id = old.id
+        old.delete()
+        new = Product.objects.create(name='P0 again', sku=old.sku, price='1.00')
+        upserts, deletes, _ = self.sync(since)
+        self.assertEqual(set(upserts), {new.id})
+        self.assertEqual(deletes, {old_id})
+
+    def test_since_must_be_an_integer(self):
+        self.assertEqual(self.client.get('/api/products/changes/', {'since': 'x'}).status_code, 400)
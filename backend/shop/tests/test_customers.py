@@ -0,0 +1,35 @@
+from django.test import TestCase
+
+from shop.models import Customer
+
+
+class ResolveTests(TestCase):
+    def test_email_match_wins(self):
+        customer = Customer.objects.resolve('Asha', email='Asha@Example.com')
+        self.assertEqual(Customer.objects.resolve('A. Rao', email='asha@example.com', phone='98450 12345'), customer)
+        customer.refresh_from_db()
+        # blank details are filled in, set ones are kept
+        self.assertEqual((customer.name, customer.phone), ('Asha', '9845012345'))
+
+    def test_phone_matches_a_customer_without_email(self):
+        customer = Customer.objects.resolve('Asha', phone='9845012345')
+        self.assertEqual(Customer.objects.resolve(phone='98450-12345'), customer)
+        self.assertEqual(Customer.objects.resolve(email='asha@example.com', phone='9845012345'), customer)
+        customer.refresh_from_db()
+        self.assertEqual(customer.email, 'asha@example.com')
+
+    def test_shared_phone_with_another_email_is_a_new_customer(self):
+        first = Customer.objects.resolve('Asha', email='asha@example.com', phone='9845012345')
+        second = Customer.objects.resolve('Ravi', email='ravi@example.com', phone='9845012345')
+        self.assertNotEqual(second, first)
+        self.assertEqual((second.email, second.phone), ('ravi@example.com', '9845012345'))
+        first.refresh_from_db()
+        self.assertEqual(first.email, 'asha@example.com')
+        # without an email the phone still finds the (oldest) customer
+        self.assertEqual(Customer.objects.resolve(phone='9845012345'), first)
+
+    def test_name_only_reuses_a_name_only_customer(self):
+        customer = Customer.objects.resolve('  Walk-in  Buyer ')
+        self.assertEqual(Customer.objects.resolve('walk-in buyer'), customer)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertIsNone(Customer.objects.resolve())
@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from shop.models import Product
+
+User = get_user_model()
+
+
+class ProductEmbeddingTests(TestCase):
+    """`product_detail` is embedded by default; `?fields=` and `?include=products` opt out."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [Product.objects.create(name=f'P{i}', sku=f'P-{i}', price='2.00', stock=100) for i in range(3)]
+        for customer in ('Acme', 'Bolt'):
+            body = {'customer_name': customer,
+                    'items': [{'product': p.id, 'quantity': 1, 'price': '2.00'} for p in self.products]}
+            self.assertEqual(self.client.post('/api/invoices/', body, format='json').status_code, 201)
+
+    def lines(self, url):
+        return [item for invoice in self.client.get(url).json() for item in invoice['items']]
+
+    def test_lines_embed_their_product_by_default(self):
+        with self.assertNumQueries(2):  # invoices, lines joined to their products
+            lines = self.lines('/api/invoices/')
+        self.assertEqual({line['product_detail']['name'] for line in lines}, {'P0', 'P1', 'P2'})
+        self.assertEqual(self.lines('/api/invoices/?expand=product'), lines)
+
+    def test_fields_leave_the_product_out_unfetched(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = self.lines('/api/invoices/?fields=id,items.product,items.quantity')
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('shop_product', queries[-1]['sql'])
+        self.assertEqual(lines[0].keys(), {'product', 'quantity'})
+
+    def test_side_loaded_products_are_sent_once(self):
+        data = self.client.get('/api/invoices/?include=products').json()
+        self.assertNotIn('product_detail', data['results'][0]['items'][0])
+        self.assertEqual([p['id'] for p in data['included']['products']], [p.id for p in self.products])
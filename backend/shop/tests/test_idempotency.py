@@ -0,0 +1,95 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from shop import idempotency
+from shop.models import IdempotencyKey, Invoice, Product
+
+User = get_user_model()
+
+
+class InvoiceIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(name='Widget', sku='W-1', price='10.00', stock=100)
+
+    def post(self, key, quantity=2):
+        body = {'customer_name': 'Acme', 'items': [{'product': self.product.id, 'quantity': quantity, 'price': '10.00'}]}
+        return self.client.post('/api/invoices/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post('key-1')
+        second = self.post('key-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.post('key-1')
+        response = self.post('key-1', quantity=3)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+    def test_failed_request_releases_the_key(self):
+        response = self.client.post('/api/invoices/', {'items': [{'product': 0, 'quantity': 1}]}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post('key-1').status_code, status.HTTP_201_CREATED)
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw')
+
+    def request(self):
+        return SimpleNamespace(user=self.user, method='POST', path='/api/invoices/', data={'total': '5.00'})
+
+    def test_second_request_waits_for_the_first_and_replays_it(self):
+        claimed, release = threading.Event(), threading.Event()
+        results, second_runs = {}, []
+
+        def first_run():
+            invoice = Invoice.objects.create(created_by=self.user, total='5.00')
+            claimed.set()
+            release.wait(5)
+            return Response({'id': invoice.id}, status=status.HTTP_201_CREATED)
+
+        def call(name, run):
+            try:
+                results[name] = idempotency.handle(self.request(), 'same-key', run)
+            finally:
+                connection.close()
+
+        def second_run():
+            second_runs.append(1)
+            return Response({'id': None}, status=status.HTTP_201_CREATED)
+
+        first = threading.Thread(target=call, args=('first', first_run))
+        first.start()
+        self.assertTrue(claimed.wait(5))
+        second = threading.Thread(target=call, args=('second', second_run))
+        second.start()
+        # blocked behind the first request, which is still in its transaction
+        time.sleep(0.5)
+        self.assertTrue(second.is_alive())
+        release.set()
+        first.join(10)
+        second.join(10)
+
+        self.assertEqual(second_runs, [])
+        self.assertEqual(results['first'].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(results['second'].status_code, status.HTTP_201_CREATED)
+        self.assertEqual(results['second'].data, results['first'].data)
+        self.assertEqual(Invoice.objects.count(), 1)
@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrates the shop app back to `migrate_from`, lets setUpBeforeMigration()
+    write rows with the models of that state, then migrates to `migrate_to`.
+    """
+    migrate_from = migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate_to_latest)
+        executor.migrate([('shop', self.migrate_from)])
+        self.setUpBeforeMigration(executor.loader.project_state([('shop', self.migrate_from)]).apps)
+        executor = MigrationExecutor(connection)
+        executor.migrate([('shop', self.migrate_to)])
+        self.apps = executor.loader.project_state([('shop', self.migrate_to)]).apps
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+    def assertPartsAddUp(self, invoice):
+        parts = invoice.subtotal + invoice.tax_amount + invoice.customs_duty + invoice.shipping_charges
+        self.assertEqual(parts, invoice.total)
+
+
+class TaxBreakdownBackfillTests(MigrationTestCase):
+    migrate_from = '0010_idempotencykey'
+    migrate_to = '0011_invoice_tax_breakdown'
+
+    def setUpBeforeMigration(self, apps):
+        Product = apps.get_model('shop', 'Product')
+        Invoice = apps.get_model('shop', 'Invoice')
+        InvoiceItem = apps.get_model('shop', 'InvoiceItem')
+        product = Product.objects.create(name='Widget', sku='W-1', price='10.00', stock=5)
+        # lines of 25.50 plus 4.75 of unitemized duty / shipping
+        legacy = Invoice.objects.create(invoice_no='OLD-1', total='30.25')
+        InvoiceItem.objects.create(invoice=legacy, product=product, quantity=2, price='10.00', line_total='20.00')
+        InvoiceItem.objects.create(invoice=legacy, product=product, quantity=1, price='5.50', line_total='5.50')
+        Invoice.objects.create(invoice_no='OLD-2', total='0.00')
+        self.legacy_id = legacy.id
+
+    def test_backfill_keeps_total_equal_to_its_parts(self):
+        Invoice = self.apps.get_model('shop', 'Invoice')
+        legacy = Invoice.objects.get(pk=self.legacy_id)
+        self.assertEqual(legacy.subtotal, Decimal('25.50'))
+        self.assertEqual(legacy.customs_duty, Decimal('4.75'))
+        for invoice in Invoice.objects.all():
+            self.assertPartsAddUp(invoice)
+
+
+class ItemizeLegacyTotalsTests(MigrationTestCase):
+    migrate_from = '0019_daily_sketches'
+    migrate_to = '0020_itemize_legacy_totals'
+
+    def setUpBeforeMigration(self, apps):
+        Invoice = apps.get_model('shop', 'Invoice')
+        # as the first version of 0011 left legacy invoices: only the subtotal filled in
+        self.legacy_id = Invoice.objects.create(invoice_no='OLD-1', subtotal='25.50', total='30.25').id
+        self.current_id = Invoice.objects.create(invoice_no='NEW-1', subtotal='100.00', tax_amount='18.00',
+                                                 shipping_charges='7.00', total='125.00').id
+
+    def test_rest_of_total_is_booked_as_duty(self):
+        Invoice = self.apps.get_model('shop', 'Invoice')
+        self.assertEqual(Invoice.objects.get(pk=self.legacy_id).customs_duty, Decimal('4.75'))
+        current = Invoice.objects.get(pk=self.current_id)
+        self.assertEqual(current.customs_duty, Decimal('0.00'))
+        for invoice in Invoice.objects.all():
+            self.assertPartsAddUp(invoice)
@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from shop import money
+from shop.models import Invoice, Product
+
+User = get_user_model()
+
+
+class ConversionTests(SimpleTestCase):
+    def test_to_minor_is_exact(self):
+        self.assertEqual(money.to_minor('12.34'), 1234)
+        self.assertEqual(money.to_minor(Decimal('0.10')), 10)
+        self.assertEqual(money.to_minor(12), 1200)
+        self.assertEqual(money.to_minor('-0.5'), -50)
+        self.assertEqual(money.to_minor(None), 0)
+
+    def test_to_minor_rejects_sub_minor_amounts_and_junk(self):
+        for value in ('1.005', Decimal('0.001'), 'abc', '', True):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                money.to_minor(value)
+
+    def test_rates_are_hundredths_of_a_percent(self):
+        self.assertEqual(money.to_rate('18'), 1800)
+        self.assertEqual(money.to_rate('5.25'), 525)
+
+    def test_to_decimal_round_trips(self):
+        self.assertEqual(money.to_decimal(1234), Decimal('12.34'))
+        self.assertEqual(money.to_minor(money.to_decimal(-7)), -7)
+
+
+class RoundingTests(SimpleTestCase):
+    def test_div_round_is_half_away_from_zero(self):
+        self.assertEqual(money.div_round(15, 10), 2)
+        self.assertEqual(money.div_round(14, 10), 1)
+        self.assertEqual(money.div_round(-15, 10), -2)
+        self.assertEqual(money.div_round(-14, 10), -1)
+
+    def test_line_rounding_rounds_each_line(self):
+        # three lines of 0.05 at 10%: 0.005 tax each, rounded up per line
+        totals = money.compute_invoice([1, 1, 1], [5, 5, 5], [1000, 1000, 1000], rounding=money.LINE)
+        self.assertEqual(totals.line_taxes, [1, 1, 1])
+        self.assertEqual(totals.tax_total, 3)
+
+    def test_invoice_rounding_rounds_once_and_spreads_the_total(self):
+        totals = money.compute_invoice([1, 1, 1], [5, 5, 5], [1000, 1000, 1000], rounding=money.INVOICE)
+        self.assertEqual(totals.tax_total, 2)
+        self.assertEqual(sum(totals.line_taxes), totals.tax_total)
+        self.assertEqual(totals.line_taxes, [1, 1, 0])
+
+    def test_total_adds_duty_and_shipping_after_tax(self):
+        totals = money.compute_invoice([3, 2], [199, 1050], [1800, 0], customs_duty=120, shipping=250)
+        self.assertEqual(totals.line_totals, [597, 2100])
+        self.assertEqual(totals.subtotal, 2697)
+        # 597 * 18% = 107.46 -> 107
+        self.assertEqual(totals.line_taxes, [107, 0])
+        self.assertEqual(totals.total, 2697 + 107 + 120 + 250)
+
+    def test_unknown_rounding_mode(self):
+        with self.assertRaises(ValueError):
+            money.compute_invoice([1], [100], [0], rounding='banker')
+
+
+class InvoiceTotalsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True))
+        self.product = Product.objects.create(name='Widget', sku='W-1', price='1.99', stock=100)
+
+    def test_stored_totals_are_exact(self):
+        response = self.client.post('/api/invoices/', {
+            'shipping_charges': '2.50',
+            'items': [
+                {'product': self.product.id, 'quantity': 3, 'price': '1.99', 'tax_percent': '18'},
+                {'product': self.product.id, 'quantity': 1, 'price': '0.05', 'tax_percent': '10'},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        invoice = Invoice.objects.get(pk=response.json()['id'])
+        self.assertEqual(invoice.subtotal, Decimal('6.02'))
+        # 1.0746 -> 1.07 and 0.005 -> 0.01
+        self.assertEqual(invoice.tax_amount, Decimal('1.08'))
+        self.assertEqual(invoice.total, Decimal('9.60'))
+        self.assertEqual(sorted(invoice.items.values_list('tax_amount', flat=True)),
+                         [Decimal('0.01'), Decimal('1.07')])
+        # rendered as exact decimal strings
+        self.assertEqual(response.json()['total'], '9.60')
@@ -0,0 +1,99 @@
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from shop import outbox
+from shop.models import OutboxEvent
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.path, [e['id'] for e in json.loads(body)['events']]))
+        self.send_response(self.server.status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DeliveryTests(TestCase):
+    """deliver_pending / deliver_outbox against a webhook stub on localhost."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.received, self.server.status = [], 200
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        base = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.urls = [f'{base}/a', f'{base}/b']
+        self.events = [outbox.record(outbox.STOCK_ADJUSTED, {'n': i}, i) for i in range(3)]
+        self.ids = [e.id for e in self.events]
+
+    def test_each_url_gets_the_batches_in_order(self):
+        self.assertEqual(outbox.deliver_pending(self.urls, batch_size=2, timeout=5), (2, 0))
+        self.assertEqual(outbox.deliver_pending(self.urls, batch_size=2, timeout=5), (1, 0))
+        self.assertEqual(outbox.deliver_pending(self.urls, batch_size=2, timeout=5), (0, None))
+        self.assertEqual(self.server.received, [
+            ('/a', self.ids[:2]), ('/b', self.ids[:2]),
+            ('/a', self.ids[2:]), ('/b', self.ids[2:]),
+        ])
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+        self.assertFalse(OutboxEvent.objects.filter(next_attempt_at__isnull=False).exists())
+
+    def test_server_error_keeps_the_batch_with_backoff(self):
+        self.server.status = 503
+        before = timezone.now()
+        sent, wait = outbox.deliver_pending(self.urls, timeout=5)
+        self.assertEqual(sent, 0)
+        self.assertGreater(wait, 0)
+        for event in OutboxEvent.objects.all():
+            self.assertIsNone(event.delivered_at)
+            self.assertEqual(event.attempts, 1)
+            self.assertGreater(event.next_attempt_at, before)
+            self.assertIn('503', event.last_error)
+        # still backing off: nothing is posted
+        sent, wait = outbox.deliver_pending(self.urls, timeout=5)
+        self.assertEqual(sent, 0)
+        self.assertEqual(len(self.server.received), 1)
+
+        self.server.status = 200
+        OutboxEvent.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.deliver_pending(self.urls, timeout=5), (3, 0))
+        self.assertEqual(OutboxEvent.objects.filter(delivered_at__isnull=False).count(), 3)
+
+    def test_claimed_batch_is_not_sent_twice(self):
+        now = timezone.now()
+        head = self.events[0]
+        # another worker has claimed the head and is sending the batch
+        self.assertTrue(outbox._claim(head, 60, now))
+        self.assertFalse(outbox._claim(head, 60, now))
+        sent, wait = outbox.deliver_pending(self.urls, timeout=5)
+        self.assertEqual(sent, 0)
+        self.assertGreater(wait, 0)
+        self.assertEqual(self.server.received, [])
+        # a delivered head cannot be claimed again either
+        OutboxEvent.objects.update(delivered_at=now, next_attempt_at=None)
+        self.assertFalse(outbox._claim(head, 60, now))
+
+    def test_prune_removes_only_old_delivered_events(self):
+        old = timezone.now() - timedelta(days=30)
+        OutboxEvent.objects.filter(pk__in=self.ids[:2]).update(created_at=old)
+        OutboxEvent.objects.filter(pk__in=[self.ids[0], self.ids[2]]).update(delivered_at=timezone.now())
+        with override_settings(OUTBOX_WEBHOOK_URLS=self.urls):
+            self.assertEqual(outbox.prune(days=7), 1)
+        self.assertEqual(sorted(OutboxEvent.objects.values_list('id', flat=True)), self.ids[1:])
+
+    def test_command_drains_the_outbox_once(self):
+        out = StringIO()
+        call_command('deliver_outbox', '--url', self.urls[0], '--batch-size', '2', '--once', stdout=out)
+        self.assertIn('Delivered 3 events', out.getvalue())
+        self.assertEqual(self.server.received, [('/a', self.ids[:2]), ('/a', self.ids[2:])])
@@ -0,0 +1,89 @@
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from shop import pricing
+from shop.models import PriceHistory, PriceList, PriceRule, Product
+
+
+class PriceListTests(TestCase):
+    def setUp(self):
+        rows = [
+            # sku, hs_code, price
+            ('TEA-1', '0902.10', '0.05'),
+            ('TEA-2', '0902.30', '10.00'),
+            ('TEA-3', None, '3.33'),
+            ('CUP-1', '6912 00', '0.40'),
+            ('CUP-2', '6912-00', '7.99'),
+            ('PEN-1', '9608.10', '1.25'),
+            ('PEN-2', '9608.10', '2.50'),
+            ('MISC-1', '', '5.00'),
+        ]
+        Product.objects.bulk_create([Product(name=sku, sku=sku, hs_code=hs, price=price) for sku, hs, price in rows])
+        self.by_sku = {p.sku: p for p in Product.objects.all()}
+        self.price_list = PriceList.objects.create(name='Spring', effective_from=timezone.localdate())
+        rules = [
+            # first match wins: PEN-1 gets the explicit rule, not the HS one
+            dict(kind=PriceRule.AMOUNT, value='-0.30', product_ids=[self.by_sku['PEN-1'].id]),
+            dict(kind=PriceRule.PERCENT, value='10', sku_prefix='TEA'),
+            dict(kind=PriceRule.AMOUNT, value='-0.50', hs_prefix='6912.00'),
+            dict(kind=PriceRule.PERCENT, value='-12.5', hs_prefix='9608'),
+        ]
+        for position, rule in enumerate(rules):
+            PriceRule.objects.create(price_list=self.price_list, position=position, **rule)
+
+    def prices(self):
+        return dict(Product.objects.values_list('sku', 'price'))
+
+    def test_preview_matches_apply(self):
+        before = self.prices()
+        preview = pricing.preview(self.price_list, limit=1000)
+        # small id ranges so several chunks (and rules with no ids in a chunk) are exercised
+        with mock.patch.object(pricing, 'CHUNK_IDS', 3):
+            changed = pricing.apply(self.price_list)
+
+        after = self.prices()
+        self.assertEqual(changed, preview['products_changed'])
+        self.assertEqual({c['sku']: c['new_price'] for c in preview['changes']},
+                         {sku: price for sku, price in after.items() if price != before[sku]})
+        self.assertEqual(after, {
+            'TEA-1': Decimal('0.06'),   # 0.055 rounds half-up
+            'TEA-2': Decimal('11.00'),
+            'TEA-3': Decimal('3.66'),   # 3.663
+            'CUP-1': Decimal('0.00'),   # never below zero
+            'CUP-2': Decimal('7.49'),
+            'PEN-1': Decimal('0.95'),
+            'PEN-2': Decimal('2.19'),   # 2.1875
+            'MISC-1': Decimal('5.00'),  # no rule matches
+        })
+        self.assertEqual(preview['price_sum_after'] - preview['price_sum_before'],
+                         sum(after.values()) - sum(before.values()))
+
+    def test_apply_records_history_and_new_revisions(self):
+        revisions = dict(Product.objects.values_list('sku', 'revision'))
+        changed = pricing.apply(self.price_list)
+        self.assertEqual(PriceHistory.objects.filter(price_list=self.price_list).count(), changed)
+        products = Product.objects.all()
+        for product in products:
+            if product.sku == 'MISC-1':
+                self.assertEqual(product.revision, revisions['MISC-1'])
+                self.assertIsNone(product.price_list_id)
+            else:
+                self.assertGreater(product.revision, max(revisions.values()))
+                self.assertEqual(product.price_list_id, self.price_list.id)
+        self.assertEqual(len({p.revision for p in products}), len(products))
+
+    def test_a_list_applies_once_and_not_before_its_date(self):
+        pricing.apply(self.price_list)
+        with self.assertRaises(pricing.PricingError):
+            pricing.apply(self.price_list)
+
+        later = PriceList.objects.create(name='Later', effective_from=timezone.localdate() + datetime.timedelta(days=1))
+        PriceRule.objects.create(price_list=later, kind=PriceRule.PERCENT, value='10')
+        with self.assertRaises(pricing.PricingError):
+            pricing.apply(later)
+        # +10% changes every price except the one at zero
+        self.assertEqual(pricing.apply(later, force=True), Product.objects.exclude(price=0).count())
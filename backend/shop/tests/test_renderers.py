@@ -0,0 +1,40 @@
+import datetime
+import decimal
+import unittest
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from shop import renderers
+
+PAYLOAD = {
+    'start': datetime.date(2024, 4, 1),
+    'opens': datetime.time(9, 30, 15, 123456),
+    'at': datetime.datetime(2024, 4, 1, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+    'total': decimal.Decimal('12.50'),
+    'rows': [{'as_of': datetime.date(2024, 3, 31), 'quantity': 3}],
+}
+EXPECTED = (b'{"start":"2024-04-01","opens":"09:30:15.123456","at":"2024-04-01T09:30:15.123456Z",'
+            b'"total":"12.50","rows":[{"as_of":"2024-03-31","quantity":3}]}')
+
+
+@unittest.skipIf(renderers.orjson is None, 'orjson is not installed')
+class FastJSONRendererTests(SimpleTestCase):
+    def render(self, data):
+        return renderers.FastJSONRenderer().render(data, 'application/json')
+
+    def test_dates_are_rendered_by_orjson(self):
+        # the standard library encoder is the fallback; it must not be reached
+        with mock.patch.object(renderers.json, 'dumps', side_effect=AssertionError('fell back to json')):
+            self.assertEqual(self.render(PAYLOAD), EXPECTED)
+
+    def test_fallback_renders_the_same(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(self.render(PAYLOAD), EXPECTED)
+
+    def test_local_datetimes_keep_their_offset(self):
+        ist = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        when = timezone.make_aware(datetime.datetime(2024, 4, 1, 9, 30), ist)
+        with mock.patch.object(renderers.json, 'dumps', side_effect=AssertionError('fell back to json')):
+            self.assertEqual(self.render({'at': when}), b'{"at":"2024-04-01T09:30:00+05:30"}')
@@ -0,0 +1,116 @@
+from collections import Counter
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from shop import sketches
+from shop.models import DailySketch, Product
+
+User = get_user_model()
+
+
+class SketchBoundsTests(TestCase):
+    """Estimates over several merged days against the exact figures."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.start = date(2024, 3, 1)
+        self.end = self.start + timedelta(days=4)
+        self.quantity, self.buyers, self.products = Counter(), set(), set()
+        self.lines = 0
+        for offset in range(5):
+            # skewed, so a few products dominate the quantity as in real sales
+            product_ids = np.minimum(rng.zipf(1.3, 4000), 3000)
+            quantities = rng.integers(1, 6, len(product_ids))
+            customer_ids = rng.integers(1, 5000, 800).tolist()
+            for pid, qty in zip(product_ids.tolist(), quantities.tolist()):
+                self.quantity[pid] += qty
+            self.buyers.update(customer_ids)
+            self.products.update(product_ids.tolist())
+            self.lines += len(product_ids)
+            sketch = sketches.Sketch()
+            sketch.add(len(customer_ids), product_ids, quantities, customer_ids)
+            sketch.to_row(DailySketch(day=self.start + timedelta(days=offset))).save()
+
+    def test_totals_are_exact(self):
+        result = sketches.query(self.start, self.end)
+        self.assertEqual(result['days'], 5)
+        self.assertEqual(result['invoice_count'], 4000)
+        self.assertEqual(result['line_count'], self.lines)
+        self.assertEqual(result['quantity'], sum(self.quantity.values()))
+
+    def test_top_products_are_within_their_bounds(self):
+        result = sketches.query(self.start, self.end, limit=20)
+        error = result['error']
+        self.assertEqual(len(result['top_products']), 20)
+        for row in result['top_products']:
+            true = self.quantity[row['product_id']]
+            self.assertLessEqual(row['at_least'], true)
+            self.assertGreaterEqual(row['at_most'], true)
+            self.assertLessEqual(row['at_most'] - true, error['quantity'])
+            self.assertLessEqual(true - row['at_least'], error['missed'])
+            self.assertTrue(row['at_least'] <= row['quantity'] <= row['at_most'])
+        exact_top = [pid for pid, _ in self.quantity.most_common(5)]
+        self.assertEqual([row['product_id'] for row in result['top_products'][:5]], exact_top)
+
+    def test_every_product_is_within_the_stated_error(self):
+        sketch, _ = sketches.merged(self.start, self.end)
+        error = sketches.query(self.start, self.end)['error']
+        ids = sorted(self.quantity)
+        upper, _ = sketch.estimate(ids)
+        true = np.array([self.quantity[pid] for pid in ids])
+        self.assertTrue((upper >= true).all())
+        # the count-min bound holds per product with the stated probability
+        over = int(np.count_nonzero(upper - true > error['quantity']))
+        self.assertLessEqual(over, (1 - error['confidence']) * len(ids))
+        # Misra-Gries: nothing above `missed` is left out of the candidates
+        for pid in ids:
+            if self.quantity[pid] > error['missed']:
+                self.assertIn(pid, sketch.heavy)
+
+    def test_distinct_counts_are_within_three_standard_errors(self):
+        result = sketches.query(self.start, self.end)
+        relative = result['error']['distinct_relative']
+        for estimate, exact in ((result['distinct_buyers'], len(self.buyers)),
+                                (result['distinct_products'], len(self.products))):
+            self.assertLessEqual(abs(estimate - exact), 3 * relative * exact)
+
+
+class RecordInvoiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [Product.objects.create(name=f'P{i}', sku=f'P-{i}', price='2.00', stock=100) for i in range(3)]
+
+    def post(self, customer, lines):
+        body = {'customer_name': customer,
+                'items': [{'product': self.products[i].id, 'quantity': qty, 'price': '2.00'} for i, qty in lines]}
+        response = self.client.post('/api/invoices/', body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_sketch_is_folded_after_the_invoice_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('Acme', [(0, 2), (1, 1)])
+            # nothing touches the day's row while the invoice transaction is open
+            self.assertFalse(DailySketch.objects.exists())
+        today = timezone.localdate()
+        result = sketches.query(today, today)
+        self.assertEqual((result['invoice_count'], result['line_count'], result['quantity']), (1, 2, 3))
+
+    def test_live_updates_match_a_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('Acme', [(0, 2), (1, 1)])
+            self.post('Bolt', [(0, 5)])
+            self.post('Acme', [(2, 4), (1, 3)])
+        today = timezone.localdate()
+        live = sketches.query(today, today)
+        self.assertEqual(sketches.rebuild(today, today), 1)
+        self.assertEqual(sketches.query(today, today), live)
+        self.assertEqual({row['product_id']: row['quantity'] for row in live['top_products']},
+                         {self.products[0].id: 7, self.products[1].id: 4, self.products[2].id: 4})
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from shop import stock
+from shop.models import Product, StockAdjustment
+
+User = get_user_model()
+
+
+class BulkAdjustTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('keeper', 'keeper@example.com', 'pw', is_staff=True)
+        self.a = Product.objects.create(name='A', sku='A-1', price='1.00', stock=10)
+        self.b = Product.objects.create(name='B', sku='B-1', price='1.00', stock=3)
+
+    def stock_of(self, product):
+        return Product.objects.values_list('stock', flat=True).get(pk=product.pk)
+
+    def test_delta_mode_adds_rows_and_updates_stock(self):
+        applied = stock.bulk_adjust([
+            {'product': self.a.id, 'change': 5},
+            {'sku': 'B-1', 'change': -2, 'reason': 'damaged'},
+            {'product': self.a.id, 'change': -1},
+        ], user=self.user)
+        self.assertEqual(applied, 3)
+        self.assertEqual(self.stock_of(self.a), 14)
+        self.assertEqual(self.stock_of(self.b), 1)
+        self.assertEqual(StockAdjustment.objects.get(product=self.b).reason, 'damaged')
+
+    def test_absolute_mode_records_the_difference(self):
+        applied = stock.bulk_adjust([
+            {'product': self.a.id, 'count': 7},
+            {'sku': 'B-1', 'count': 3},
+        ], mode=stock.ABSOLUTE, user=self.user)
+        # B was counted at its current level: no ledger row
+        self.assertEqual(applied, 1)
+        self.assertEqual(self.stock_of(self.a), 7)
+        self.assertEqual(StockAdjustment.objects.get().change, -3)
+
+    def test_absolute_mode_requires_count(self):
+        with self.assertRaises(stock.BulkAdjustmentError) as ctx:
+            stock.bulk_adjust([
+                {'product': self.a.id, 'count': 4},
+                {'product': self.b.id, 'change': -5},
+            ], mode=stock.ABSOLUTE, user=self.user)
+        self.assertEqual(ctx.exception.errors, [{'row': 1, 'error': '`count` is required in absolute mode.'}])
+        self.assertEqual(self.stock_of(self.a), 10)
+        self.assertEqual(self.stock_of(self.b), 3)
+        self.assertFalse(StockAdjustment.objects.exists())
+
+    def test_invalid_rows_reject_the_whole_batch(self):
+        with self.assertRaises(stock.BulkAdjustmentError) as ctx:
+            stock.bulk_adjust([
+                {'product': self.a.id, 'change': 1},
+                {'product': self.b.id, 'change': -4},
+                {'sku': 'NOPE', 'change': 1},
+            ], user=self.user)
+        self.assertEqual([e['row'] for e in ctx.exception.errors], [1, 2])
+        self.assertEqual(self.stock_of(self.a), 10)
+        self.assertFalse(StockAdjustment.objects.exists())
+
+
+class StockAdjustmentApiTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('keeper', 'k@example.com', 'pw', is_staff=True))
+        self.product = Product.objects.create(name='A', sku='A-1', price='1.00', stock=10)
+
+    def test_ledger_rows_cannot_be_edited_or_deleted(self):
+        response = self.client.post('/api/stock-adjustments/', {'product': self.product.id, 'change': -4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = f'/api/stock-adjustments/{response.json()["id"]}/'
+        self.assertEqual(self.client.patch(url, {'change': 4}, format='json').status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 6)
+
+    def test_bulk_endpoint_reports_row_errors(self):
+        response = self.client.post('/api/stock-adjustments/bulk/', {
+            'mode': 'absolute', 'rows': [{'product': self.product.id}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error_count'], 1)
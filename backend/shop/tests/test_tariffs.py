@@ -0,0 +1,60 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from shop import tariffs
+from shop.models import DutyRule, Invoice, Product
+
+User = get_user_model()
+
+
+class InvoiceDutyTests(TestCase):
+    def setUp(self):
+        tariffs.invalidate()
+        self.user = User.objects.create_user('clerk', 'clerk@example.com', 'pw', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.laptop = Product.objects.create(name='Laptop', sku='L-1', price='333.33', hs_code='8471.30', stock=10)
+        self.cable = Product.objects.create(name='Cable', sku='C-1', price='2.05', hs_code='854442', stock=10)
+        start = date(2020, 1, 1)
+        DutyRule.objects.create(hs_prefix='8471', rate='7.50', effective_from=start)
+        DutyRule.objects.create(hs_prefix='8471', country='US', rate='2.50', effective_from=start)
+        DutyRule.objects.create(hs_prefix='85', rate='10.00', effective_from=start)
+
+    def post(self, **extra):
+        body = {'customer_name': 'Acme', 'items': [
+            {'product': self.laptop.id, 'quantity': 3, 'price': '333.33'},
+            {'product': self.cable.id, 'quantity': 7, 'price': '2.05', 'tax_percent': '18'},
+        ], **extra}
+        response = self.client.post('/api/invoices/', body, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        return Invoice.objects.get(pk=response.json()['id'])
+
+    def test_duty_is_computed_from_the_rules_when_not_posted(self):
+        invoice = self.post()
+        # 999.99 * 7.5% = 75.00 (74.99925), 14.35 * 10% = 1.44 (1.435), each rounded per line
+        self.assertEqual(invoice.customs_duty, Decimal('76.44'))
+        self.assertEqual(invoice.total, invoice.subtotal + invoice.tax_amount + invoice.customs_duty
+                         + invoice.shipping_charges)
+
+    def test_stored_duty_matches_the_dry_run(self):
+        dry = self.client.post('/api/tariffs/evaluate/', {'country': 'us', 'lines': [
+            {'product': self.laptop.id, 'quantity': 3}, {'product': self.cable.id, 'quantity': 7},
+        ]}, format='json').json()
+        invoice = self.post(country='us')
+        self.assertEqual(invoice.customs_duty, Decimal(dry['customs_duty']))
+        self.assertEqual(invoice.customs_duty, Decimal('26.44'))
+
+    def test_posted_duty_is_kept(self):
+        self.assertEqual(self.post(customs_duty='0.00').customs_duty, Decimal('0.00'))
+        self.assertEqual(self.post(customs_duty='12.00').customs_duty, Decimal('12.00'))
+
+    def test_line_hs_code_overrides_the_products(self):
+        body = {'customer_name': 'Acme', 'items': [{'product': self.cable.id, 'quantity': 1, 'price': '100.00',
+                                                    'hs_code': '8471'}]}
+        response = self.client.post('/api/invoices/', body, format='json')
+        self.assertEqual(Decimal(response.json()['customs_duty']), Decimal('7.50'))
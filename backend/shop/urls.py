@@ -1,17 +1,32 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProductViewSet, InvoiceViewSet, StockAdjustmentViewSet, sales_report, sales_report_csv, invoices_report, me, token_auth_by_email, register
+from .views import ProductViewSet, InvoiceViewSet, StockAdjustmentViewSet, CustomerViewSet, PriceListViewSet, sales_report, sales_report_csv, invoices_report, customers_report, pivot_report, snapshot_report, sketch_report, demand_forecasts, demand_forecasts_csv, report_jobs, report_job, report_job_download, tariff_evaluate, events, live_dashboard, dashboard_summary, me, token_auth_by_email, register
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'invoices', InvoiceViewSet, basename='invoice')
 router.register(r'stock-adjustments', StockAdjustmentViewSet, basename='stockadjust')
+router.register(r'customers', CustomerViewSet, basename='customer')
+router.register(r'price-lists', PriceListViewSet, basename='pricelist')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('dashboard/', dashboard_summary, name='dashboard'),
     path('reports/sales/', sales_report, name='reports-sales'),
     path('reports/sales/csv/', sales_report_csv, name='reports-sales-csv'),
     path('reports/invoices/', invoices_report, name='reports-invoices'),
+    path('reports/customers/', customers_report, name='reports-customers'),
+    path('reports/pivot/', pivot_report, name='reports-pivot'),
+    path('reports/snapshot/', snapshot_report, name='reports-snapshot'),
+    path('reports/sketch/', sketch_report, name='reports-sketch'),
+    path('reports/forecasts/', demand_forecasts, name='reports-forecasts'),
+    path('reports/forecasts/csv/', demand_forecasts_csv, name='reports-forecasts-csv'),
+    path('reports/jobs/', report_jobs, name='report-jobs'),
+    path('reports/jobs/<int:pk>/', report_job, name='report-job'),
+    path('reports/jobs/<int:pk>/download/', report_job_download, name='report-job-download'),
+    path('tariffs/evaluate/', tariff_evaluate, name='tariff-evaluate'),
+    path('events/', events, name='events'),
+    path('live/dashboard/', live_dashboard, name='live-dashboard'),
     path('me/', me, name='me'),
     path('token-auth-email/', token_auth_by_email, name='token-auth-email'),
     path('register/', register, name='register'),
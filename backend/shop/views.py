@@ -1,20 +1,32 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from django.db.models import Sum
+from rest_framework.utils.urls import replace_query_param
+from django.db.models import Sum, Count, Max, Min, F, Window, Prefetch
+from django.db.models.functions import RowNumber
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
 from datetime import timedelta
+import base64
+import binascii
 
-from .models import Product, Invoice, StockAdjustment
-from .serializers import ProductSerializer, InvoiceSerializer, StockAdjustmentSerializer
+from .models import Product, Invoice, StockAdjustment, Customer, ArchivedInvoice, ReportJob, DemandForecast, PriceList, PriceHistory, normalize_email, normalize_phone, normalize_name
+from .serializers import ProductSerializer, InvoiceSerializer, StockAdjustmentSerializer, CustomerSerializer, ArchivedInvoiceSerializer, PriceListSerializer, PriceHistorySerializer, parse_field_spec, requested_expansions
+from . import archive, catalog, dashboard, idempotency, jobs, outbox, pivot, pricing, reports, sketches, stock, tariffs
+from .reports import money, invoices_in_range
+from .money import to_decimal, to_minor
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from django.conf import settings
-from django.http import HttpResponse
-import csv
+from django.http import FileResponse, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
-from django.contrib.auth import authenticate, get_user_model
 from rest_framework.authtoken.models import Token
 
 
@@ -26,6 +38,102 @@ class IsAdminOrReadOnly(permissions.BasePermission):
         return bool(request.user and request.user.is_staff)
 
 
+class IsReportUserOrReadOnly(permissions.BasePermission):
+    """Read-only for authenticated users; write only for staff and users with report access."""
+    def has_permission(self, request, view):
+        if not (request.user and request.user.is_authenticated):
+            return False
+        return request.method in permissions.SAFE_METHODS or _can_view_reports(request.user)
+
+
+def _wants_field(request, name):
+    """False when `?fields=` is given and does not select `name` (dotted for nested fields)."""
+    spec = parse_field_spec(request.query_params.get('fields'))
+    for part in name.split('.'):
+        if not spec:
+            return True
+        if part not in spec:
+            return False
+        spec = spec[part]
+    return True
+
+
+def _embeds_products(request, field='product_detail'):
+    """Whether the product rows are rendered under `field` (see DynamicFieldsMixin)."""
+    return 'product' in requested_expansions(request) and _wants_field(request, field)
+
+
+def _with_invoice_lines(qs, request):
+    """Prefetch invoice lines only when they are rendered, and their products only when embedded."""
+    if not _wants_field(request, 'items'):
+        return qs
+    if _embeds_products(request, 'items.product_detail'):
+        # hot or archived lines, whichever table `qs` reads
+        item_model = qs.model._meta.get_field('items').related_model
+        return qs.prefetch_related(Prefetch('items', queryset=item_model.objects.select_related('product')))
+    return qs.prefetch_related('items')
+
+
+def _serialize_invoices(rows, context):
+    """Hot and archived invoices (see archive.newest_first), each with its serializer, in order."""
+    return [(ArchivedInvoiceSerializer if isinstance(row, ArchivedInvoice) else InvoiceSerializer)(row, context=context).data
+            for row in rows]
+
+
+def _encode_cursor(invoice):
+    return base64.urlsafe_b64encode(f'{invoice.date.isoformat()}|{invoice.id}'.encode()).decode()
+
+
+def _decode_cursor(value):
+    """(date, id) of a cursor made by _encode_cursor; NotFound for anything else, like DRF's cursors."""
+    try:
+        when, pk = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+        when = parse_datetime(when)
+        if when is None:
+            raise ValueError
+        return when, int(pk)
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        raise NotFound('Invalid cursor')
+
+
+class SideloadProductsMixin:
+    """`?include=products` returns {"results" (list) or "result" (detail): ..., "included": {"products": [...]}},
+    where every product referenced by the payload is serialized once, from one query;
+    the rows then carry product ids without an embedded `product_detail`.
+    """
+
+    def product_ids(self, rows):
+        return {row.get('product') for row in rows}
+
+    def with_included(self, data, many):
+        includes = {i.strip() for i in self.request.query_params.get('include', '').split(',')}
+        if 'products' not in includes:
+            return data
+        rows = data if many else [data]
+        ids = {pk for pk in self.product_ids(rows) if pk is not None}
+        products = Product.objects.filter(pk__in=ids).order_by('pk')
+        return {
+            'results' if many else 'result': data,
+            'included': {'products': ProductSerializer(products, many=True).data},
+        }
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if isinstance(response.data, dict):
+            # paginated: {"next", "previous", "results"} gains "included" next to the page
+            page = self.with_included(response.data['results'], many=True)
+            if 'included' in page:
+                response.data['included'] = page['included']
+        else:
+            response.data = self.with_included(response.data, many=True)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response.data = self.with_included(response.data, many=False)
+        return response
+
+
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by('-created_at')
     serializer_class = ProductSerializer
@@ -39,9 +147,65 @@ class ProductViewSet(viewsets.ModelViewSet):
             qs = qs.filter(available_for_invoice=True)
         return qs
 
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Catalog delta sync (shop/catalog.py): products changed and deleted after revision `since`.
+        Query params: since (default 0, i.e. the whole catalog), limit (default 500, max 5000),
+        fields as on the list. Store `next_since` and call again while `has_more` is true.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({'detail': '`since` must be an integer revision.'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _limit_param(request, 500, 5000)
+        revision = catalog.current_revision()
+        products, tombstones, next_since, has_more = catalog.changes(since, limit)
+        return Response({
+            'revision': revision,
+            'since': since,
+            'next_since': next_since,
+            'has_more': has_more,
+            'upserts': self.get_serializer(products, many=True).data,
+            'deletes': [{'id': t.product_id, 'sku': t.sku, 'revision': t.revision, 'deleted_at': t.deleted_at}
+                        for t in tombstones],
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='price-history')
+    def price_history(self, request, pk=None):
+        """Price changes of one product, newest first (`?limit=`, default 50)."""
+        product = self.get_object()
+        qs = PriceHistory.objects.filter(product=product).order_by('-changed_at', '-id')
+        data = PriceHistorySerializer(qs[:_limit_param(request, 50, 500)], many=True).data
+        return Response({'product': product.id, 'price': product.price, 'price_list': product.price_list_id,
+                         'history': data}, status=status.HTTP_200_OK)
 
-class InvoiceViewSet(viewsets.ModelViewSet):
-    queryset = Invoice.objects.all().order_by('-date')
+
+def _own_invoices(qs, user):
+    """`qs` (hot or archived invoices) as visible to `user`: everything for staff and users
+    with report access, their own invoices otherwise.
+    """
+    return qs if _can_view_reports(user) else qs.filter(created_by=user)
+
+
+class InvoiceCursorPagination(CursorPagination):
+    # newest first; id breaks ties between invoices created in the same instant
+    ordering = ('-date', '-id')
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+
+class InvoiceViewSet(SideloadProductsMixin, viewsets.ModelViewSet):
+    """Invoices, newest first. The list takes the filters of reports.filter_invoices
+    (status, min_total / max_total, created_by, invoice_no prefix, start_date /
+    end_date, product, hs_code). With `?limit=` (or a `?cursor=` from a previous
+    page) it is cursor-paginated; without, it stays a plain array. Only the hot
+    table is listed unless `start_date` / `end_date` reach an archived financial
+    year (shop/archive.py) or `?include_archived=1` is given; the archived
+    invoices are then merged in, always cursor-paginated, and pages only link
+    forward (`previous` is null).
+    """
+    queryset = Invoice.objects.all().order_by('-date', '-id')
     serializer_class = InvoiceSerializer
     # Only authenticated users who are allowed to generate invoices (or staff) may create/view invoices
     permission_classes = [permissions.IsAuthenticated]
@@ -66,11 +230,85 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         # Fallback to profile flags (profile created automatically)
         return getattr(user, 'profile', None) and user.profile.can_generate_invoice
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            self._paginator = InvoiceCursorPagination() if 'limit' in params or 'cursor' in params else None
+        return self._paginator
+
     def get_queryset(self):
-        user = self.request.user
-        if user.is_staff:
-            return Invoice.objects.all().order_by('-date')
-        return Invoice.objects.filter(created_by=user).order_by('-date')
+        qs = _own_invoices(Invoice.objects.all(), self.request.user).order_by('-date', '-id')
+        if self.action == 'list':
+            try:
+                qs = reports.filter_invoices(qs, self.request.query_params)
+            except ValueError as e:
+                raise ParseError(str(e))
+        return _with_invoice_lines(qs, self.request)
+
+    def product_ids(self, rows):
+        return {item.get('product') for row in rows for item in row.get('items', [])}
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            sd, ed = reports.parse_date(params.get('start_date')), reports.parse_date(params.get('end_date'))
+        except ValueError:
+            raise ParseError('Invalid date format, use YYYY-MM-DD.')
+        # an open-ended list stays on the hot table; the archive is only read when asked for
+        if sd or ed or params.get('include_archived') in ('1', 'true', 'True'):
+            sources = archive.sources(sd, ed)
+        else:
+            sources = [archive.HOT]
+        if len(sources) == 1:
+            return super().list(request, *args, **kwargs)
+        return self._list_with_archive(request, sources)
+
+    def _list_with_archive(self, request, sources):
+        """The list over the hot and archive tables, merged newest first with a (date, id) keyset.
+        Always paginated, so a request reads at most one page per table.
+        """
+        querysets = []
+        for invoice_model, _ in sources:
+            try:
+                qs = reports.filter_invoices(_own_invoices(invoice_model.objects.all(), request.user),
+                                             request.query_params)
+            except ValueError as e:
+                raise ParseError(str(e))
+            querysets.append(_with_invoice_lines(qs, request))
+        context = self.get_serializer_context()
+        paginator = self.paginator or InvoiceCursorPagination()
+        limit = paginator.get_page_size(request)
+        cursor = request.query_params.get(paginator.cursor_query_param)
+        rows = archive.newest_first(querysets, limit + 1, _decode_cursor(cursor) if cursor else None)
+        page = rows[:limit]
+        data = {
+            'next': replace_query_param(request.build_absolute_uri(), paginator.cursor_query_param,
+                                        _encode_cursor(page[-1])) if len(rows) > limit else None,
+            'previous': None,
+            'results': _serialize_invoices(page, context),
+        }
+        included = self.with_included(data['results'], many=True)
+        if 'included' in included:
+            data['included'] = included['included']
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # invoices of closed financial years live in the archive tables (see shop/archive.py)
+            qs = _own_invoices(ArchivedInvoice.objects.prefetch_related('items__product'), request.user)
+            invoice = get_object_or_404(qs, pk=kwargs.get('pk'))
+            data = ArchivedInvoiceSerializer(invoice, context={'request': request}).data
+            return Response(self.with_included(data, many=False))
+
+    def create(self, request, *args, **kwargs):
+        # clients on flaky networks retry POSTs; with a key each invoice is created once
+        key = request.headers.get(idempotency.HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        return idempotency.handle(request, key, lambda: super(InvoiceViewSet, self).create(request, *args, **kwargs))
 
     def perform_create(self, serializer):
         # enforce that only allowed users can create invoices
@@ -85,11 +323,177 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         serializer.save(created_by=user)
 
 
-class StockAdjustmentViewSet(viewsets.ModelViewSet):
+class StockAdjustmentViewSet(SideloadProductsMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                             mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """The stock ledger. Rows are only ever added, each applying its change to
+    Product.stock; a correction is a new adjustment, so there is no update or delete.
+    """
     queryset = StockAdjustment.objects.all().order_by('-created_at')
     serializer_class = StockAdjustmentSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrReadOnly]
 
+    def get_queryset(self):
+        qs = super().get_queryset()
+        # the product row is only needed when it is embedded
+        if _embeds_products(self.request):
+            qs = qs.select_related('product')
+        return qs
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            adjustment = serializer.save(created_by=self.request.user)
+            stock.apply_change(adjustment)
+            outbox.record(outbox.STOCK_ADJUSTED, outbox.stock_adjustment_payload(adjustment), adjustment.id)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Apply many adjustments in one transaction (e.g. a stock count).
+        Body: {"mode": "delta" (default) or "absolute", "reason": default reason,
+               "rows": [{"product": id or "sku": code, "change": n (delta) / "count": n (absolute), "reason": ...}]}
+        All rows are validated first; if any is invalid nothing is applied.
+        """
+        try:
+            created = stock.bulk_adjust(
+                request.data.get('rows'),
+                mode=request.data.get('mode', stock.DELTA),
+                user=request.user,
+                reason=request.data.get('reason', ''),
+            )
+        except stock.BulkAdjustmentError as exc:
+            return Response({'detail': exc.detail, 'errors': exc.errors, 'error_count': exc.error_count},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'applied': created}, status=status.HTTP_200_OK)
+
+
+def _can_view_reports(user):
+    return user.is_staff or bool(getattr(user, 'profile', None) and user.profile.can_view_reports)
+
+
+def _limit_param(request, default, maximum):
+    try:
+        return max(1, min(int(request.query_params.get('limit', default)), maximum))
+    except (TypeError, ValueError):
+        return default
+
+
+def _prefix_filter(qs, field, prefix):
+    # a half-open range instead of LIKE so SQLite can walk the b-tree index on `field`
+    return qs.filter(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'})
+
+
+class CustomerViewSet(viewsets.ModelViewSet):
+    """Customers captured from invoices.
+
+    Staff and users with report access see and edit every customer; other users
+    get a read-only view of the customers on their own invoices. `?q=` is a
+    typeahead: it prefix-matches email when it contains '@', phone when it is
+    numeric and the name otherwise, always through an indexed range scan.
+    Lists are capped by `?limit=` (default 20) because the table can be large.
+    """
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    permission_classes = [IsReportUserOrReadOnly]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        user = self.request.user
+        if not _can_view_reports(user):
+            qs = qs & Customer.objects.of_user(user)
+        if self.action != 'list':
+            return qs
+        q = (self.request.query_params.get('q') or '').strip()
+        if not q:
+            qs = qs.order_by('-id')
+        elif '@' in q:
+            qs = _prefix_filter(qs, 'email', normalize_email(q)).order_by('email')
+        elif normalize_phone(q) and not any(ch.isalpha() for ch in q):
+            qs = _prefix_filter(qs, 'phone', normalize_phone(q)).order_by('phone')
+        else:
+            qs = _prefix_filter(qs, 'name_key', normalize_name(q)).order_by('name_key')
+        return qs[:_limit_param(self.request, 20, 100)]
+
+    @action(detail=True, methods=['get'])
+    def invoices(self, request, pk=None):
+        """Invoice history for one customer, newest first, archived years included
+        (`?limit=`, `?before=<invoice id>`).
+        """
+        customer = self.get_object()
+        sources = archive.sources()
+        before = None
+        if request.query_params.get('before'):
+            try:
+                before_id = int(request.query_params['before'])
+            except ValueError:
+                return Response({'detail': '`before` must be an invoice id.'}, status=status.HTTP_400_BAD_REQUEST)
+            # the anchor may be in either table; archived invoices keep their ids
+            for invoice_model, _ in sources:
+                before = invoice_model.objects.filter(pk=before_id, customer=customer).values_list('date', 'id').first()
+                if before is not None:
+                    break
+            if before is None:
+                return Response({'detail': 'Unknown invoice in `before`.'}, status=status.HTTP_400_BAD_REQUEST)
+        querysets = [_with_invoice_lines(_own_invoices(invoice_model.objects.filter(customer=customer), request.user),
+                                         request)
+                     for invoice_model, _ in sources]
+        invoices = archive.newest_first(querysets, _limit_param(request, 50, 500), before)
+        data = _serialize_invoices(invoices, {'request': request})
+        return Response({'invoices': data, 'count': len(data)}, status=status.HTTP_200_OK)
+
+
+class PriceListViewSet(viewsets.ModelViewSet):
+    """Price lists and their rules (shop/pricing.py), staff only.
+
+    `preview` shows what applying the list would change without writing;
+    `apply` reprices the catalog now (`{"force": true}` before the list's
+    effective date). Applied lists are read-only.
+    """
+    queryset = PriceList.objects.prefetch_related('rules')
+    serializer_class = PriceListSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def perform_destroy(self, instance):
+        if instance.applied_at is not None:
+            raise ParseError('An applied price list cannot be deleted.')
+        instance.delete()
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        try:
+            data = pricing.preview(self.get_object(), limit=_limit_param(request, 100, 1000))
+        except pricing.PricingError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    def apply(self, request, pk=None):
+        price_list = self.get_object()
+        try:
+            pricing.apply(price_list, user=request.user, force=bool(request.data.get('force')))
+        except pricing.PricingError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        price_list.refresh_from_db()
+        return Response(self.get_serializer(price_list).data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def dashboard_summary(request):
+    """Everything the dashboard pages need on load, in one response (see shop/dashboard.py):
+    counts, today / this month / last 30 days totals, daily and monthly series, top
+    products, low-stock items and recent invoices, plus the caller's profile. Users
+    without report access see their own invoices only. Cached briefly per scope.
+    """
+    user = request.user
+    profile = getattr(user, 'profile', None)
+    scope = None if _can_view_reports(user) else user
+    result, hit = dashboard.cached_build(scope)
+    return Response(dict(result, cached=hit, user={
+        'username': user.username,
+        'is_staff': user.is_staff,
+        'can_generate_invoice': bool(getattr(profile, 'can_generate_invoice', False)),
+        'can_view_reports': bool(getattr(profile, 'can_view_reports', False)),
+    }), status=status.HTTP_200_OK)
+
 
 # Rich sales report endpoint
 @api_view(['GET'])
@@ -109,7 +513,7 @@ def sales_report(request):
     start_date = request.query_params.get('start_date')
     end_date = request.query_params.get('end_date')
     # parse dates (simple YYYY-MM-DD)
-    from datetime import datetime, date
+    from datetime import datetime
     try:
         if start_date:
             sd = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -123,95 +527,9 @@ def sales_report(request):
         return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
 
     # If allowed, include all invoices; otherwise restrict to invoices created by this user
-    if allowed:
-        invoices = Invoice.objects.all()
-    else:
-        invoices = Invoice.objects.filter(created_by=user)
-
-    if sd:
-        invoices = invoices.filter(date__date__gte=sd)
-    if ed:
-        invoices = invoices.filter(date__date__lte=ed)
-
-    # totals
-    total_sales = invoices.aggregate(sum=Sum('total'))['sum'] or 0
-    invoice_count = invoices.count()
-
-    # sales by product
-    from .models import InvoiceItem
-    products_qs = (
-        InvoiceItem.objects.filter(invoice__in=invoices)
-        .values('product__id', 'product__name')
-        .annotate(total_quantity=Sum('quantity'), total_sales=Sum('line_total'))
-        .order_by('-total_sales')
-    )
-    sales_by_product = []
-    for p in products_qs:
-        sales_by_product.append({
-            'product_id': p['product__id'],
-            'product_name': p['product__name'],
-            'total_quantity': int(p['total_quantity'] or 0),
-            'total_sales': float(p['total_sales'] or 0)
-        })
-
-    # sales by user
-    users_qs = (
-        invoices
-        .values('created_by__id', 'created_by__username')
-        .annotate(total_sales=Sum('total'), invoice_count=Sum(1))
-        .order_by('-total_sales')
-    )
-    sales_by_user = []
-    for u in users_qs:
-        sales_by_user.append({
-            'user_id': u['created_by__id'],
-            'username': u.get('created_by__username'),
-            'total_sales': float(u['total_sales'] or 0),
-            'invoice_count': int(u['invoice_count'] or 0)
-        })
+    scope = None if allowed else user
 
-    # top products
-    top_products = sales_by_product[:10]
-
-    # monthly sales for last 12 months (relative to end_date or today)
-    today = date.today() if ed is None else ed
-    months = []
-    for i in range(11, -1, -1):
-        total_month = today.year * 12 + today.month - 1 - i
-        y = total_month // 12
-        m = total_month % 12 + 1
-        s = Invoice.objects.filter(date__year=y, date__month=m)
-        # if the caller provided a start/end, also apply those
-        if sd:
-            s = s.filter(date__date__gte=sd)
-        if ed:
-            s = s.filter(date__date__lte=ed)
-        ssum = s.aggregate(sales=Sum('total'))['sales'] or 0
-        months.append({'year': y, 'month': m, 'sales': float(ssum)})
-
-    # daily sales for last 30 days
-    daily = []
-    from datetime import timedelta
-    end_day = today
-    for i in range(29, -1, -1):
-        d = end_day - timedelta(days=i)
-        dqs = Invoice.objects.filter(date__date=d)
-        if sd:
-            dqs = dqs.filter(date__date__gte=sd)
-        if ed:
-            dqs = dqs.filter(date__date__lte=ed)
-        s = dqs.aggregate(sales=Sum('total'))['sales'] or 0
-        daily.append({'date': d.isoformat(), 'sales': float(s)})
-
-    return Response({
-        'total_sales': float(total_sales),
-        'invoice_count': invoice_count,
-        'sales_by_product': sales_by_product,
-        'sales_by_user': sales_by_user,
-        'top_products': top_products,
-        'monthly_sales_last_12': months,
-        'daily_sales_last_30': daily,
-    }, status=status.HTTP_200_OK)
+    return Response(reports.sales_report(sd, ed, scope), status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
@@ -220,7 +538,8 @@ def invoices_report(request):
     """Return a list of invoices (id, invoice_no, date, created_by, total, item_count).
     - staff users see all invoices
     - normal users see only their invoices
-    Accepts optional `start_date` and `end_date` (YYYY-MM-DD)
+    Accepts optional `start_date` and `end_date` (YYYY-MM-DD) and the other
+    invoice list filters of reports.filter_invoices (status, totals, product, ...)
     """
     user = request.user
     # permission: staff or profile.can_view_reports can view others; otherwise user can view their own
@@ -233,22 +552,27 @@ def invoices_report(request):
     except Exception:
         return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    qs = Invoice.objects.all().order_by('-date') if user.is_staff or (getattr(user, 'profile', None) and user.profile.can_view_reports) else Invoice.objects.filter(created_by=user).order_by('-date')
-    if sd:
-        qs = qs.filter(date__date__gte=sd)
-    if ed:
-        qs = qs.filter(date__date__lte=ed)
+    scope = None if user.is_staff or (getattr(user, 'profile', None) and user.profile.can_view_reports) else user
 
     out = []
-    for inv in qs.select_related('created_by').prefetch_related('items')[:200]:
-        out.append({
-            'id': inv.id,
-            'invoice_no': inv.invoice_no,
-            'date': inv.date.isoformat(),
-            'created_by': inv.created_by.username if inv.created_by else None,
-            'total': float(inv.total),
-            'item_count': inv.items.count(),
-        })
+    for invoice_model, _ in archive.sources(sd, ed):
+        try:
+            qs = reports.filter_invoices(invoices_in_range(invoice_model, sd, ed, scope), request.query_params)
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        qs = qs.order_by('-date', '-id')
+        for inv in qs.select_related('created_by').annotate(item_count=Count('items'))[:200]:
+            out.append({
+                'id': inv.id,
+                'invoice_no': inv.invoice_no,
+                'date': inv.date.isoformat(),
+                'created_by': inv.created_by.username if inv.created_by else None,
+                'total': money(inv.total),
+                'item_count': inv.item_count,
+            })
+    # hot and archived rows interleave by date; keep the newest 200 overall
+    out.sort(key=lambda r: r['date'], reverse=True)
+    out = out[:200]
 
     return Response({'invoices': out, 'count': len(out)}, status=status.HTTP_200_OK)
 
@@ -272,28 +596,445 @@ def sales_report_csv(request):
     except Exception:
         return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    from .models import InvoiceItem, Invoice
-    invoices = Invoice.objects.all()
-    if sd:
-        invoices = invoices.filter(date__date__gte=sd)
-    if ed:
-        invoices = invoices.filter(date__date__lte=ed)
-
-    items_qs = (
-        InvoiceItem.objects.filter(invoice__in=invoices)
-        .values('product__id', 'product__name')
-        .annotate(total_quantity=Sum('quantity'), total_sales=Sum('line_total'))
-        .order_by('-total_sales')
-    )
-
     # build CSV response
     response = HttpResponse(content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="sales_by_product.csv"'
-    writer = csv.writer(response)
-    writer.writerow(['product_id', 'product_name', 'total_quantity', 'total_sales'])
-    for p in items_qs:
-        writer.writerow([p['product__id'], p['product__name'], int(p['total_quantity'] or 0), float(p['total_sales'] or 0)])
+    reports.write_sales_csv(response, sd, ed)
+
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def customers_report(request):
+    """Per-customer lifetime value, invoice count, first/last purchase and top product.
+    Query params: start_date / end_date (YYYY-MM-DD), customer=<id>, limit (default 50).
+    Customers are ranked by lifetime value. Runs two grouped queries per table
+    regardless of how many customers are returned. Requires staff or profile.can_view_reports.
+    """
+    if not _can_view_reports(request.user):
+        return Response({'detail': 'You do not have permission to view reports.'}, status=status.HTTP_403_FORBIDDEN)
+
+    from datetime import datetime
+    start_date = request.query_params.get('start_date')
+    end_date = request.query_params.get('end_date')
+    try:
+        sd = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        ed = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except Exception:
+        return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        customer_id = int(request.query_params['customer']) if request.query_params.get('customer') else None
+    except ValueError:
+        return Response({'detail': '`customer` must be a customer id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    def customer_invoices(invoice_model):
+        invoices = invoices_in_range(invoice_model, sd, ed).filter(customer__isnull=False)
+        if customer_id is not None:
+            invoices = invoices.filter(customer_id=customer_id)
+        return invoices
+
+    limit = _limit_param(request, 50, 1000)
+    sources = archive.sources(sd, ed)
+    # with a single table SQL can rank and cut; with the archive involved partial
+    # results are merged first, because a customer may have rows in both tables
+    single = len(sources) == 1
+
+    # one GROUP BY customer for the headline numbers
+    summaries = {}
+    for invoice_model, _ in sources:
+        summary_qs = (
+            customer_invoices(invoice_model)
+            .values('customer_id', 'customer__name', 'customer__email', 'customer__phone')
+            .annotate(
+                lifetime_value=Sum('total'),
+                invoice_count=Count('id'),
+                first_purchase=Min('date'),
+                last_purchase=Max('date'),
+            )
+            .order_by('-lifetime_value', 'customer_id')
+        )
+        if single:
+            summary_qs = summary_qs[:limit]
+        for r in summary_qs:
+            row = summaries.get(r['customer_id'])
+            if row is None:
+                summaries[r['customer_id']] = r
+                continue
+            row['lifetime_value'] = (row['lifetime_value'] or 0) + (r['lifetime_value'] or 0)
+            row['invoice_count'] += r['invoice_count']
+            row['first_purchase'] = min(row['first_purchase'], r['first_purchase'])
+            row['last_purchase'] = max(row['last_purchase'], r['last_purchase'])
+    rows = sorted(summaries.values(), key=lambda r: (-(r['lifetime_value'] or 0), r['customer_id']))[:limit]
+    ids = [r['customer_id'] for r in rows]
+
+    # one GROUP BY (customer, product), ranked per customer for the top product
+    lines = {}
+    for invoice_model, item_model in sources:
+        top_qs = (
+            item_model.objects.filter(invoice__in=customer_invoices(invoice_model).filter(customer_id__in=ids))
+            .values('invoice__customer_id', 'product_id', 'product__name')
+            .annotate(total_quantity=Sum('quantity'), total_sales=Sum('line_total'))
+        )
+        if single:
+            top_qs = top_qs.annotate(rank=Window(
+                RowNumber(),
+                partition_by=F('invoice__customer_id'),
+                order_by=[F('total_quantity').desc(), F('product_id').asc()],
+            )).filter(rank=1)
+        for t in top_qs:
+            key = (t['invoice__customer_id'], t['product_id'])
+            if key in lines:
+                lines[key]['total_quantity'] += t['total_quantity'] or 0
+                lines[key]['total_sales'] += t['total_sales'] or 0
+            else:
+                lines[key] = t
+    top_by_customer = {}
+    for (customer_id, product_id), t in sorted(lines.items()):
+        best = top_by_customer.get(customer_id)
+        if best is None or (t['total_quantity'] or 0) > (best['total_quantity'] or 0):
+            top_by_customer[customer_id] = t
+
+    out = []
+    for r in rows:
+        top = top_by_customer.get(r['customer_id'])
+        out.append({
+            'customer_id': r['customer_id'],
+            'name': r['customer__name'],
+            'email': r['customer__email'],
+            'phone': r['customer__phone'],
+            'lifetime_value': money(r['lifetime_value']),
+            'invoice_count': r['invoice_count'],
+            'first_purchase': r['first_purchase'].isoformat() if r['first_purchase'] else None,
+            'last_purchase': r['last_purchase'].isoformat() if r['last_purchase'] else None,
+            'top_product': {
+                'product_id': top['product_id'],
+                'product_name': top['product__name'],
+                'total_quantity': int(top['total_quantity'] or 0),
+                'total_sales': money(top['total_sales']),
+            } if top else None,
+        })
+
+    return Response({'customers': out, 'count': len(out)}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def pivot_report(request):
+    """Group-by over invoice lines in one query (see shop/pivot.py). Query params:
+      - dimensions: 1-2 of product, hs_code, status, user, customer, day, week, month, quarter, year
+      - measures: any of sales, tax, quantity, lines, invoices (default sales,quantity)
+      - start_date / end_date (YYYY-MM-DD), status, product, customer (comma lists), hs_code (prefix)
+    Returns columns of equal length, one per dimension and measure. Users without
+    report access only see their own invoices.
+    """
+    try:
+        spec = pivot.parse(request.query_params)
+    except pivot.PivotError as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    scope = None if _can_view_reports(request.user) else request.user
+    result, hit = pivot.cached_run(spec, scope)
+    return Response(dict(result, cached=hit), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def sketch_report(request):
+    """Approximate totals, distinct buyers / products and top products from the per-day
+    sketches (shop/sketches.py), with their error bounds; the cost depends on the number
+    of days, not of invoice lines. Query params: start_date / end_date (YYYY-MM-DD, default
+    this quarter to date), limit (default 10, max 100). Requires report access.
+    """
+    if not _can_view_reports(request.user):
+        return Response({'detail': 'You do not have permission to view reports.'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        ed = reports.parse_date(request.query_params.get('end_date')) or timezone.localdate()
+        sd = reports.parse_date(request.query_params.get('start_date')) or sketches.quarter_start(ed)
+    except ValueError:
+        return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(sketches.query(sd, ed, limit=_limit_param(request, 10, 100)), status=status.HTTP_200_OK)
+
+
+# column order matches forecast.CSV_HEADER
+FORECAST_FIELDS = ['product_id', 'product__sku', 'product__name', 'product__stock', 'method', 'alpha',
+                   'demand_30', 'demand_60', 'demand_90', 'backtest_mae', 'history_units', 'as_of', 'generated_at']
+FORECAST_ORDERINGS = {'demand_30': '-demand_30', 'product': 'product_id'}
+
+
+def _forecast_rows(request):
+    qs = DemandForecast.objects.all()
+    products = [p for p in request.query_params.get('product', '').split(',') if p.strip()]
+    if products:
+        qs = qs.filter(product_id__in=[int(p) for p in products])
+    method = request.query_params.get('method')
+    if method:
+        qs = qs.filter(method=method)
+    return qs
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def demand_forecasts(request):
+    """Latest 30/60/90-day demand forecasts (manage.py forecast_demand, shop/forecast.py).
+    Query params: product=<id>[,<id>...], method (ses|seasonal_naive|none),
+    order (demand_30 default, highest first | product), limit (default 100, max 1000).
+    Requires staff or profile.can_view_reports.
+    """
+    if not _can_view_reports(request.user):
+        return Response({'detail': 'You do not have permission to view reports.'}, status=status.HTTP_403_FORBIDDEN)
+    order = FORECAST_ORDERINGS.get(request.query_params.get('order', 'demand_30'))
+    if order is None:
+        return Response({'detail': '`order` must be demand_30 or product.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        qs = _forecast_rows(request)
+    except ValueError:
+        return Response({'detail': '`product` takes product ids.'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = _limit_param(request, 100, 1000)
+    from .forecast import CSV_HEADER
+    rows = [dict(zip(CSV_HEADER, r)) for r in qs.order_by(order, 'product_id').values_list(*FORECAST_FIELDS)[:limit]]
+    return Response({'forecasts': rows, 'count': len(rows)}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def demand_forecasts_csv(request):
+    """Every forecast row as CSV, streamed in product order; same filters as demand_forecasts."""
+    if not _can_view_reports(request.user):
+        return Response({'detail': 'You do not have permission to view reports.'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        qs = _forecast_rows(request)
+    except ValueError:
+        return Response({'detail': '`product` takes product ids.'}, status=status.HTTP_400_BAD_REQUEST)
+    from django.http import StreamingHttpResponse
+    from . import forecast
+    rows = qs.order_by('product_id').values_list(*FORECAST_FIELDS).iterator(chunk_size=5000)
+    response = StreamingHttpResponse(forecast.csv_lines(rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="demand_forecasts.csv"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def snapshot_report(request):
+    """Totals, top products and a sales series from the column-file snapshot
+    (manage.py analytics_snapshot); the database is not queried for them.
+    Query params: start_date / end_date (YYYY-MM-DD), top (default 10), freq (day|month).
+    Users without report access only see their own invoices.
+    """
+    from . import columnar
+    try:
+        sd = reports.parse_date(request.query_params.get('start_date'))
+        ed = reports.parse_date(request.query_params.get('end_date'))
+    except ValueError:
+        return Response({'detail': 'Invalid date format, use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+    freq = request.query_params.get('freq', 'day')
+    if freq not in ('day', 'month'):
+        return Response({'detail': '`freq` must be day or month.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        snap = columnar.open_snapshot()
+    except FileNotFoundError:
+        return Response({'detail': 'No analytics snapshot yet.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    user = None
+    if not _can_view_reports(request.user):
+        user = snap.user_code(request.user.id)
+        if user is None:
+            # no invoices of theirs in the snapshot; match nothing
+            user = columnar.NONE - 1
+    try:
+        n = max(1, min(int(request.query_params.get('top', 10)), 100))
+    except ValueError:
+        n = 10
+    totals = columnar.totals(snap, sd, ed, user)
+    top = columnar.top_products(snap, n, sd, ed, user)
+    series = columnar.time_series(snap, freq, sd, ed, user)
+    return Response({
+        'snapshot_updated_at': snap.manifest.get('updated_at'),
+        'high_water_invoice': snap.manifest['high_water'],
+        'total_sales': to_decimal(totals['sales']),
+        'tax': to_decimal(totals['tax']),
+        'quantity': totals['quantity'],
+        'line_count': totals['lines'],
+        'invoice_count': totals['invoices'],
+        'top_products': [{'product_id': pid, 'product_name': name, 'total_sales': to_decimal(sales),
+                          'total_quantity': qty} for pid, name, sales, qty in top],
+        'series': {'freq': freq, 'period': [p.isoformat() for p, _, _ in series],
+                   'sales': [to_decimal(s) for _, s, _ in series], 'quantity': [q for _, _, q in series]},
+    }, status=status.HTTP_200_OK)
+
+
+def _can_view_job(user, job):
+    scope = job.params.get('scope')
+    if scope is None:
+        return _can_view_reports(user)
+    return scope == user.id or user.is_staff
+
+
+def _get_job(request, pk):
+    job = get_object_or_404(ReportJob, pk=pk)
+    if not _can_view_job(request.user, job):
+        raise Http404
+    return job
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def report_jobs(request):
+    """Queue a report to be computed by the `run_report_jobs` worker.
+    POST {kind: sales_report|sales_csv, start_date, end_date} returns the job at once:
+    202 for a new job, 200 when an identical job is queued, running or reusable.
+    GET lists the caller's recent jobs.
+    """
+    if request.method == 'GET':
+        qs = ReportJob.objects.filter(created_by=request.user).order_by('-id')[:_limit_param(request, 20, 100)]
+        return Response({'jobs': [jobs.serialize(j, request) for j in qs]}, status=status.HTTP_200_OK)
+
+    kind = request.data.get('kind', 'sales_report')
+    allowed = _can_view_reports(request.user)
+    if kind in jobs.ORG_WIDE_KINDS and not allowed:
+        return Response({'detail': 'You do not have permission to view reports.'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        params = jobs.clean_params(kind, request.data, None if allowed else request.user.id)
+    except ValueError as exc:
+        detail = str(exc) if kind not in jobs.KINDS else 'Invalid date format, use YYYY-MM-DD.'
+        return Response({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+
+    job, created = jobs.submit(kind, params, request.user)
+    return Response(jobs.serialize(job, request), status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def report_job(request, pk):
+    """Status of a report job; `download_url` is set once it is DONE."""
+    return Response(jobs.serialize(_get_job(request, pk), request), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def report_job_download(request, pk):
+    """The result file of a finished report job."""
+    job = _get_job(request, pk)
+    if job.status != ReportJob.DONE:
+        return Response({'detail': f'Report is not ready (status {job.status}).'}, status=status.HTTP_409_CONFLICT)
+    path = jobs.result_path(job)
+    if not path.exists():
+        return Response({'detail': 'Report file is gone, submit the job again.'}, status=status.HTTP_410_GONE)
+    _, content_type = jobs.KINDS[job.kind]
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.result_file, content_type=content_type)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def tariff_evaluate(request):
+    """Dry run of the duty / tax rules (DutyRule, TaxRule); nothing is saved.
+    POST {country, date (YYYY-MM-DD, default today), shipping_charges,
+    lines: [{hs_code, quantity, price} or {product, quantity}]} or {country, invoice: <id>}.
+    Returns per-line duty and tax, and the invoice totals they add up to. Invoices
+    posted without `customs_duty` store the same duty (for their `country`, on the
+    day they are created); tax rates are only applied when posted as `tax_percent`.
+    """
+    data = request.data
+    try:
+        on_date = reports.parse_date(data.get('date'))
+        shipping = to_minor(data.get('shipping_charges') or 0)
+        invoice_id = None if data.get('invoice') in (None, '') else int(data['invoice'])
+    except (TypeError, ValueError):
+        return Response({'detail': 'Use YYYY-MM-DD for `date`, an amount for `shipping_charges` '
+                                   'and an id for `invoice`.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        if invoice_id is not None:
+            # scoped like the invoice list: another user's invoice is a 404
+            lines = tariffs.lines_from_invoice(get_object_or_404(_own_invoices(Invoice.objects.all(), request.user),
+                                                                 pk=invoice_id))
+        else:
+            lines = tariffs.lines_from_data(data.get('lines'))
+    except tariffs.TariffInputError as exc:
+        return Response({'detail': exc.detail, 'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = tariffs.render(*tariffs.evaluate(lines, data.get('country'), on_date, shipping))
+    result.update(country=(data.get('country') or '').strip().upper(), date=on_date or timezone.localdate())
+    return Response(result, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def events(request):
+    """Change feed for integrations: outbox events with id greater than `after`.
+    Query params: after=<cursor> (default 0), limit (default 500, max 5000), topic (repeatable).
+    Keep the returned `next_cursor` and pass it as `after` on the next call. The cursor
+    is only gap-free with a single writer (see shop/outbox.py), and events are kept
+    for OUTBOX_RETENTION_DAYS.
+    """
+    from .models import OutboxEvent
+    try:
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        return Response({'detail': '`after` must be an integer cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = _limit_param(request, 500, 5000)
+
+    qs = OutboxEvent.objects.filter(id__gt=after).order_by('id')
+    topics = request.query_params.getlist('topic')
+    if topics:
+        qs = qs.filter(topic__in=topics)
+    batch = [outbox.serialize(e) for e in qs[:limit]]
+    return Response({
+        'events': batch,
+        'next_cursor': batch[-1]['id'] if batch else after,
+        'has_more': len(batch) == limit,
+    }, status=status.HTTP_200_OK)
+
+
+def _stream_user(request):
+    # EventSource cannot set headers, so accept ?token= as well as the session
+    key = request.GET.get('token')
+    if key:
+        token = Token.objects.select_related('user', 'user__profile').filter(key=key).first()
+        return token.user if token and token.user.is_active else None
+    return request.user if request.user.is_authenticated else None
 
+
+async def live_dashboard(request):
+    """Server-Sent Events stream of dashboard deltas (new invoices, stock changes).
+    Starts with a `snapshot` of today's totals read from the database once subscribed,
+    then relays events from shop/live.py, which clients add to it.
+    Needs an ASGI server (uvicorn / daphne) so open streams do not hold worker threads.
+    Requires staff or profile.can_view_reports.
+    """
+    import asyncio
+    from asgiref.sync import sync_to_async
+    from django.http import StreamingHttpResponse, JsonResponse
+    from . import live
+
+    user = await sync_to_async(_stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    if not await sync_to_async(_can_view_reports)(user):
+        return JsonResponse({'detail': 'You do not have permission to view reports.'}, status=403)
+
+    heartbeat = getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 15)
+
+    async def stream():
+        broker = live.get_broker()
+        sub = broker.subscribe()
+        try:
+            # read after subscribing, so an invoice committed in between is in the
+            # snapshot or in a delta (clients skip deltas up to `last_invoice`)
+            snapshot = await sync_to_async(live.today_totals)()
+            yield live.frame('snapshot', {'today': snapshot})
+            while True:
+                try:
+                    yield await asyncio.wait_for(sub[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # comment line keeps proxies from closing an idle connection
+                    yield b': keep-alive\n\n'
+        finally:
+            broker.unsubscribe(sub)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
     return response
 
 
@@ -312,27 +1053,36 @@ def me(request):
     
 
 
-@api_view(['POST'])
-@permission_classes([permissions.AllowAny])
-def token_auth_by_email(request):
-    """Accepts POST with 'email' and 'password' and returns a token if valid."""
-    email = request.data.get('email') or request.POST.get('email')
-    password = request.data.get('password') or request.POST.get('password')
-    if not email or not password:
-        return Response({'detail': 'Email and password required.'}, status=status.HTTP_400_BAD_REQUEST)
+@csrf_exempt
+@require_POST
+async def token_auth_by_email(request):
+    """Accepts POST with 'email' and 'password' (form or JSON) and returns a token if valid.
+    The email matches case-insensitively through one indexed lookup (shop/backends.py).
+    An async view so that, under ASGI, the password hash runs in a worker thread
+    instead of on the event loop or the thread shared by sync views.
+    """
+    import json
+    from django.http import JsonResponse
+    from .backends import EmailBackend
 
-    User = get_user_model()
-    try:
-        user = User.objects.get(email=email)
-    except User.DoesNotExist:
-        return Response({'detail': 'Invalid credentials.'}, status=status.HTTP_400_BAD_REQUEST)
+    data = request.POST
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return JsonResponse({'detail': 'Invalid JSON body.'}, status=400)
+    email, password = data.get('email'), data.get('password')
+    if not email or not password:
+        return JsonResponse({'detail': 'Email and password required.'}, status=400)
 
-    user = authenticate(request, username=user.username, password=password)
+    user = await EmailBackend().aauthenticate(request, email=email, password=password)
     if user is None:
-        return Response({'detail': 'Invalid credentials.'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'detail': 'Invalid credentials.'}, status=400)
 
-    token, _ = Token.objects.get_or_create(user=user)
-    return Response({'token': token.key}, status=status.HTTP_200_OK)
+    token, _ = await Token.objects.aget_or_create(user=user)
+    return JsonResponse({'token': token.key})
 
 
 @api_view(['POST'])
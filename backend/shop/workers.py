@@ -0,0 +1,19 @@
+"""Process-pool entry points for the `run_report_jobs` command.
+
+Spawned workers import this module before Django is set up, so it must not
+import models (or anything that does) at module level.
+"""
+import django
+
+
+def init():
+    django.setup()
+
+
+def run_report_job(job_id):
+    from django.db import close_old_connections
+    from . import jobs
+    try:
+        return jobs.run(job_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,113 @@
+"""Group commit for invoice creation (`settings.INVOICE_WRITE_QUEUE`).
+
+SQLite lets one transaction write at a time, so concurrent invoice
+creations queue on the database lock (or fail with "database is locked"),
+and every one of them pays for its own commit and fsync. With the queue
+on, request threads hand the work to a single writer thread instead and
+wait for the result. The writer takes whatever has queued up, waiting up
+to INVOICE_WRITE_QUEUE_WINDOW_MS for more (at most
+INVOICE_WRITE_QUEUE_MAX_BATCH jobs), and runs the batch in one
+transaction with a savepoint per job. A job that raises rolls back only
+its own savepoint and its caller gets the exception; the others commit
+together and get their results once the commit has succeeded. If the
+commit itself fails, every caller in the batch gets that error.
+
+on_commit callbacks registered by a job (outbox -> live dashboard, sketch
+folds) run on the writer thread after the shared commit. Callers that are
+already inside a transaction (e.g. Idempotency-Key requests, whose stored
+response must commit with the invoice) run the work directly as before.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+def enabled():
+    return getattr(settings, 'INVOICE_WRITE_QUEUE', False)
+
+
+class GroupCommitWriter:
+    """One daemon thread committing queued jobs in batches; submit() is thread-safe."""
+
+    def __init__(self, window=0.002, max_batch=64):
+        self.window = window
+        self.max_batch = max_batch
+        self.pid = os.getpid()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='invoice-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the writer's next transaction; returns its result once committed."""
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future.result()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            self.commit(self._next_batch())
+
+    def commit(self, batch):
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, fn, args, kwargs in batch:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # nothing was committed: the jobs that had succeeded fail with the commit error
+            connection.close()
+            for future, _, error in outcomes:
+                future.set_exception(error or e)
+            for future, *_ in batch[len(outcomes):]:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """The process's writer, started on first use (and again in a forked child)."""
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                _writer = GroupCommitWriter(
+                    window=getattr(settings, 'INVOICE_WRITE_QUEUE_WINDOW_MS', 2) / 1000,
+                    max_batch=getattr(settings, 'INVOICE_WRITE_QUEUE_MAX_BATCH', 64),
+                )
+    return _writer
+
+
+def run(fn, *args, **kwargs):
+    """fn(*args, **kwargs) through the writer when the queue is enabled and the caller
+    is not inside a transaction; directly otherwise.
+    """
+    if enabled() and not connection.in_atomic_block:
+        return get_writer().submit(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
@@ -1,47 +1,371 @@
+"""Load generator for a local dev server (asyncio, standard library only).
+
+Replays a weighted mix of requests at a target rate (open loop) or with a fixed
+number of concurrent clients (closed loop), then prints throughput, latency
+percentiles and error rates per endpoint as JSON.
+
+    python test_create_invoice.py --mix products=50,invoice=30,report=15,csv=5 \\
+        --concurrency 20 --duration 30 --username admin --password secret
+    python test_create_invoice.py --rate 80 --duration 60 --lines 1-20 --output run.json
+    python test_create_invoice.py --once     # the original smoke test: one invoice
+
+Endpoints in a mix:
+    products  GET  /api/products/?for_invoice=1
+    invoice   POST /api/invoices/ with --lines line items on random products
+    invoices  GET  /api/reports/invoices/
+    report    GET  /api/reports/sales/ over a random --report-days window
+    csv       GET  /api/reports/sales/csv/ over a random --report-days window
+
+In --rate mode latency is measured from when a request was due, not when a
+connection became free, so a saturated server shows up as growing latency
+instead of being hidden by the client slowing down. Increase --rate until
+p99 or the error rate breaks away to find the saturation point.
+"""
+import argparse
+import asyncio
 import json
-import urllib.request
-import urllib.error
+import random
+import ssl
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
 
 BASE = 'http://127.0.0.1:8000'
+DEFAULT_MIX = 'products=50,invoice=30,report=10,invoices=5,csv=5'
 
-def get_products():
-    url = BASE + '/api/products/'
-    req = urllib.request.Request(url)
-    with urllib.request.urlopen(req, timeout=10) as resp:
-        data = resp.read()
-        return json.loads(data)
-
-def post_invoice(product_id):
-    url = BASE + '/api/invoices/'
-    payload = {"create_items": [{"product": product_id, "quantity": 1, "price": "1.00"}]}
-    body = json.dumps(payload).encode('utf-8')
-    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'}, method='POST')
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = resp.read()
-            print('POST status:', resp.getcode())
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, base, timeout):
+        parts = urlsplit(base)
+        self.host = parts.hostname
+        self.tls = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.tls else 80)
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
             try:
-                print('POST response JSON:', json.loads(data))
-            except Exception:
-                print('POST response text:', data.decode('utf-8'))
-    except urllib.error.HTTPError as e:
-        print('POST failed status:', e.code)
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Returns (status, body bytes)."""
+        reused = self.writer is not None
         try:
-            print('Error body:', e.read().decode('utf-8'))
-        except Exception:
-            pass
-    except Exception as e:
-        print('POST exception:', str(e))
+            return await asyncio.wait_for(self._roundtrip(method, path, headers or {}, body), self.timeout)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+        except BaseException:
+            await self.close()
+            raise
+        # the server dropped an idle keep-alive connection; retry once on a fresh one
+        return await asyncio.wait_for(self._roundtrip(method, path, headers or {}, body), self.timeout)
 
-if __name__ == '__main__':
-    try:
-        prods = get_products()
-        print('Got products count:', len(prods))
-        if not prods:
-            print('No products available to test')
+    async def _roundtrip(self, method, path, headers, body):
+        if self.writer is None:
+            context = ssl.create_default_context() if self.tls else None
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=context)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive',
+                 f'Content-Length: {len(body)}']
+        lines += [f'{k}: {v}' for k, v in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed before the response')
+        version, status = status_line.split(b' ', 2)[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            data = b''.join(chunks)
         else:
-            pid = prods[0]['id']
-            print('Using product id:', pid)
-            post_invoice(pid)
-    except Exception as e:
-        print('Exception during test:', str(e))
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close' or version == b'HTTP/1.0':
+            await self.close()
+        return int(status), data
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+
+    def add(self, seconds, error=None):
+        self.latencies.append(seconds)
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self, elapsed):
+        lat = sorted(self.latencies)
+        count = len(lat)
+        error_count = sum(self.errors.values())
+
+        def pct(p):
+            # nearest-rank percentile, in milliseconds
+            return round(lat[min(count - 1, max(0, int(round(p / 100 * count)) - 1))] * 1000, 2) if lat else None
+
+        return {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0,
+            'errors': error_count,
+            'error_rate': round(error_count / count, 4) if count else 0,
+            'errors_by_kind': self.errors,
+            'latency_ms': {
+                'mean': round(sum(lat) / count * 1000, 2) if lat else None,
+                'p50': pct(50), 'p95': pct(95), 'p99': pct(99),
+                'max': round(lat[-1] * 1000, 2) if lat else None,
+            },
+        }
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.base = args.base.rstrip('/')
+        self.headers = {'Accept': 'application/json'}
+        self.mix = parse_mix(args.mix)
+        self.lines = parse_range(args.lines)
+        self.product_ids = []
+        self.stats = {name: Stats() for name in self.mix}
+
+    # request builders: name -> (method, path, body)
+    def build(self, name):
+        if name == 'products':
+            return 'GET', '/api/products/?for_invoice=1', None
+        if name == 'invoice':
+            items = [{'product': random.choice(self.product_ids), 'quantity': random.randint(1, 5),
+                      'price': f'{random.uniform(1, 500):.2f}'} for _ in range(random.randint(*self.lines))]
+            body = {'customer_name': f'Load test {random.randint(1, 500)}', 'create_items': items}
+            return 'POST', '/api/invoices/', body
+        if name == 'invoices':
+            return 'GET', '/api/reports/invoices/?' + urlencode(self.report_window()), None
+        if name == 'report':
+            return 'GET', '/api/reports/sales/?' + urlencode(self.report_window()), None
+        if name == 'csv':
+            return 'GET', '/api/reports/sales/csv/?' + urlencode(self.report_window()), None
+        raise ValueError(name)
+
+    def report_window(self):
+        days = random.randint(1, self.args.report_days)
+        end = date.today() - timedelta(days=random.randint(0, 30))
+        return {'start_date': (end - timedelta(days=days)).isoformat(), 'end_date': end.isoformat()}
+
+    async def call(self, conn, name, due=None):
+        method, path, body = self.build(name)
+        headers = dict(self.headers)
+        raw = b''
+        if body is not None:
+            raw = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if self.args.idempotency:
+                headers['Idempotency-Key'] = str(uuid.uuid4())
+        start = due if due is not None else time.perf_counter()
+        error = None
+        try:
+            status, _ = await conn.request(method, path, headers, raw)
+            if status >= 400:
+                error = f'HTTP {status}'
+        except asyncio.TimeoutError:
+            error = 'timeout'
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as exc:
+            error = type(exc).__name__
+        if time.perf_counter() >= self.measure_from:
+            self.stats[name].add(time.perf_counter() - start, error)
+
+    def pick(self):
+        return random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+
+    async def setup(self):
+        conn = Connection(self.base, self.args.timeout)
+        try:
+            if self.args.token:
+                self.headers['Authorization'] = f'Token {self.args.token}'
+            elif self.args.username:
+                body = json.dumps({'username': self.args.username, 'password': self.args.password}).encode()
+                status, data = await conn.request('POST', '/api-token-auth/', {'Content-Type': 'application/json'}, body)
+                if status != 200:
+                    raise SystemExit(f'Login failed: HTTP {status} {data[:200]!r}')
+                self.headers['Authorization'] = f'Token {json.loads(data)["token"]}'
+            status, data = await conn.request('GET', '/api/products/?for_invoice=1&fields=id', self.headers)
+            if status != 200:
+                raise SystemExit(f'Could not list products: HTTP {status}')
+            self.product_ids = [p['id'] for p in json.loads(data)]
+            if 'invoice' in self.mix and not self.product_ids:
+                raise SystemExit('No products available for invoices; add some first (add_products.py).')
+        finally:
+            await conn.close()
+
+    async def closed_loop(self, deadline):
+        async def client():
+            conn = Connection(self.base, self.args.timeout)
+            try:
+                while time.perf_counter() < deadline:
+                    await self.call(conn, self.pick())
+            finally:
+                await conn.close()
+
+        await asyncio.gather(*(client() for _ in range(self.args.concurrency)))
+
+    async def open_loop(self, deadline):
+        # connections are pooled; requests wait for a free one when all are busy
+        pool = asyncio.Queue()
+        for _ in range(self.args.concurrency):
+            pool.put_nowait(Connection(self.base, self.args.timeout))
+
+        async def fire(name, due):
+            conn = await pool.get()
+            try:
+                await self.call(conn, name, due)
+            finally:
+                pool.put_nowait(conn)
+
+        tasks = set()
+        interval = 1.0 / self.args.rate
+        due = time.perf_counter()
+        while due < deadline:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            task = asyncio.create_task(fire(self.pick(), due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            due += random.expovariate(1.0 / interval) if self.args.poisson else interval
+        await asyncio.gather(*tasks)
+        while not pool.empty():
+            await pool.get_nowait().close()
+
+    async def run(self):
+        await self.setup()
+        start = time.perf_counter()
+        self.measure_from = start + self.args.warmup
+        deadline = self.measure_from + self.args.duration
+        if self.args.rate:
+            await self.open_loop(deadline)
+        else:
+            await self.closed_loop(deadline)
+        elapsed = max(time.perf_counter() - self.measure_from, 1e-9)
+
+        total = Stats()
+        for s in self.stats.values():
+            total.latencies += s.latencies
+            for k, v in s.errors.items():
+                total.errors[k] = total.errors.get(k, 0) + v
+        return {
+            'base': self.base,
+            'mode': 'rate' if self.args.rate else 'concurrency',
+            'target_rate': self.args.rate,
+            'concurrency': self.args.concurrency,
+            'duration_s': round(elapsed, 2),
+            'mix': self.mix,
+            'invoice_lines': list(self.lines),
+            'overall': total.summary(elapsed),
+            'endpoints': {name: s.summary(elapsed) for name, s in self.stats.items() if s.latencies},
+        }
+
+
+def parse_mix(value):
+    """'products=50,invoice=30' -> {'products': 50.0, 'invoice': 30.0}"""
+    known = {'products', 'invoice', 'invoices', 'report', 'csv'}
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in known:
+            raise argparse.ArgumentTypeError(f'unknown endpoint {name!r}; use {", ".join(sorted(known))}')
+        mix[name] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+
+def parse_range(value):
+    """'3' -> (3, 3), '1-20' -> (1, 20)"""
+    lo, _, hi = value.partition('-')
+    return int(lo), int(hi or lo)
+
+
+def smoke_test(args):
+    """The original check: list products and create one invoice."""
+    args.mix, args.lines = 'invoice=1', '1'
+    test = LoadTest(args)
+
+    async def once():
+        await test.setup()
+        conn = Connection(test.base, args.timeout)
+        try:
+            method, path, body = test.build('invoice')
+            status, data = await conn.request(method, path, dict(test.headers, **{'Content-Type': 'application/json'}),
+                                              json.dumps(body).encode())
+        finally:
+            await conn.close()
+        print('POST status:', status)
+        print(data.decode('utf-8', 'replace'))
+
+    asyncio.run(once())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base', default=BASE)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'endpoint=weight,... (default {DEFAULT_MIX})')
+    parser.add_argument('--rate', type=float, default=0, help='target requests/second (open loop)')
+    parser.add_argument('--poisson', action='store_true', help='exponential inter-arrival times in --rate mode')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='concurrent clients, or the connection pool size in --rate mode')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds run before measuring')
+    parser.add_argument('--lines', default='1-10', help='line items per invoice, N or MIN-MAX')
+    parser.add_argument('--report-days', type=int, default=365, help='widest report window in days')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--idempotency', action='store_true', help='send an Idempotency-Key with each invoice')
+    parser.add_argument('--token', help='DRF token for the Authorization header')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    parser.add_argument('--once', action='store_true', help='create a single invoice and print the response')
+    args = parser.parse_args(argv)
+
+    if args.once:
+        smoke_test(args)
+        return
+    try:
+        parse_mix(args.mix)
+        parse_range(args.lines)
+    except (argparse.ArgumentTypeError, ValueError) as exc:
+        parser.error(str(exc))
+
+    result = asyncio.run(LoadTest(args).run())
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
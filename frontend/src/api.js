@@ -81,6 +81,36 @@ export async function fetchMe() {
   return apiFetch('/api/me/');
 }
 
+// Everything a dashboard shows on load, in one request (counts, totals, top products,
+// low stock, recent invoices and the caller's profile); cached briefly by the server
+export async function fetchDashboard() {
+  return apiFetch('/api/dashboard/');
+}
+
+// A /api/dashboard/ response in the shape of the /api/reports/sales/ responses for the
+// last 30 days and the 30 days before, the dashboards' default date range
+export function dashboardReports(data) {
+  const report = {
+    total_sales: data.last_30_days.total_sales,
+    invoice_count: data.last_30_days.invoice_count,
+    top_products: data.top_products,
+    sales_by_user: data.sales_by_user,
+    monthly_sales_last_12: data.monthly_sales_last_12,
+    daily_sales_last_30: data.daily_sales_last_30,
+  };
+  const previousReport = {
+    total_sales: data.previous_30_days.total_sales,
+    invoice_count: data.previous_30_days.invoice_count,
+  };
+  return { report, previousReport };
+}
+
+// First and last day (YYYY-MM-DD) of the dashboards' default range: the last 30 days
+export function defaultDashboardRange() {
+  const d = new Date(); d.setDate(d.getDate() - 29);
+  return [d.toISOString().slice(0, 10), new Date().toISOString().slice(0, 10)];
+}
+
 export async function register(username, email, password) {
   const res = await fetch(API_BASE + '/api/register/', {
     method: 'POST',
@@ -97,6 +127,6 @@ export async function register(username, email, password) {
   return { ok: true, data };
 }
 
-export default { apiFetch, obtainToken, fetchMe, setToken, getToken, register };
+export default { apiFetch, obtainToken, fetchMe, fetchDashboard, dashboardReports, defaultDashboardRange, setToken, getToken, register };
 
 
@@ -39,14 +39,14 @@ const AdminDashboard = () => {
   }, [startDate, endDate]);
 
   const calcDelta = (current = 0, previous = 0) => {
-    if (!previous || previous === 0) return null;
+    if (!Number(previous)) return null;
     const v = ((current - previous) / previous) * 100;
     return Math.round(v * 10) / 10;
   };
 
   const monthlyData = (report?.monthly_sales_last_12 || []).map(m => ({
     month: new Date(m.year, m.month - 1).toLocaleString(undefined, { month: "short" }),
-    revenue: m.sales
+    revenue: Number(m.sales)
   }));
 
   const COLORS = ["#6366f1", "#06b6d4", "#10b981", "#f59e0b", "#ec4899"];
@@ -77,7 +77,7 @@ const AdminDashboard = () => {
                 <div className="kpi-top">
                   <div>
                     <div className="kpi-label">Total Sales</div>
-                    <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                    <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                   </div>
                   <div className="kpi-icon">📊</div>
                 </div>
@@ -139,7 +139,7 @@ const AdminDashboard = () => {
                 <h3>Top Products</h3>
                 <ResponsiveContainer width="100%" height={300}>
                   <PieChart>
-                    <Pie data={(report?.top_products || []).map(p => ({ product_name: p.product_name, total_sales: p.total_sales }))} dataKey="total_sales" nameKey="product_name" cx="50%" cy="50%" outerRadius={90} label>
+                    <Pie data={(report?.top_products || []).map(p => ({ product_name: p.product_name, total_sales: Number(p.total_sales) }))} dataKey="total_sales" nameKey="product_name" cx="50%" cy="50%" outerRadius={90} label>
                       {(report?.top_products || []).map((_, index) => (
                         <Cell key={`cell-${index}`} fill={COLORS[index % COLORS.length]} />
                       ))}
@@ -11,15 +11,25 @@ const AdminDashboard = () => {
   const [report, setReport] = useState(null);
   const [previousReport, setPreviousReport] = useState(null);
   const [loading, setLoading] = useState(true);
-  const [startDate, setStartDate] = useState(() => {
-    const d = new Date(); d.setDate(d.getDate() - 29); return d.toISOString().slice(0, 10);
-  });
-  const [endDate, setEndDate] = useState(() => new Date().toISOString().slice(0, 10));
+  const [startDate, setStartDate] = useState(() => api.defaultDashboardRange()[0]);
+  const [endDate, setEndDate] = useState(() => api.defaultDashboardRange()[1]);
 
   useEffect(() => {
     let mounted = true;
     const fetchAll = async () => {
       setLoading(true);
+      const [defaultStart, defaultEnd] = api.defaultDashboardRange();
+      if (startDate === defaultStart && endDate === defaultEnd) {
+        // default range: one request to the dashboard endpoint
+        const res = await api.fetchDashboard();
+        if (mounted && res.ok) {
+          const { report, previousReport } = api.dashboardReports(res.data);
+          setReport(report);
+          setPreviousReport(previousReport);
+        }
+        if (mounted) setLoading(false);
+        return;
+      }
       const params = `?start_date=${startDate}&end_date=${endDate}`;
       const res = await api.apiFetch(`/api/reports/sales/${params}`);
       if (mounted && res.ok) setReport(res.data);
@@ -39,14 +49,14 @@ const AdminDashboard = () => {
   }, [startDate, endDate]);
 
   const calcDelta = (current = 0, previous = 0) => {
-    if (!previous || previous === 0) return null;
+    if (!Number(previous)) return null;
     const v = ((current - previous) / previous) * 100;
     return Math.round(v * 10) / 10;
   };
 
   const monthlyData = (report?.monthly_sales_last_12 || []).map(m => ({
     month: new Date(m.year, m.month - 1).toLocaleString(undefined, { month: "short" }),
-    revenue: m.sales
+    revenue: Number(m.sales)
   }));
 
   const COLORS = ["#6366f1", "#06b6d4", "#10b981", "#f59e0b", "#ec4899"];
@@ -77,7 +87,7 @@ const AdminDashboard = () => {
                 <div className="kpi-top">
                   <div>
                     <div className="kpi-label">Total Sales</div>
-                    <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                    <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                   </div>
                   <div className="kpi-icon">📊</div>
                 </div>
@@ -139,7 +149,7 @@ const AdminDashboard = () => {
                 <h3>Top Products</h3>
                 <ResponsiveContainer width="100%" height={300}>
                   <PieChart>
-                    <Pie data={(report?.top_products || []).map(p => ({ product_name: p.product_name, total_sales: p.total_sales }))} dataKey="total_sales" nameKey="product_name" cx="50%" cy="50%" outerRadius={90} label>
+                    <Pie data={(report?.top_products || []).map(p => ({ product_name: p.product_name, total_sales: Number(p.total_sales) }))} dataKey="total_sales" nameKey="product_name" cx="50%" cy="50%" outerRadius={90} label>
                       {(report?.top_products || []).map((_, index) => (
                         <Cell key={`cell-${index}`} fill={COLORS[index % COLORS.length]} />
                       ))}
@@ -91,8 +91,8 @@ const Dashboard = () => {
 
   // Admin analytics (original dashboard view)
   // derive chart data from report when available
-  const dailySeven = (report && report.daily_sales_last_30) ? report.daily_sales_last_30.slice(-7).map(d => ({ day: new Date(d.date).toLocaleDateString(undefined, { weekday: 'short' }), sales: d.sales })) : [];
-  const monthly12 = (report && report.monthly_sales_last_12) ? report.monthly_sales_last_12.map(m => ({ name: new Date(m.year, m.month - 1, 1).toLocaleString(undefined, { month: 'short', year: 'numeric' }), revenue: m.sales })) : [];
+  const dailySeven = (report && report.daily_sales_last_30) ? report.daily_sales_last_30.slice(-7).map(d => ({ day: new Date(d.date).toLocaleDateString(undefined, { weekday: 'short' }), sales: Number(d.sales) })) : [];
+  const monthly12 = (report && report.monthly_sales_last_12) ? report.monthly_sales_last_12.map(m => ({ name: new Date(m.year, m.month - 1, 1).toLocaleString(undefined, { month: 'short', year: 'numeric' }), revenue: Number(m.sales) })) : [];
 
   const totalSalesDisplay = report ? Number(report.total_sales).toLocaleString() : '—';
 
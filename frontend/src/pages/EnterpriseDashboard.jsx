@@ -11,16 +11,27 @@ const EnterpriseDashboard = () => {
   const [previousReport, setPreviousReport] = useState(null);
   const [loading, setLoading] = useState(true);
   const [menuOpen, setMenuOpen] = useState(false);
-  const [startDate, setStartDate] = useState(() => {
-    const d = new Date(); d.setDate(d.getDate() - 29); return d.toISOString().slice(0,10);
-  });
-  const [endDate, setEndDate] = useState(() => new Date().toISOString().slice(0,10));
+  const [startDate, setStartDate] = useState(() => api.defaultDashboardRange()[0]);
+  const [endDate, setEndDate] = useState(() => api.defaultDashboardRange()[1]);
   const [invoices, setInvoices] = useState([]);
 
   useEffect(() => {
     let mounted = true;
     const fetchAll = async () => {
       setLoading(true);
+      const [defaultStart, defaultEnd] = api.defaultDashboardRange();
+      if (startDate === defaultStart && endDate === defaultEnd) {
+        // default range: one request to the dashboard endpoint
+        const res = await api.fetchDashboard();
+        if (mounted && res.ok) {
+          const { report, previousReport } = api.dashboardReports(res.data);
+          setReport(report);
+          setPreviousReport(previousReport);
+          setInvoices(res.data.recent_invoices);
+        }
+        if (mounted) setLoading(false);
+        return;
+      }
       // main report for selected window
       const params = `?start_date=${startDate}&end_date=${endDate}`;
       const res = await api.apiFetch(`/api/reports/sales/${params}`);
@@ -66,18 +77,18 @@ const EnterpriseDashboard = () => {
 
   const dailyData = (report?.daily_sales_last_30 || []).slice(-7).map(d => ({
     date: new Date(d.date).toLocaleDateString(undefined, { weekday: "short" }),
-    sales: d.sales
+    sales: Number(d.sales)
   }));
 
   const monthlyData = (report?.monthly_sales_last_12 || []).map(m => ({
     month: new Date(m.year, m.month - 1).toLocaleString(undefined, { month: "short" }),
-    revenue: m.sales
+    revenue: Number(m.sales)
   }));
 
   const COLORS = ["#6366f1", "#06b6d4", "#10b981", "#f59e0b"];
 
   const calcDelta = (current = 0, previous = 0) => {
-    if (!previous || previous === 0) return null;
+    if (!Number(previous)) return null;
     const v = ((current - previous) / previous) * 100;
     return Math.round(v * 10) / 10; // one decimal
   };
@@ -171,7 +182,7 @@ const EnterpriseDashboard = () => {
                   <span className="kpi-icon">📥</span>
                   <span className="kpi-title">Total Imports</span>
                 </div>
-                <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                 <div className="kpi-change positive">↑ 12% from last month</div>
               </div>
 
@@ -180,7 +191,7 @@ const EnterpriseDashboard = () => {
                   <span className="kpi-icon">📤</span>
                   <span className="kpi-title">Total Exports</span>
                 </div>
-                <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                 <div className="kpi-change positive">↑ 8% from last month</div>
               </div>
 
@@ -189,7 +200,7 @@ const EnterpriseDashboard = () => {
                   <span className="kpi-icon">💰</span>
                   <span className="kpi-title">Monthly Revenue</span>
                 </div>
-                <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                 <div className="kpi-change positive">↑ 5% from last month</div>
               </div>
 
@@ -198,7 +209,7 @@ const EnterpriseDashboard = () => {
                   <span className="kpi-icon">⏳</span>
                   <span className="kpi-title">Pending Payments</span>
                 </div>
-                <div className="kpi-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                <div className="kpi-value">₹{Number(report?.total_sales || 0).toLocaleString()}</div>
                 <div className="kpi-change warning">↑ 3 invoices pending</div>
               </div>
             </section>
@@ -291,7 +302,7 @@ const EnterpriseDashboard = () => {
                         <td>{inv.invoice_no}</td>
                         <td>{new Date(inv.date).toLocaleDateString()}</td>
                         <td>{inv.created_by}</td>
-                        <td>₹{inv.total.toLocaleString()}</td>
+                        <td>₹{Number(inv.total).toLocaleString()}</td>
                         <td>{inv.item_count}</td>
                       </tr>
                     ))}
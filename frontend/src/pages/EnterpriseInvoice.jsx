@@ -23,7 +23,7 @@ const EnterpriseInvoice = () => {
   const fetchInvoices = async () => {
     setLoading(true);
     try {
-      const res = await api.apiFetch('/api/invoices/');
+      const res = await api.apiFetch('/api/invoices/?expand=product');
       if (res.ok) {
         setInvoices(res.data);
       }
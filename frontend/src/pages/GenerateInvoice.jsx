@@ -34,7 +34,7 @@ const GenerateInvoice = () => {
   const fetchInvoices = async () => {
     setLoadingInvoices(true);
     try {
-      const res = await api.apiFetch('/api/invoices/');
+      const res = await api.apiFetch('/api/invoices/?expand=product');
       if (res.ok) setInvoices(res.data || []);
       else if (res.status === 401 || res.status === 403) setMessage({ type: 'error', text: 'Login required to view saved invoices.' });
     } catch (e) {
@@ -83,7 +83,7 @@ const GenerateInvoice = () => {
     const payload = { create_items: items };
 
     try {
-      const res = await api.apiFetch('/api/invoices/', { method: 'POST', body: JSON.stringify(payload) });
+      const res = await api.apiFetch('/api/invoices/?expand=product', { method: 'POST', body: JSON.stringify(payload) });
       if (res.ok) {
         // set the returned invoice into preview so the user can view it immediately
         try {
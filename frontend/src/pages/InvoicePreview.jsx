@@ -15,7 +15,7 @@ const InvoicePreview = () => {
     const doFetch = async () => {
       setLoading(true);
       try {
-        const res = await api.apiFetch(`/api/invoices/${id}/`);
+        const res = await api.apiFetch(`/api/invoices/${id}/?expand=product`);
         if (!mounted) return;
         if (res.ok) setInvoice(res.data);
         else setMessage({ type: 'error', text: `Failed to load invoice (${res.status})` });
@@ -158,7 +158,7 @@ const Reports = () => {
               <div className="card-icon revenue">₹</div>
               <div className="card-content">
                 <p>Total Revenue</p>
-                <h3>{(report.total_sales || 0).toLocaleString()}</h3>
+                <h3>{Number(report.total_sales || 0).toLocaleString()}</h3>
                 <span className="change positive"><TrendingUp className="w-3 h-3" /> +12%</span>
               </div>
             </div>
@@ -275,7 +275,7 @@ const Reports = () => {
                   <tr key={p.product_id}>
                     <td>{p.product_name}</td>
                     <td>{p.total_quantity}</td>
-                    <td>₹{(p.total_sales || 0).toLocaleString()}</td>
+                    <td>₹{Number(p.total_sales || 0).toLocaleString()}</td>
                   </tr>
                 ))}
               </tbody>
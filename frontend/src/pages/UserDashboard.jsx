@@ -13,16 +13,21 @@ const UserDashboard = () => {
         let mounted = true;
         (async () => {
             setLoading(true);
-            const r = await api.apiFetch('/api/reports/sales/');
-            if (mounted && r.ok) setReport(r.data);
-            const inv = await api.apiFetch('/api/reports/invoices/');
-            if (mounted && inv.ok) setInvoices(inv.data.invoices || []);
+            const res = await api.fetchDashboard();
+            if (mounted && res.ok) {
+                setReport(res.data);
+                setInvoices(res.data.recent_invoices || []);
+            }
             setLoading(false);
         })();
         return () => { mounted = false; };
     }, []);
 
     const lastInvoice = invoices && invoices.length ? invoices[0] : null;
+    const last30 = report?.last_30_days;
+    const pendingCount = Object.entries(report?.counts?.invoices_by_status || {})
+        .filter(([status]) => status.toLowerCase() === 'pending')
+        .reduce((sum, [, n]) => sum + n, 0);
 
     return (
         <UserLayout>
@@ -50,7 +55,7 @@ const UserDashboard = () => {
                                 </div>
                                 <div className="stat-content">
                                     <div className="stat-label">Total Sales (30d)</div>
-                                    <div className="stat-value">₹{(report?.total_sales || 0).toLocaleString()}</div>
+                                    <div className="stat-value">₹{Number(last30?.total_sales || 0).toLocaleString()}</div>
                                 </div>
                             </div>
 
@@ -60,7 +65,7 @@ const UserDashboard = () => {
                                 </div>
                                 <div className="stat-content">
                                     <div className="stat-label">Invoices</div>
-                                    <div className="stat-value">{report?.invoice_count || 0}</div>
+                                    <div className="stat-value">{last30?.invoice_count || 0}</div>
                                 </div>
                             </div>
 
@@ -70,7 +75,7 @@ const UserDashboard = () => {
                                 </div>
                                 <div className="stat-content">
                                     <div className="stat-label">Avg Invoice</div>
-                                    <div className="stat-value">₹{report?.invoice_count ? Math.round(report.total_sales / report.invoice_count).toLocaleString() : '0'}</div>
+                                    <div className="stat-value">₹{last30?.invoice_count ? Math.round(last30.total_sales / last30.invoice_count).toLocaleString() : '0'}</div>
                                 </div>
                             </div>
 
@@ -80,7 +85,7 @@ const UserDashboard = () => {
                                 </div>
                                 <div className="stat-content">
                                     <div className="stat-label">Pending</div>
-                                    <div className="stat-value">{invoices.filter(i => i.status === 'pending').length || 0}</div>
+                                    <div className="stat-value">{pendingCount}</div>
                                 </div>
                             </div>
                         </div>
@@ -108,7 +113,7 @@ const UserDashboard = () => {
                                                 <div className="invoice-no">{inv.invoice_no}</div>
                                                 <div className="invoice-date">{new Date(inv.date).toLocaleDateString()}</div>
                                             </div>
-                                            <div className="invoice-amount">₹{inv.total.toLocaleString()}</div>
+                                            <div className="invoice-amount">₹{Number(inv.total).toLocaleString()}</div>
                                             <button className="invoice-action" onClick={() => window.location.href = `/invoices/${inv.id}/preview`}>
                                                 <Eye className="w-4 h-4" />
                                             </button>